@@ -1,12 +1,26 @@
-from flask import Flask, jsonify, send_file, request
+from flask import Flask, jsonify, send_file, request, Response, g
 from flask_cors import CORS
-from models.database import cart_collection, log_collection
-from collections import Counter
+from models.pipeline import get_engine, StillRunning, PIPELINE_TIMEOUT
+from models.catalog import get_catalog
+from models.cart import show_cart, invalidate_cart, cart_store_stats, checkout as checkout_cart
+from models import analytics
+from models.log_store import query_logs, LOG_PAGE_SIZE
+from models.events import event_bus
+from models.database import ping as ping_database
+from models.streaming import StreamManager
+from models.cache import LRUCache
+from models.audio import wav_header
+from models.metrics import registry, span, trace, add_timings, observe, observe_each, server_timing
+from models.scheduler import JobScheduler, QueueFull, QUEUED, DONE, SHED
+import datetime
+from concurrent.futures import Future, TimeoutError as PipelineTimeout
+import hashlib
+import time
+import io
 import os
 import uuid
-import subprocess
 import logging
-import json
+import re
 
 app = Flask(__name__)
 CORS(app, resources={r"/api/*": {"origins": "*"}}, supports_credentials=True)
@@ -18,78 +32,433 @@ logger = logging.getLogger(__name__)
 # Ensure the audio_files directory exists
 os.makedirs("audio_files", exist_ok=True)
 
+SESSION_COOKIE = "session_id"
+RESPONSE_AUDIO_SESSIONS = int(os.getenv("RESPONSE_AUDIO_SESSIONS", "1000"))
+RESPONSE_AUDIO_TTL = float(os.getenv("RESPONSE_AUDIO_TTL", "600"))
+_SESSION_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+request_seconds = registry.histogram("http_request_seconds", "Time to produce each API response", ("endpoint",))
+requests_total = registry.counter("http_requests_total", "API responses by endpoint and status", ("endpoint", "status"))
+dedupe_total = registry.counter("dedupe_lookups_total", "Uploads by dedupe cache outcome", ("outcome",))
+
+@app.before_request
+def start_trace():
+    # Spans in this request (and timings from its pipeline job) end up in
+    # the Server-Timing header and the /api/metrics histograms
+    g.request_start = time.perf_counter()
+    g.trace = trace()
+    g.timings = g.trace.__enter__()
+
+@app.after_request
+def finish_trace(response):
+    timings = getattr(g, "timings", None)
+    if timings is None:
+        return response
+    # Stages of a scheduled job: already observed on the scheduler thread
+    job_timings = getattr(g, "job_timings", None) or {}
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    elapsed = time.perf_counter() - g.request_start
+    requests_total.inc(endpoint, str(response.status_code))
+    if endpoint != "/api/events":
+        request_seconds.observe(elapsed, endpoint)
+    if timings:
+        observe(timings)
+    if timings or job_timings:
+        response.headers["Server-Timing"] = server_timing({**job_timings, **timings, "total": elapsed})
+    return response
+
+@app.teardown_request
+def end_trace(exc):
+    if getattr(g, "trace", None) is not None:
+        g.trace.__exit__(None, None, None)
+        g.trace = None
+
+@app.before_request
+def load_session():
+    # Each shopper gets their own cart: the session id comes from the query
+    # string, an X-Session-Id header, a form field or the session cookie.
+    session_id = (
+        request.args.get("session_id")
+        or request.headers.get("X-Session-Id")
+        or request.form.get("session_id")
+        or request.cookies.get(SESSION_COOKIE)
+    )
+    g.new_session = not (session_id and _SESSION_ID_RE.match(session_id))
+    g.session_id = uuid.uuid4().hex if g.new_session else session_id
+
+@app.after_request
+def save_session(response):
+    if getattr(g, "new_session", False):
+        response.set_cookie(SESSION_COOKIE, g.session_id, max_age=30 * 24 * 3600, samesite="Lax")
+    return response
+
+def _cart_payload(session_id):
+    items = show_cart(session_id)
+    subtotal = sum(item.get("total_price", 0) for item in items)
+    return {
+        "session_id": session_id,
+        "cart": items,
+        "subtotal": round(subtotal, 2),
+        "total": round(subtotal, 2)
+    }
+
+def _engine_call(method, *args, **kwargs):
+    # Runs a pipeline job; the worker's stage timings join this request's
+    start = time.perf_counter()
+    return _worker_result(method(*args, **kwargs), start)
+
+def _worker_result(result, start):
+    # Adds the worker's stage timings to the current trace, plus "dispatch":
+    # time since start in the process pool's queue and crossing the process
+    # boundary. Timings measured in the worker outside any job (e.g.
+    # deferred sentiment) are exported, but not part of the trace.
+    observe_each(result.pop("untraced_timings", None) if result else None)
+    _keep_log_writer_stats(result)
+    timings = result.pop("timings", {}) if result else {}
+    timings["dispatch"] = max(0.0, time.perf_counter() - start - timings.get("worker", 0.0))
+    add_timings(timings)
+    return result
+
+# Interaction logs are written by the pipeline workers; each job brings back
+# its worker's latest writer stats, exported on /api/metrics summed by worker
+_log_writer_stats = {}
+
+def _keep_log_writer_stats(result):
+    stats = result.pop("log_writer", None) if result else None
+    if stats:
+        _log_writer_stats[stats["pid"]] = stats
+
+def _log_writer_total(name):
+    return sum(stats.get(name, 0) for stats in list(_log_writer_stats.values()))
+
+def _recent_logs(limit=LOG_PAGE_SIZE):
+    return query_logs(limit)["logs"]
+
+# Latest spoken reply per session, served by /api/response-audio; replies
+# the client asked to stream wait in _pending_speech until fetched
+_response_audio = LRUCache(maxsize=RESPONSE_AUDIO_SESSIONS, ttl=RESPONSE_AUDIO_TTL)
+_pending_speech = LRUCache(maxsize=RESPONSE_AUDIO_SESSIONS, ttl=RESPONSE_AUDIO_TTL)
+
+def _wants_streamed_audio():
+    return (request.args.get("stream_audio") or request.form.get("stream_audio")) == "1"
+
+def _store_response_audio(session_id, audio):
+    _pending_speech.pop(session_id)
+    _response_audio.set(session_id, (audio, hashlib.sha256(audio).hexdigest()[:16]))
+
+def _keep_response_audio(session_id, result):
+    # Returns the URL the client fetches the spoken reply from
+    audio = result.pop("audio", None)
+    if audio:
+        _store_response_audio(session_id, audio)
+        return "/api/response-audio"
+    _response_audio.pop(session_id)
+    _pending_speech.set(session_id, result["response"])
+    return "/api/response-audio/stream"
+
+def _publish_cart(session_id):
+    try:
+        event_bus.publish("cart", _cart_payload(session_id), session_id=session_id)
+    except Exception as e:
+        logger.error(f"Cart event failed: {str(e)}")
+
+def _publish_interaction(result):
+    # New log entry and the updated sentiment counters, for every dashboard
+    try:
+        if result.get("logged"):
+            event_bus.publish("log", {
+                "user_input": result["transcript"],
+                "response": result["response"],
+                "sentiment": result["sentiment"]
+            })
+            event_bus.publish("sentiment", analytics.sentiment_totals())
+    except Exception as e:
+        logger.error(f"Interaction event failed: {str(e)}")
+
 @app.route("/")
 def home():
     return send_file("dashboard.html")
 
+def _apply_result(session_id, result):
+    # Side effects of a finished pipeline job; returns the reply's audio URL
+    audio_url = _keep_response_audio(session_id, result)
+    # The worker process changed this cart; don't serve our cached copy
+    invalidate_cart(session_id)
+    _publish_cart(session_id)
+    _publish_interaction(result)
+    return audio_url
+
+def _late_result(session_id, future):
+    # A job that outlived its request's timeout: its cart change has landed
+    # now, so the cart, dashboards and reply catch up with it
+    try:
+        result = future.result()
+    except Exception as e:
+        logger.error(f"Late pipeline job failed: {str(e)}")
+        return
+    observe_each(result.pop("untraced_timings", None))
+    _keep_log_writer_stats(result)
+    observe(result.pop("timings", {}))
+    logger.info(f"Late pipeline result for session {session_id}: {result['transcript']}")
+    _apply_result(session_id, result)
+
+def _run_upload(job):
+    # Runs on a scheduler thread: submits the pipeline job and returns a
+    # future of the response. The scheduler holds the job's slot until the
+    # worker is done, so the process pool never queues more than the
+    # scheduler admits, and a slow job can't be "finished" while its cart
+    # change is still to come.
+    audio, sample_rate, speak, idempotency_key = job.payload
+    response = Future()
+    start = time.perf_counter()
+    worker = get_engine().submit(audio, job.session_id, sample_rate, speak, idempotency_key)
+    worker.add_done_callback(lambda worker: _finish_upload(job, worker, start, response))
+    return response
+
+def _finish_upload(job, worker, start, response):
+    # Side effects of the finished job, so async submissions update carts
+    # and dashboards like blocking ones
+    session_id = job.session_id
+    try:
+        with trace() as timings:
+            result = _worker_result(worker.result(), start)
+        job.timings.update(timings)
+        observe(job.timings)
+        if result.get("dedupe"):
+            dedupe_total.inc(result["dedupe"])
+        audio_url = _apply_result(session_id, result)
+    except Exception as e:
+        response.set_exception(e)
+        return
+    response.set_result({
+        "status": "success",
+        "message": "Audio processed successfully",
+        "session_id": session_id,
+        "transcript": result["transcript"],
+        "sentiment": result["sentiment"],
+        "response": result["response"],
+        "audio_url": audio_url,
+        "deduplicated": result.get("dedupe") in ("hit", "near")
+    })
+
+# Bounded concurrency and queue for uploads (see models/scheduler.py)
+uploads = JobScheduler(_run_upload, name="upload")
+
+def _wants_async():
+    return (
+        (request.args.get("async") or request.form.get("async")) == "1"
+        or "respond-async" in request.headers.get("Prefer", "")
+    )
+
+def _busy(retry_after, status=429):
+    response = jsonify({
+        "error": "Server busy",
+        "message": "Too many recordings in progress, please try again shortly",
+        "retry_after": retry_after
+    })
+    response.status_code = status
+    response.headers["Retry-After"] = str(retry_after)
+    return response
+
+def _accepted(job, message="Audio queued for processing"):
+    status_url = f"/api/jobs/{job.id}"
+    response = jsonify({"status": job.status, "message": message, "job_id": job.id,
+                        "session_id": job.session_id, "status_url": status_url})
+    response.status_code = 202
+    response.headers["Location"] = status_url
+    return response
+
+def _job_error(job):
+    if job.status == SHED:
+        return _busy(uploads.retry_after(), 503)
+    return jsonify({
+        "error": "Processing failed",
+        "message": job.error
+    }), 500
+
 @app.route("/api/upload", methods=["POST"])
 def upload_audio():
     if 'audio' not in request.files:
         return jsonify({"error": "No file uploaded"}), 400
-    session_id = uuid.uuid4().hex
-    input_file = f"audio_files/input_{session_id}.wav"
-    f = request.files['audio']
-    try:
-        f.save(input_file)
-        logger.info(f"Saved audio to {input_file}")
-    except Exception as e:
-        logger.error(f"File save failed: {str(e)}")
-        return jsonify({"error": f"File save failed: {str(e)}"}), 500
-    try:
-        result = subprocess.run(
-            ["python", "main.py", input_file],
-            capture_output=True,
-            text=True,
-            timeout=30
-        )
-        if result.returncode != 0:
-            logger.error(f"Processing failed: {result.stderr}")
-            return jsonify({
-                "error": "Audio processing failed",
-                "details": result.stderr
-            }), 500
-        return jsonify({
-            "status": "success",
-            "message": "Audio processed successfully",
-            "session_id": session_id
-        })
-    except subprocess.TimeoutExpired:
-        logger.error("Processing timed out")
-        return jsonify({
-            "error": "Processing took too long",
-            "message": "Please try again with a shorter recording"
-        }), 500
+    # Kept in memory: the worker decodes the bytes without a temp file
+    audio = request.files['audio'].read()
+    if not audio:
+        return jsonify({"error": "Empty audio upload"}), 400
+    sample_rate = request.form.get("sample_rate", type=int)
+    # A resent recording with the same key never changes the cart twice
+    idempotency_key = request.headers.get("Idempotency-Key") or request.form.get("idempotency_key")
+    try:
+        job = uploads.submit(g.session_id, (audio, sample_rate, not _wants_streamed_audio(), idempotency_key))
+    except QueueFull as e:
+        logger.warning(f"Upload rejected: {str(e)}")
+        return _busy(e.retry_after)
+    if _wants_async():
+        return _accepted(job)
+    # Blocking mode: queueing is bounded by the shedding deadline, so this
+    # wait normally ends with the job; one still running after
+    # PIPELINE_TIMEOUT more is left to finish, polled through status_url
+    if not job.wait(uploads.deadline + PIPELINE_TIMEOUT + 5):
+        return _accepted(job, "Still processing, poll status_url for the result")
+    g.job_timings = job.timings
+    if job.status == DONE:
+        return jsonify(job.result)
+    return _job_error(job)
+
+@app.route("/api/jobs/<job_id>")
+def job_status(job_id):
+    job = uploads.get(job_id)
+    if job is None or job.session_id != g.session_id:
+        return jsonify({"error": "Unknown job"}), 404
+    info = job.to_dict()
+    if job.status == QUEUED:
+        info["position"] = uploads.position(job)
+    response = jsonify(info)
+    if job.finished_at is None:
+        response.headers["Retry-After"] = "1"
+    return response
+
+@app.route("/api/response-audio")
+def response_audio():
+    # This session's latest reply as WAV; range requests let <audio> seek
+    entry = _response_audio.get(g.session_id)
+    if entry is None:
+        return jsonify({"error": "No response audio for this session"}), 404
+    audio, etag = entry
+    response = send_file(io.BytesIO(audio), mimetype="audio/wav", etag=etag, conditional=True, max_age=0)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+@app.route("/api/response-audio/stream")
+def stream_response_audio():
+    # Chunked WAV synthesized clause by clause: the client starts playing the
+    # first clause while the rest are still being synthesized
+    session_id = g.session_id
+    text = _pending_speech.pop(session_id)
+    if text is None:
+        return response_audio()
+
+    def generate():
+        chunks = []
+        sample_rate = None
+        try:
+            for pcm, sample_rate in get_engine().stream_speech(text):
+                if not chunks:
+                    yield wav_header(sample_rate)
+                chunks.append(pcm)
+                yield pcm
+        except Exception as e:
+            # Headers are gone already; the client sees a truncated clip
+            logger.error(f"Speech streaming failed: {str(e)}")
+            return
+        if chunks:
+            pcm = b"".join(chunks)
+            _store_response_audio(session_id, wav_header(sample_rate, len(pcm)) + pcm)
+
+    return Response(generate(), mimetype="audio/wav", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
+# Streaming uploads keep their audio here; Whisper runs in the engine's stream workers
+streams = StreamManager(lambda samples, partial: get_engine().submit_transcription(samples, partial))
+
+def _finish_stream(stream):
+    # Endpoint reached: final transcript (usually the last partial) straight
+    # into sentiment/intent/cart/TTS, skipping a second full transcription.
+    # Returns None when another request (a racing /end, or a chunk that hit
+    # the endpoint) already finished this stream: its cart change must not
+    # be applied twice.
+    if streams.close(stream.id) is None:
+        return None
+    text = stream.final_transcript(timeout=PIPELINE_TIMEOUT)
+    logger.info(f"Stream {stream.id} final transcript after {stream.seconds:.2f}s of audio: {text}")
+    if not text:
+        return {"stream_id": stream.id, "endpoint": True, "transcript": "", "result": None}
+    try:
+        result = _engine_call(get_engine().process_text, text, stream.session_id, timeout=PIPELINE_TIMEOUT,
+                              speak=not _wants_streamed_audio())
+    except StillRunning as e:
+        # Too late to cancel: the cart changes when the worker finishes, and
+        # resending the utterance would apply it twice
+        e.future.add_done_callback(lambda done: _late_result(stream.session_id, done))
+        return {"stream_id": stream.id, "endpoint": True, "transcript": text, "result": None, "pending": True,
+                "message": "Still processing, your cart will update when it finishes"}
+    audio_url = _apply_result(stream.session_id, result)
+    return {"stream_id": stream.id, "endpoint": True, "transcript": text, "result": result, "audio_url": audio_url}
+
+def _finished(stream):
+    result = _finish_stream(stream)
+    if result is None:
+        return jsonify({"error": "Stream already finished", "stream_id": stream.id}), 409
+    return jsonify(result), 202 if result.get("pending") else 200
+
+@app.route("/api/stream", methods=["POST"])
+def open_stream():
+    # Body-less; ?sample_rate= gives the rate of the PCM16 mono chunks to follow
+    sample_rate = request.args.get("sample_rate", 16000, type=int)
+    if not 8000 <= sample_rate <= 96000:
+        return jsonify({"error": "Unsupported sample rate"}), 400
+    stream = streams.open(g.session_id, sample_rate)
+    return jsonify({"stream_id": stream.id, "session_id": g.session_id, "sample_rate": sample_rate})
+
+@app.route("/api/stream/<stream_id>", methods=["POST"])
+def stream_chunk(stream_id):
+    stream = streams.get(stream_id)
+    if stream is None or stream.session_id != g.session_id:
+        return jsonify({"error": "Unknown stream"}), 404
+    try:
+        if stream.feed(request.get_data()):
+            return _finished(stream)
+        if stream.partial:
+            event_bus.publish("transcript", {"stream_id": stream.id, "partial": stream.partial}, session_id=stream.session_id)
+        return jsonify({"stream_id": stream.id, "endpoint": False, "partial": stream.partial, "seconds": round(stream.seconds, 2)})
+    except PipelineTimeout:
+        logger.error("Stream processing timed out")
+        return jsonify({"error": "Processing took too long"}), 500
     except Exception as e:
-        logger.error(f"Processing error: {str(e)}")
-        return jsonify({
-            "error": "Processing failed",
-            "message": str(e)
-        }), 500
-    finally:
-        if os.path.exists(input_file):
-            os.remove(input_file)
-            logger.info(f"Removed temporary file {input_file}")
+        logger.error(f"Stream processing error: {str(e)}")
+        return jsonify({"error": "Processing failed", "message": str(e)}), 500
+
+@app.route("/api/stream/<stream_id>/end", methods=["POST"])
+def end_stream(stream_id):
+    stream = streams.get(stream_id)
+    if stream is None or stream.session_id != g.session_id:
+        return jsonify({"error": "Unknown stream"}), 404
+    try:
+        if request.content_length:
+            stream.feed(request.get_data())
+        return _finished(stream)
+    except PipelineTimeout:
+        logger.error("Stream processing timed out")
+        return jsonify({"error": "Processing took too long"}), 500
+    except Exception as e:
+        logger.error(f"Stream processing error: {str(e)}")
+        return jsonify({"error": "Processing failed", "message": str(e)}), 500
 
 @app.route("/api/cart")
 def cart():
     try:
-        from models.cart import show_cart
-        items = show_cart()
-        subtotal = sum(item.get("total_price", 0) for item in items)
-        return jsonify({
-            "cart": items,
-            "subtotal": round(subtotal, 2),
-            "total": round(subtotal, 2)
-        })
+        return jsonify(_cart_payload(g.session_id))
     except Exception as e:
         logger.error(f"Cart retrieval failed: {str(e)}")
         return jsonify({"error": "Failed to retrieve cart"}), 500
 
 @app.route("/api/logs")
 def logs():
+    # Newest first; pass the returned next_cursor as ?cursor= for the next
+    # page. Filters: ?sentiment=, ?intent=, ?since=/&until= (ISO, UTC).
     try:
-        logs = list(log_collection.find({}, {"_id": 0}).sort("_id", -1).limit(20))
-        return jsonify(logs)
+        since, until = _time_range()
+        return jsonify(query_logs(
+            limit=request.args.get("limit", LOG_PAGE_SIZE, type=int),
+            cursor=request.args.get("cursor"),
+            sentiment=request.args.get("sentiment"),
+            intent=request.args.get("intent"),
+            since=since,
+            until=until
+        ))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         logger.error(f"Log retrieval failed: {str(e)}")
         return jsonify({"error": "Failed to retrieve logs"}), 500
@@ -97,24 +466,152 @@ def logs():
 @app.route("/api/sentiment")
 def sentiment():
     try:
-        logs = list(log_collection.find({}, {"sentiment": 1}))
-        sentiments = Counter(log.get('sentiment', 'NEUTRAL') for log in logs)
-        return jsonify({
-            "positive": sentiments.get("POSITIVE", 0),
-            "negative": sentiments.get("NEGATIVE", 0),
-            "neutral": sentiments.get("NEUTRAL", 0)
-        })
+        # Maintained incrementally by the pipeline (see models/analytics.py)
+        return jsonify(analytics.sentiment_totals())
     except Exception as e:
         logger.error(f"Sentiment analysis failed: {str(e)}")
         return jsonify({"error": "Failed to analyze sentiment"}), 500
 
+def _time_range():
+    # ?since=/&until= ISO timestamps (UTC) bounding the rollup buckets or logs
+    since = request.args.get("since")
+    until = request.args.get("until")
+    return (
+        datetime.datetime.fromisoformat(since) if since else None,
+        datetime.datetime.fromisoformat(until) if until else None
+    )
+
+@app.route("/api/analytics/sentiment")
+def sentiment_series():
+    try:
+        since, until = _time_range()
+        return jsonify(analytics.sentiment_series(
+            request.args.get("granularity", "minute"), since, until,
+            limit=request.args.get("limit", 60, type=int)
+        ))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Sentiment series failed: {str(e)}")
+        return jsonify({"error": "Failed to load sentiment series"}), 500
+
+@app.route("/api/analytics/intents")
+def intent_distribution():
+    try:
+        since, until = _time_range()
+        return jsonify(analytics.intent_distribution(
+            request.args.get("granularity", "hour"), since, until,
+            limit=request.args.get("limit", 24, type=int)
+        ))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Intent distribution failed: {str(e)}")
+        return jsonify({"error": "Failed to load intent distribution"}), 500
+
+@app.route("/api/analytics/top-products")
+def top_products():
+    try:
+        since, until = _time_range()
+        return jsonify(analytics.top_products(
+            limit=request.args.get("limit", 10, type=int),
+            granularity=request.args.get("granularity"),
+            since=since,
+            until=until,
+            buckets=request.args.get("buckets", 24, type=int)
+        ))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Top products failed: {str(e)}")
+        return jsonify({"error": "Failed to load top products"}), 500
+
+@app.route("/api/analytics/routing")
+def routing():
+    try:
+        return jsonify(analytics.routing_totals())
+    except Exception as e:
+        logger.error(f"Routing totals failed: {str(e)}")
+        return jsonify({"error": "Failed to load routing totals"}), 500
+
+@app.route("/api/dashboard")
+def dashboard():
+    # Initial state for the dashboard; later changes arrive on /api/events
+    try:
+        return jsonify({
+            "session_id": g.session_id,
+            "sentiment": analytics.sentiment_totals(),
+            "cart": _cart_payload(g.session_id),
+            "logs": _recent_logs()
+        })
+    except Exception as e:
+        logger.error(f"Dashboard snapshot failed: {str(e)}")
+        return jsonify({"error": "Failed to load dashboard"}), 500
+
+@app.route("/api/events")
+def events():
+    # Server-Sent Events: "cart" (this session), "log" and "sentiment" (everyone)
+    subscription = event_bus.subscribe(g.session_id)
+
+    def stream():
+        try:
+            yield "retry: 3000\n\n"
+            while not subscription.closed:
+                yield subscription.get(timeout=15) or ": keepalive\n\n"
+        finally:
+            event_bus.unsubscribe(subscription)
+
+    return Response(stream(), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
+registry.gauge("sse_subscribers", "Connected /api/events streams", lambda: event_bus.stats()["subscribers"])
+registry.gauge("audio_streams_open", "Streaming uploads in progress", lambda: len(streams))
+registry.gauge("response_audio_sessions", "Sessions with a spoken reply ready", lambda: len(_response_audio))
+for name, help_text in (
+    ("enqueued", "Interaction logs queued for writing"),
+    ("written", "Interaction logs written to MongoDB"),
+    ("dropped", "Interaction logs lost to a full queue or a failed spill"),
+    ("spilled", "Interaction logs spilled to disk while MongoDB was unreachable"),
+    ("replayed", "Spilled interaction logs written later"),
+    ("flush_failures", "Interaction log flushes that failed"),
+    ("queue_depth", "Interaction logs waiting to be written, as of each worker's last job")
+):
+    registry.gauge(f"interaction_log_{name}", help_text, lambda name=name: _log_writer_total(name))
+# This process's cart reads (/api/cart, dashboards); all 0 with CART_STORE=mongo
+for name, help_text in (
+    ("hits", "Cart reads served from the cart cache"),
+    ("misses", "Cart reads that went to MongoDB"),
+    ("writes", "Cart changes written through the cart cache"),
+    ("cached_carts", "Carts held in the cart cache"),
+    ("hit_rate", "Share of cart reads served from the cart cache")
+):
+    registry.gauge(f"cart_cache_{name}", help_text, lambda name=name: cart_store_stats().get(name, 0))
+
+@app.route("/api/health")
+def health():
+    # For load balancers and orchestrators: 503 while MongoDB is unreachable
+    try:
+        ping_database()
+    except Exception as e:
+        logger.error(f"Health check failed: {str(e)}")
+        return jsonify({"status": "unavailable", "mongodb": "unreachable"}), 503
+    return jsonify({"status": "ok", "mongodb": "ok"})
+
+@app.route("/api/metrics")
+def metrics():
+    # Prometheus text format. Stage histograms cover the spans of every API
+    # request handled by this process, including its pipeline jobs' stages.
+    return Response(registry.render(), mimetype="text/plain; version=0.0.4")
+
 @app.route("/api/products")
 def products():
     try:
-        import json
-        with open("product.json", "r") as f:
-            products = json.load(f)
-        return jsonify(products)
+        body, etag = get_catalog().serialized()
+        if request.if_none_match.contains(etag):
+            return Response(status=304, headers={"ETag": f'"{etag}"'})
+        return Response(body, mimetype="application/json", headers={"ETag": f'"{etag}"'})
     except Exception as e:
         logger.error(f"Product retrieval failed: {str(e)}")
         return jsonify({"error": "Failed to retrieve products"}), 500
@@ -124,37 +621,34 @@ def debug_command():
     try:
         data = request.json
         text = data.get("text", "")
+        session_id = data.get("session_id") or g.session_id
         from models.intent import extract_intent_entities
-        from models.cart import add_to_cart, remove_from_cart, show_cart
-        entities = extract_intent_entities(text)
+        from models.cart import add_to_cart, remove_from_cart
+        with span("intent"):
+            entities = extract_intent_entities(text)
         logger.info(f"Debug entities: {entities}")
-        if entities["intent"] == "add_to_cart":
-            add_to_cart(entities["product"], entities["quantity"])
-            cart = show_cart()
-        elif entities["intent"] == "remove_from_cart":
-            remove_from_cart(entities["product"], entities["quantity"])
-            cart = show_cart()
-        elif entities["intent"] == "show_cart":
-            cart = show_cart()
-        else:
-            cart = show_cart()
-        # Calculate subtotal and total
-        try:
-            with open("product.json") as f:
-                products_data = json.load(f)
-            price_map = {p["name"].lower(): p.get("price", 0) for p in products_data}
-        except Exception as e:
-            logger.error(f"Failed to load product prices: {str(e)}")
-            price_map = {}
-        subtotal = 0.0
-        for item in cart:
-            product_name = item.get("product", "").lower()
-            price = price_map.get(product_name, 0)
-            quantity = item.get("quantity", 1)
-            item["price"] = price
-            item["total_price"] = price * quantity
-            subtotal += price * quantity
+        with span("cart"):
+            if entities["intent"] == "add_to_cart":
+                add_to_cart(session_id, entities["product"], entities["quantity"])
+                cart = show_cart(session_id)
+            elif entities["intent"] == "remove_from_cart":
+                remove_from_cart(session_id, entities["product"], entities["quantity"])
+                cart = show_cart(session_id)
+            elif entities["intent"] == "show_cart":
+                cart = show_cart(session_id)
+            else:
+                cart = show_cart(session_id)
+        # show_cart() already priced every item from the catalog
+        subtotal = sum(item.get("total_price", 0) for item in cart)
+        if entities["intent"] in ("add_to_cart", "remove_from_cart"):
+            event_bus.publish("cart", {
+                "session_id": session_id,
+                "cart": cart,
+                "subtotal": round(subtotal, 2),
+                "total": round(subtotal, 2)
+            }, session_id=session_id)
         response = {
+            "session_id": session_id,
             "status": "success" if entities["intent"] in ["add_to_cart", "remove_from_cart", "show_cart"] else "error",
             "action": entities["intent"],
             "cart": cart,
@@ -169,8 +663,7 @@ def debug_command():
         logger.error(f"Debug error: {str(e)}")
         cart = []
         try:
-            from models.cart import show_cart
-            cart = show_cart()
+            cart = show_cart(g.session_id)
         except Exception:
             pass
         return jsonify({
@@ -184,30 +677,23 @@ def debug_command():
 @app.route("/api/checkout", methods=["POST"])
 def checkout():
     try:
-        from models.cart import show_cart
-        from models.database import cart_collection
-        # Get current cart
-        cart_items = show_cart()
-        if not cart_items:
+        # Moves only this session's items to orders, in one transaction
+        order = checkout_cart(g.session_id)
+        if order is None:
             return jsonify({"error": "Cart is empty"}), 400
-        # Save to orders collection
-        from models.database import log_collection
-        import datetime
-        from pymongo import MongoClient
-        client = cart_collection.database.client
-        orders_collection = client[cart_collection.database.name]["orders"]
-        order_doc = {
-            "items": cart_items,
-            "created_at": datetime.datetime.utcnow(),
-            "status": "completed"
-        }
-        orders_collection.insert_one(order_doc)
-        # Clear the cart
-        cart_collection.delete_many({})
-        return jsonify({"status": "success", "message": "Order placed and cart cleared."})
+        _publish_cart(g.session_id)
+        return jsonify({
+            "status": "success",
+            "message": "Order placed and cart cleared.",
+            "session_id": g.session_id,
+            "subtotal": order["subtotal"]
+        })
     except Exception as e:
         logger.error(f"Checkout failed: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
 if __name__ == "__main__":
+    # Load the models before accepting uploads (only in the reloader's serving process)
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        get_engine().warmup()
     app.run(debug=True, host="0.0.0.0", port=5000)
\ No newline at end of file
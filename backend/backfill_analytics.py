@@ -0,0 +1,15 @@
+from models.analytics import backfill
+import argparse
+import logging
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Roll logged interactions up into the analytics counters")
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+    backfill(args.batch_size)
@@ -0,0 +1,87 @@
+"""Concurrency stress test for cart mutations against a local mongod.
+
+Usage: MONGODB_URI=mongodb://localhost:27017/ python benchmarks/cart_concurrency.py [--threads 16] [--ops 200]
+
+Runs against a scratch collection (cart_stress_test), never the real cart.
+"""
+import common  # noqa: F401  (sets up sys.path and cwd)
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import time
+
+from models import cart
+from models.database import db
+
+SESSION = "stress-test"
+
+def legacy_remove(collection, product, qty=1):
+    # The find_one + update_one/delete_one sequence remove_from_cart used before
+    item_filter = {"session_id": SESSION, "product": product}
+    item = collection.find_one(item_filter)
+    if not item:
+        return
+    new_qty = item.get("quantity", 1) - qty
+    if new_qty > 0:
+        collection.update_one(item_filter, {"$set": {"quantity": new_qty}})
+    else:
+        collection.delete_one(item_filter)
+
+def hammer(fn, threads, ops):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(lambda _: [fn() for _ in range(ops)], range(threads)))
+    return time.perf_counter() - start
+
+def quantity(collection, product):
+    item = collection.find_one({"session_id": SESSION, "product": product})
+    return item["quantity"] if item else None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--ops", type=int, default=200)
+    args = parser.parse_args()
+    total = args.threads * args.ops
+    collection = db["cart_stress_test"]
+    # Same unique index as the real cart, so concurrent upserts cannot duplicate items
+    collection.create_index([("session_id", 1), ("product", 1)], unique=True)
+    cart.cart_collection = collection
+    failures = 0
+
+    def check(name, ok, detail):
+        nonlocal failures
+        failures += 0 if ok else 1
+        print(f"{'PASS' if ok else 'FAIL'}  {name}: {detail}")
+
+    collection.delete_many({})
+    elapsed = hammer(lambda: cart.add_to_cart(SESSION, "milk", 1), args.threads, args.ops)
+    check("concurrent adds", quantity(collection, "milk") == total,
+          f"expected {total}, got {quantity(collection, 'milk')} ({total / elapsed:.0f} ops/s)")
+
+    elapsed = hammer(lambda: cart.remove_from_cart(SESSION, "milk", 1), args.threads, args.ops)
+    check("concurrent removes", quantity(collection, "milk") is None,
+          f"expected item deleted, got {quantity(collection, 'milk')} ({total / elapsed:.0f} ops/s)")
+
+    collection.delete_many({})
+    cart.add_to_cart(SESSION, "bread", total)
+    hammer(lambda: cart.apply_cart_ops(SESSION, [
+        {"intent": "add_to_cart", "product": "eggs", "quantity": 2},
+        {"intent": "remove_from_cart", "product": "bread", "quantity": 1}
+    ]), args.threads, args.ops)
+    check("bulk apply_cart_ops", quantity(collection, "eggs") == 2 * total and quantity(collection, "bread") is None,
+          f"eggs={quantity(collection, 'eggs')} (expected {2 * total}), bread={quantity(collection, 'bread')} (expected deleted)")
+
+    negatives = collection.count_documents({"quantity": {"$lte": 0}})
+    check("no zero/negative quantities left behind", negatives == 0, f"{negatives} document(s)")
+
+    # Reference: the old read-modify-write remove loses decrements under contention
+    collection.delete_many({})
+    cart.add_to_cart(SESSION, "rice", total)
+    hammer(lambda: legacy_remove(collection, "rice", 1), args.threads, args.ops)
+    print(f"INFO  legacy remove left rice at {quantity(collection, 'rice')} after {total} removes (lost updates)")
+
+    collection.drop()
+    raise SystemExit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+import os
+import sys
+
+# Benchmarks run as scripts from backend/ or backend/benchmarks/; make the
+# backend modules importable and resolve product.json/audio_files like app.py does.
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+os.chdir(BACKEND_DIR)
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+def summarize(name, latencies, elapsed):
+    count = len(latencies)
+    throughput = count / elapsed if elapsed > 0 else 0.0
+    print(
+        f"{name:<28} n={count:<6} {throughput:10.2f}/s  "
+        f"p50={percentile(latencies, 50) * 1000:9.2f}ms  "
+        f"p95={percentile(latencies, 95) * 1000:9.2f}ms  "
+        f"p99={percentile(latencies, 99) * 1000:9.2f}ms"
+    )
+    return {
+        "name": name,
+        "count": count,
+        "throughput": throughput,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99)
+    }
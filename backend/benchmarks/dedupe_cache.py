@@ -0,0 +1,105 @@
+"""Dedupe cache: what counts as a resend, and what a lookup costs.
+
+For every clip, resend variants (identical, padded with silence, quieter,
+noisy at several SNRs) are probed against the cache; exact hits need no
+fingerprint, near hits need DEDUPE_NEAR_BITS >= the reported distance.
+Distances between *different* clips show how low the threshold must stay to
+never answer one recording with another's transcript.
+
+Clips come from --wav-dir, else they are synthesized with the TTS model.
+
+Usage: python benchmarks/dedupe_cache.py [--wav-dir DIR] [--snr 30,20,10]
+"""
+import common  # noqa: F401  (sets up sys.path and cwd)
+import itertools
+import argparse
+import tempfile
+import time
+import os
+
+os.environ.setdefault("DEDUPE_NEAR_BITS", "64")  # compute fingerprints for every probe
+os.environ["DEDUPE_CACHE_DIR"] = tempfile.mkdtemp(prefix="dedupe-bench-")
+
+import numpy as np
+
+from common import percentile
+from models import dedupe
+from models.audio import decode_audio
+
+PHRASES = [
+    "add two bottles of milk to my cart", "remove the bread from my cart", "show my cart",
+    "i want to buy a dozen eggs", "please take out the coffee", "add five packets of pasta",
+    "what is in my cart right now", "i need three kilograms of rice"
+]
+
+def load_clips(wav_dir):
+    if wav_dir:
+        clips = []
+        for name in sorted(os.listdir(wav_dir)):
+            if name.endswith(".wav"):
+                with open(os.path.join(wav_dir, name), "rb") as f:
+                    clips.append((name, decode_audio(f.read())))
+        return clips
+    from models.tts import synthesize
+    from models.audio import resample, SAMPLE_RATE
+    clips = []
+    for text in PHRASES:
+        waveform, sample_rate = synthesize(text)
+        clips.append((text, resample(waveform, sample_rate, SAMPLE_RATE)))
+    return clips
+
+def variants(samples, snrs, rng):
+    yield "identical", samples.copy()
+    yield "padded", np.concatenate([np.zeros(4000, np.float32), samples, np.zeros(8000, np.float32)])
+    yield "quieter", samples * 0.5
+    power = float(np.mean(samples ** 2))
+    for snr in snrs:
+        noise = rng.normal(0, np.sqrt(power / 10 ** (snr / 10)), len(samples)).astype(np.float32)
+        yield f"noise {snr:g}dB", samples + noise
+
+def distance(a, b):
+    return bin(a ^ b).count("1")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--wav-dir")
+    parser.add_argument("--snr", default="30,20,10")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    clips = load_clips(args.wav_dir)
+    probes = []
+    probe_seconds = []
+    for _, samples in clips:
+        start = time.perf_counter()
+        probe = dedupe.Probe(samples)
+        probe_seconds.append(time.perf_counter() - start)
+        dedupe.store(probe, {"transcript": "", "response": "", "audio": None}, [])
+        probes.append(probe)
+
+    outcomes = {}
+    distances = {}
+    lookup_seconds = []
+    for (_, samples), probe in zip(clips, probes):
+        for name, variant in variants(samples, [float(s) for s in args.snr.split(",")], rng):
+            resend = dedupe.Probe(variant)
+            start = time.perf_counter()
+            _, outcome = dedupe.lookup(resend)
+            lookup_seconds.append(time.perf_counter() - start)
+            outcomes.setdefault(name, []).append(resend.key == probe.key)
+            distances.setdefault(name, []).append(distance(resend.fingerprint, probe.fingerprint))
+
+    print(f"{len(clips)} clip(s); probe p50={percentile(probe_seconds, 50) * 1000:.2f}ms, "
+          f"lookup p50={percentile(lookup_seconds, 50) * 1000:.2f}ms")
+    print(f"  {'variant':<14} {'exact hits':>10}  fingerprint distance (min/median/max)")
+    for name, hits in outcomes.items():
+        d = distances[name]
+        print(f"  {name:<14} {sum(hits):>4}/{len(hits):<5}  {min(d)}/{percentile(d, 50)}/{max(d)}")
+    unrelated = [distance(a.fingerprint, b.fingerprint) for a, b in itertools.combinations(probes, 2)]
+    if unrelated:
+        print(f"  {'other clips':<14} {'':>10}  {min(unrelated)}/{percentile(unrelated, 50)}/{max(unrelated)}"
+              f"  (keep DEDUPE_NEAR_BITS below {min(unrelated)})")
+
+if __name__ == "__main__":
+    main()
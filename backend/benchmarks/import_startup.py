@@ -0,0 +1,72 @@
+"""Cold import time of every models.* module (and main), each in a fresh
+interpreter so earlier imports can't warm the next one.
+
+--unreachable points MONGODB_URI at an address nothing answers on: importing
+must still not block on the database. --detail prints the slowest imports
+of each module from python -X importtime.
+
+Usage: python benchmarks/import_startup.py [--modules models.cart,main]
+           [--repeats 5] [--unreachable] [--detail 5]
+"""
+import common  # noqa: F401  (sets up sys.path and cwd)
+import subprocess
+import argparse
+import sys
+import os
+
+from common import BACKEND_DIR, percentile
+
+CHILD = "import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+UNREACHABLE_URI = "mongodb://10.255.255.1:27017/"
+
+def default_modules():
+    names = sorted(name[:-3] for name in os.listdir(os.path.join(BACKEND_DIR, "models"))
+                   if name.endswith(".py") and name != "__init__.py")
+    return [f"models.{name}" for name in names] + ["main"]
+
+def import_seconds(module, env, timeout):
+    proc = subprocess.run([sys.executable, "-c", CHILD.format(module=module)],
+                          capture_output=True, text=True, env=env, cwd=BACKEND_DIR, timeout=timeout)
+    if proc.returncode != 0:
+        lines = proc.stderr.strip().splitlines()
+        raise RuntimeError(lines[-1] if lines else f"exit {proc.returncode}")
+    return float(proc.stdout.strip().splitlines()[-1])
+
+def slowest_imports(module, env, count):
+    # -X importtime lines: "import time: self [us] | cumulative | imported package"
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          capture_output=True, text=True, env=env, cwd=BACKEND_DIR)
+    rows = []
+    for line in proc.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            parts = [part.strip() for part in line[len("import time:"):].split("|")]
+            if parts[0].isdigit():
+                rows.append((int(parts[0]), parts[2]))
+    return sorted(rows, reverse=True)[:count]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modules")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--unreachable", action="store_true")
+    parser.add_argument("--detail", type=int, default=0)
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    if args.unreachable:
+        env["MONGODB_URI"] = UNREACHABLE_URI
+    modules = args.modules.split(",") if args.modules else default_modules()
+    print(f"{args.repeats} cold import(s) per module, MONGODB_URI={env.get('MONGODB_URI', '(default)')}")
+    for module in modules:
+        try:
+            times = [import_seconds(module, env, args.timeout) for _ in range(args.repeats)]
+        except (RuntimeError, subprocess.TimeoutExpired) as e:
+            print(f"  {module:<26} failed: {e}")
+            continue
+        print(f"  {module:<26} p50={percentile(times, 50) * 1000:9.1f}ms  max={max(times) * 1000:9.1f}ms")
+        for self_us, name in slowest_imports(module, env, args.detail) if args.detail else ():
+            print(f"      {self_us / 1000:9.1f}ms  {name}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""Sentiment and Whisper inference backends: latency, throughput, peak RSS and
+accuracy drift against the fp32 torch backend on a fixed test set.
+
+Each backend runs in its own subprocess (through the same SENTIMENT_BACKEND /
+STT_BACKEND settings the workers use) so peak RSS is measured in isolation.
+Without --audio-dir the STT clips are synthesized once with the TTS model;
+an --audio-dir holds <name>.wav files with the reference text in <name>.txt.
+
+Usage: python benchmarks/inference_backends.py [--models sentiment,stt]
+           [--backends torch,torch-int8,onnx,onnx-int8] [--threads 4] [--audio-dir DIR]
+"""
+import common  # noqa: F401  (sets up sys.path and cwd)
+import subprocess
+import argparse
+import resource
+import tempfile
+import json
+import time
+import sys
+import os
+import re
+
+from common import percentile
+
+SENTIMENT_SET = [
+    "add two bottles of milk to my cart", "remove the bread from my cart", "show my cart",
+    "i want to buy a dozen eggs", "this is great, thank you so much", "perfect, that's exactly what i needed",
+    "why is this so slow", "this app is useless", "i said remove the apples, not add them",
+    "you keep getting my order wrong", "can you add some rice please", "what's in my cart right now",
+    "thanks, that was quick", "ugh, not again", "i love how easy this is", "please take out the coffee",
+    "that's not what i asked for", "add five packets of pasta", "i need three kg of potatoes",
+    "this is the worst shopping experience", "nice, add two more", "hmm, i'm not sure about the cheese",
+    "could you remove the butter", "great value rice, two packets", "nothing works today",
+    "the checkout keeps failing", "awesome, show me my cart", "i'm really frustrated with this",
+    "add one bottle of orange juice", "delete everything from my cart"
+]
+STT_SET = [
+    "add two bottles of milk to my cart", "remove the bread from my cart", "show my cart",
+    "i want to buy a dozen eggs", "please take out the coffee", "add five packets of pasta",
+    "what is in my cart right now", "i need three kilograms of rice", "this is taking too long",
+    "thank you, that was quick"
+]
+DIGITS = {"0": "zero", "1": "one", "2": "two", "3": "three", "4": "four", "5": "five",
+          "6": "six", "7": "seven", "8": "eight", "9": "nine", "10": "ten", "12": "twelve"}
+
+def words(text):
+    tokens = re.findall(r"[a-z0-9']+", text.lower().replace("kg", " kilograms "))
+    return [DIGITS.get(token, token) for token in tokens]
+
+def word_errors(reference, hypothesis):
+    # Word-level edit distance
+    ref, hyp = words(reference), words(hypothesis)
+    previous = list(range(len(hyp) + 1))
+    for i, r in enumerate(ref, 1):
+        current = [i]
+        for j, h in enumerate(hyp, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (r != h)))
+        previous = current
+    return previous[-1], len(ref)
+
+def wer(references, hypotheses):
+    errors = total = 0
+    for reference, hypothesis in zip(references, hypotheses):
+        e, n = word_errors(reference, hypothesis)
+        errors += e
+        total += n
+    return errors / total if total else 0.0
+
+def synthesize_clips(directory):
+    from models.tts import synthesize, write_wav
+    for i, text in enumerate(STT_SET):
+        waveform, sample_rate = synthesize(text)
+        write_wav(os.path.join(directory, f"clip{i:02d}.wav"), waveform, sample_rate)
+        with open(os.path.join(directory, f"clip{i:02d}.txt"), "w") as f:
+            f.write(text)
+
+def load_clips(directory):
+    from models.audio import decode_audio
+    clips = []
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(".wav"):
+            with open(os.path.join(directory, name), "rb") as f:
+                samples = decode_audio(f.read())
+            with open(os.path.join(directory, name[:-4] + ".txt")) as f:
+                clips.append((samples, f.read().strip()))
+    return clips
+
+def run_child(model, backend, threads, repeats, audio_dir):
+    # Runs in the subprocess: load one backend, time it, print one JSON line
+    os.environ["SENTIMENT_BACKEND" if model == "sentiment" else "STT_BACKEND"] = backend
+    from models.inference import configure_threads
+    configure_threads(threads)
+    start = time.perf_counter()
+    if model == "sentiment":
+        from models import sentiment
+        pipe = sentiment.get_sentiment_pipeline()
+        items = SENTIMENT_SET
+        single = lambda text: pipe(text, truncation=True)[0]
+        batch = lambda texts: pipe(list(texts), batch_size=len(texts), truncation=True)
+        output = lambda result: [result["label"], round(result["score"] if result["label"] == "POSITIVE" else 1 - result["score"], 4)]
+    else:
+        from models import stt
+        stt.load_model()
+        clips = load_clips(audio_dir)
+        items = [samples for samples, _ in clips]
+        single = lambda samples: stt.load_model().transcribe(samples, fp16=False)["text"]
+        batch = stt.transcribe_batch
+        output = lambda text: text.strip()
+    load_seconds = time.perf_counter() - start
+    single(items[0])  # warm up
+
+    latencies = []
+    outputs = []
+    for _ in range(repeats):
+        outputs = []
+        for item in items:
+            start = time.perf_counter()
+            outputs.append(output(single(item)))
+            latencies.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        batch(items)
+    batch_seconds = (time.perf_counter() - start) / repeats
+    print(json.dumps({
+        "model": model,
+        "backend": backend,
+        "load_seconds": load_seconds,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "throughput": len(items) / batch_seconds,
+        "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "outputs": outputs
+    }))
+
+def measure(model, backend, args, audio_dir):
+    cmd = [sys.executable, os.path.abspath(__file__), "--child", model, backend,
+           "--threads", str(args.threads), "--repeats", str(args.repeats), "--audio-dir", audio_dir or ""]
+    proc = subprocess.run(cmd, capture_output=True, text=True)
+    if proc.returncode != 0:
+        lines = proc.stderr.strip().splitlines()
+        print(f"{model}/{backend} failed: {lines[-1] if lines else proc.returncode}")
+        return None
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+def report(model, results, references=None):
+    baseline = next((r for r in results if r["backend"] == "torch"), results[0])
+    print(f"\n{model}")
+    for r in results:
+        if model == "sentiment":
+            agree = sum(a[0] == b[0] for a, b in zip(r["outputs"], baseline["outputs"])) / len(r["outputs"])
+            drift = sum(abs(a[1] - b[1]) for a, b in zip(r["outputs"], baseline["outputs"])) / len(r["outputs"])
+            accuracy = f"label agreement={agree * 100:6.1f}%  mean |dP(pos)|={drift:.4f}"
+        else:
+            accuracy = (f"WER={wer(references, r['outputs']) * 100:5.1f}%  "
+                        f"WER vs torch={wer(baseline['outputs'], r['outputs']) * 100:5.1f}%")
+        print(
+            f"  {r['backend']:<11} load={r['load_seconds']:6.1f}s  p50={r['p50'] * 1000:8.1f}ms  "
+            f"p95={r['p95'] * 1000:8.1f}ms  {r['throughput']:8.2f}/s  RSS={r['rss_mb']:7.0f}MB  {accuracy}"
+        )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--models", default="sentiment,stt")
+    parser.add_argument("--backends", default="torch,torch-int8,onnx,onnx-int8")
+    parser.add_argument("--threads", type=int, default=0)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--audio-dir")
+    parser.add_argument("--child", nargs=2, metavar=("MODEL", "BACKEND"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child[0], args.child[1], args.threads, args.repeats, args.audio_dir)
+        return
+
+    backends = args.backends.split(",")
+    with tempfile.TemporaryDirectory() as scratch:
+        for model in args.models.split(","):
+            audio_dir = None
+            references = None
+            if model == "stt":
+                audio_dir = args.audio_dir
+                if not audio_dir:
+                    audio_dir = scratch
+                    synthesize_clips(audio_dir)
+                references = [text for _, text in load_clips(audio_dir)]
+            results = [r for r in (measure(model, backend, args, audio_dir) for backend in backends) if r]
+            if results:
+                report(model, results, references)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Product matching latency vs catalog size: per-call regex scan vs ProductMatcher.
+
+Usage: python benchmarks/intent_matcher.py [--sizes 10,1000,10000,100000] [--utterances 200]
+"""
+import common  # noqa: F401  (sets up sys.path and cwd)
+import argparse
+import random
+import time
+import re
+
+from common import summarize
+from models.intent import ProductMatcher
+
+BRANDS = ["great value", "equate", "kellogg's", "marketside", "mainstays", "parent's choice",
+          "sam's choice", "ozark trail", "hyde and eatons", "spring valley"]
+NOUNS = ["rice", "toothpaste", "cereal", "milk", "eggs", "bread", "bananas", "chicken breast",
+         "orange juice", "toilet paper", "pasta", "shampoo", "coffee", "butter", "yogurt",
+         "apples", "cheese", "tortillas", "soap", "detergent"]
+ADJECTIVES = ["organic", "whole", "low fat", "family size", "extra large", "unscented", "crunchy",
+              "vanilla", "spicy", "classic", "original", "fresh", "frozen", "mini", "honey"]
+TEMPLATES = ["add {qty} {name} to my cart", "i want to buy {qty} packets {name}",
+             "remove {name} from my cart", "please add {qty}kg {name}", "show my cart"]
+
+def generate_catalog(size, seed=0):
+    rng = random.Random(seed)
+    names = set()
+    while len(names) < size:
+        parts = [rng.choice(BRANDS), rng.choice(ADJECTIVES), rng.choice(NOUNS)]
+        if len(names) >= len(BRANDS) * len(ADJECTIVES) * len(NOUNS):
+            parts.append(f"{rng.randint(1, 10 ** 6)}")
+        names.add(" ".join(parts))
+    return [{"name": name, "price": round(rng.uniform(0.5, 20), 2)} for name in sorted(names)]
+
+def generate_utterances(catalog, count, seed=1):
+    rng = random.Random(seed)
+    return [
+        rng.choice(TEMPLATES).format(qty=rng.choice(["2", "two", "a", "5"]), name=rng.choice(catalog)["name"])
+        for _ in range(count)
+    ]
+
+def legacy_match(text, products_data):
+    # The per-call regex scan extract_intent_entities used before the index
+    metrics_list = ["kg", "kilogram", "litre", "liter", "dozen", "dozens", "packet", "packets",
+                    "bottle", "bottles", "piece", "pieces"]
+    best_match = None
+    best_match_len = 0
+    for prod in products_data:
+        prod_name = prod["name"].lower()
+        pattern = r"(\d+|one|two|three|four|five|a|an)?\s*(%s)?\s*%s" % ("|".join(metrics_list), re.escape(prod_name))
+        match = re.search(pattern, text)
+        if not match:
+            pattern_nospace = r"(\d+|one|two|three|four|five|a|an)(%s)%s" % ("|".join(metrics_list), re.escape(prod_name))
+            match = re.search(pattern_nospace, text)
+        if match and len(prod_name) > best_match_len:
+            best_match = prod["name"]
+            best_match_len = len(prod_name)
+    return best_match
+
+def run(name, fn, utterances, budget):
+    latencies = []
+    start = time.perf_counter()
+    for text in utterances:
+        t0 = time.perf_counter()
+        fn(text)
+        latencies.append(time.perf_counter() - t0)
+        if time.perf_counter() - start > budget:
+            break
+    return summarize(name, latencies, time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", default="10,1000,10000,100000")
+    parser.add_argument("--utterances", type=int, default=200)
+    parser.add_argument("--legacy-budget", type=float, default=20.0,
+                        help="seconds to spend on the legacy scan per catalog size")
+    args = parser.parse_args()
+
+    for size in (int(s) for s in args.sizes.split(",")):
+        catalog = generate_catalog(size)
+        utterances = generate_utterances(catalog, args.utterances)
+        start = time.perf_counter()
+        matcher = ProductMatcher(catalog)
+        print(f"\ncatalog={size} products, index build {(time.perf_counter() - start) * 1000:.1f}ms")
+        run(f"legacy regex scan ({size})", lambda t: legacy_match(t, catalog), utterances, args.legacy_budget)
+        run(f"ProductMatcher ({size})", matcher.match, utterances, float("inf"))
+
+if __name__ == "__main__":
+    main()
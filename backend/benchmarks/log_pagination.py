@@ -0,0 +1,96 @@
+"""Interaction log query latency vs history size: keyset pages (first, deep,
+filtered, time range) against the old skip/limit paging.
+
+Seeds a scratch collection (logs_pagination_bench, never the real logs)
+with seed_logs.py's synthetic history at each size, builds the same indexes
+models/log_store.py declares, then times each query shape. docs= is
+totalDocsExamined from explain() for one run: it should stay near the page
+size for every keyset query, whatever the collection size.
+
+Usage: [MONGODB_URI=inmemory] python benchmarks/log_pagination.py
+           [--sizes 10000,100000,1000000] [--depth 200] [--repeats 50]
+"""
+import common  # noqa: F401  (sets up sys.path and cwd)
+import datetime
+import argparse
+import time
+import sys
+
+from common import summarize
+from models.database import MONGODB_URI, db
+from models.log_store import LOG_INDEXES, query_logs, _filter
+from seed_logs import seed_logs
+
+COLLECTION = "logs_pagination_bench"
+PAGE = 20
+
+def walk(collection, pages, **filters):
+    # Follows next_cursor for `pages` pages; returns the cursor of the last
+    cursor = None
+    for _ in range(pages):
+        cursor = query_logs(PAGE, cursor, collection=collection, **filters)["next_cursor"]
+        if cursor is None:
+            break
+    return cursor
+
+def docs_examined(collection, query, skip=0):
+    plan = collection.find(query).sort("_id", -1).skip(skip).limit(PAGE + 1).explain()
+    return plan.get("executionStats", {}).get("totalDocsExamined", "?")
+
+def time_query(name, fn, repeats, examined):
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - t0)
+    summarize(name, latencies, time.perf_counter() - start)
+    print(f"{'':<28} docs={examined}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    parser.add_argument("--depth", type=int, default=200, help="page number for the deep-page queries")
+    parser.add_argument("--repeats", type=int, default=50)
+    parser.add_argument("--keep", action="store_true", help="leave the scratch collection behind")
+    args = parser.parse_args()
+
+    if MONGODB_URI.startswith("mongodb+srv://"):
+        sys.exit("Point MONGODB_URI at a local mongod (or inmemory); this benchmark writes millions of documents")
+
+    collection = db[COLLECTION]
+    try:
+        for size in (int(s) for s in args.sizes.split(",")):
+            collection.drop()
+            start = time.perf_counter()
+            seed_logs(size, collection, days=90, rolled_up=True)
+            for keys, options in LOG_INDEXES:
+                if "expireAfterSeconds" not in options:
+                    collection.create_index(keys, **options)
+            print(f"\n{size} log(s) (seeded and indexed in {time.perf_counter() - start:.1f}s)")
+
+            deep_cursor = walk(collection, args.depth)
+            day_ago = datetime.datetime.utcnow() - datetime.timedelta(days=1)
+            shapes = [
+                ("first page", {}, None),
+                (f"page {args.depth} (keyset)", {}, deep_cursor),
+                ("sentiment=NEGATIVE", {"sentiment": "NEGATIVE"}, None),
+                ("intent+sentiment", {"intent": "remove_from_cart", "sentiment": "NEGATIVE"}, None),
+                ("last 24h", {"since": day_ago}, None)
+            ]
+            for name, filters, cursor in shapes:
+                examined = docs_examined(collection, _filter(cursor=cursor, **filters))
+                time_query(name, lambda: query_logs(PAGE, cursor, collection=collection, **filters),
+                           args.repeats, examined)
+
+            # Reference: offset paging reads and discards every earlier page
+            skip = args.depth * PAGE
+            time_query(f"page {args.depth} (skip/limit)",
+                       lambda: list(collection.find({}).sort("_id", -1).skip(skip).limit(PAGE)),
+                       args.repeats, docs_examined(collection, {}, skip))
+    finally:
+        if not args.keep:
+            collection.drop()
+
+if __name__ == "__main__":
+    main()
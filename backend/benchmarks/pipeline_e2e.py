@@ -0,0 +1,119 @@
+"""End-to-end pipeline benchmark: replays a corpus through the Flask app and
+reports throughput plus per-stage p50/p95/p99 from the Server-Timing header.
+
+WAV files (--wav-dir) go through /api/upload and the full pipeline workers;
+text utterances (--text, one per line, or a built-in corpus) go through
+/api/debug (intent + cart only). Requests run in-process through Flask's test
+client against a local mongod (MONGODB_URI=inmemory starts a throwaway one),
+never a mongodb+srv:// cluster.
+
+Usage: [MONGODB_URI=inmemory] python benchmarks/pipeline_e2e.py
+           [--wav-dir DIR | --text FILE] [--requests 200] [--concurrency 4]
+"""
+import common  # noqa: F401  (sets up sys.path and cwd)
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import io
+import argparse
+import time
+import sys
+import os
+
+from common import percentile, summarize
+
+TEXT_CORPUS = [
+    "add two bottles of milk", "add a dozen eggs", "remove milk", "show my cart",
+    "i want to buy 5kg rice", "add three packets of pasta and two bread", "what's in my cart",
+    "remove the eggs from my cart", "please add one bottle of orange juice", "buy two coffee"
+]
+SESSION_PREFIX = "bench-"
+
+def parse_server_timing(header):
+    timings = {}
+    for part in (header or "").split(","):
+        name, _, params = part.strip().partition(";")
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "dur" and name:
+                timings[name] = float(value) / 1000
+    return timings
+
+def load_corpus(args):
+    if args.wav_dir:
+        corpus = []
+        for name in sorted(os.listdir(args.wav_dir)):
+            if name.endswith(".wav"):
+                with open(os.path.join(args.wav_dir, name), "rb") as f:
+                    corpus.append(("wav", f.read()))
+        return corpus
+    if args.text:
+        with open(args.text) as f:
+            return [("text", line.strip()) for line in f if line.strip()]
+    return [("text", text) for text in TEXT_CORPUS]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--wav-dir")
+    parser.add_argument("--text")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--sessions", type=int, default=8)
+    args = parser.parse_args()
+
+    from models.database import MONGODB_URI, cart_collection
+    if MONGODB_URI.startswith("mongodb+srv://"):
+        sys.exit("Point MONGODB_URI at a local mongod (or inmemory); this benchmark writes carts and logs")
+
+    from app import app
+
+    corpus = load_corpus(args)
+    if not corpus:
+        sys.exit("Empty corpus")
+    local = threading.local()
+
+    def send(i):
+        client = getattr(local, "client", None)
+        if client is None:
+            client = local.client = app.test_client()
+        kind, payload = corpus[i % len(corpus)]
+        session_id = f"{SESSION_PREFIX}{i % args.sessions}"
+        start = time.perf_counter()
+        if kind == "wav":
+            response = client.post(
+                "/api/upload",
+                data={"audio": (io.BytesIO(payload), "input.wav"), "session_id": session_id},
+                content_type="multipart/form-data"
+            )
+        else:
+            response = client.post("/api/debug", json={"text": payload, "session_id": session_id})
+        elapsed = time.perf_counter() - start
+        return elapsed, response.status_code, parse_server_timing(response.headers.get("Server-Timing"))
+
+    try:
+        for i in range(args.warmup):
+            send(i)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            results = list(pool.map(send, range(args.requests)))
+        wall = time.perf_counter() - start
+    finally:
+        cart_collection.delete_many({"session_id": {"$regex": f"^{SESSION_PREFIX}"}})
+
+    errors = sum(1 for _, status, _ in results if status >= 500)
+    print(f"{len(results)} request(s), {errors} server error(s), concurrency {args.concurrency}")
+    summarize("end-to-end", [elapsed for elapsed, _, _ in results], wall)
+    stages = {}
+    for _, _, timings in results:
+        for stage, seconds in timings.items():
+            stages.setdefault(stage, []).append(seconds)
+    for stage, values in stages.items():
+        print(
+            f"  {stage:<12} n={len(values):<6} "
+            f"p50={percentile(values, 50) * 1000:9.2f}ms  "
+            f"p95={percentile(values, 95) * 1000:9.2f}ms  "
+            f"p99={percentile(values, 99) * 1000:9.2f}ms"
+        )
+
+if __name__ == "__main__":
+    main()
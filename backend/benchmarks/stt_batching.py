@@ -0,0 +1,78 @@
+"""Compare per-file Whisper transcription with the micro-batching scheduler.
+
+Usage: python benchmarks/stt_batching.py [--utterances 32] [--concurrency 8]
+"""
+import common  # noqa: F401  (sets up sys.path and cwd)
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import tempfile
+import random
+import time
+import wave
+import os
+
+import numpy as np
+
+from common import summarize
+
+SAMPLE_RATE = 16000
+
+def generate_corpus(directory, count, seed=0):
+    # Synthetic "speech": a few formant-like tones with noise, 1-5 s long
+    rng = random.Random(seed)
+    paths = []
+    for i in range(count):
+        duration = rng.uniform(1.0, 5.0)
+        t = np.arange(int(duration * SAMPLE_RATE)) / SAMPLE_RATE
+        signal = sum(np.sin(2 * np.pi * rng.uniform(120, 900) * t) for _ in range(3))
+        signal = signal * np.abs(np.sin(2 * np.pi * rng.uniform(2, 5) * t))
+        signal = signal + np.random.default_rng(i).normal(0, 0.05, t.shape)
+        pcm = (signal / np.max(np.abs(signal)) * 0.6 * 32767).astype(np.int16)
+        path = os.path.join(directory, f"utt_{i:04d}.wav")
+        with wave.open(path, "wb") as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(SAMPLE_RATE)
+            wav.writeframes(pcm.tobytes())
+        paths.append(path)
+    return paths
+
+def run(name, transcribe, paths, concurrency):
+    latencies = []
+
+    def timed(path):
+        start = time.perf_counter()
+        transcribe(path)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(timed, paths))
+    return summarize(name, latencies, time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--utterances", type=int, default=32)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--max-batch-size", type=int, default=8)
+    parser.add_argument("--max-wait-ms", type=float, default=50)
+    args = parser.parse_args()
+
+    from models import stt
+    from models.batching import MicroBatcher
+    model = stt.load_model()
+    # Callers here are threads of one process, like uploads in the app
+    # process in front of the worker pool (STT_BATCHING=1)
+    batcher = MicroBatcher(stt.transcribe_batch, args.max_batch_size, args.max_wait_ms, name="stt-batcher")
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = generate_corpus(directory, args.utterances)
+        # Warm up both paths so neither pays one-off allocation costs
+        model.transcribe(paths[0])
+        batcher.submit(paths[0]).result()
+
+        run("per-file model.transcribe", lambda p: model.transcribe(p)["text"], paths, args.concurrency)
+        run("micro-batched", lambda p: batcher.submit(p).result(), paths, args.concurrency)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Time to first audio byte: whole-reply speak_response vs clause-by-clause speak_clause.
+
+Every run starts from an empty TTS cache, so both paths pay for synthesis.
+
+Usage: python benchmarks/tts_streaming.py [--repeats 3] [--items 1,3,6,10]
+"""
+import common  # noqa: F401  (sets up sys.path and cwd)
+import argparse
+import tempfile
+import time
+import os
+
+PRODUCTS = ["Apples", "Bananas", "Milk", "Eggs", "Bread", "Rice", "Coffee", "Butter", "Cheese", "Yogurt"]
+
+def cart_reply(count):
+    # The show_cart reply from main.handle_action, the longest one we speak
+    return "Your cart has: " + ", ".join(f"{i % 4 + 1} {PRODUCTS[i % len(PRODUCTS)]}" for i in range(count))
+
+def measure(tts, text, streaming):
+    # Returns (seconds to first byte, seconds to last byte)
+    tts._memory_cache.clear()
+    start = time.perf_counter()
+    if not streaming:
+        tts.speak_response(text)
+        elapsed = time.perf_counter() - start
+        return elapsed, elapsed
+    # Clause by clause, as PipelineEngine.stream_speech runs it on one worker
+    first = None
+    for index, clause in enumerate(tts.split_clauses(text)):
+        tts.speak_clause(clause, leading_gap=index > 0)
+        if first is None:
+            first = time.perf_counter() - start
+    return first, time.perf_counter() - start
+
+def report(name, samples):
+    first = sorted(s[0] for s in samples)
+    total = sorted(s[1] for s in samples)
+    print(
+        f"{name:<28} n={len(samples):<4} "
+        f"first byte p50={first[len(first) // 2] * 1000:9.1f}ms max={first[-1] * 1000:9.1f}ms  "
+        f"complete p50={total[len(total) // 2] * 1000:9.1f}ms"
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--items", default="1,3,6,10")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        # Point the disk cache at a scratch directory so nothing is reused
+        os.environ["TTS_CACHE_DIR"] = cache_dir
+        from models import tts
+        tts.get_tts()
+        tts.speak_response("Warming up the synthesizer.")
+
+        for count in (int(n) for n in args.items.split(",")):
+            text = cart_reply(count)
+            print(f"\n{count} item(s), {len(tts.split_clauses(text))} clause(s): {text!r}")
+            for name, streaming in (("whole reply", False), ("clause streaming", True)):
+                samples = []
+                for _ in range(args.repeats):
+                    for path in os.listdir(cache_dir):
+                        os.remove(os.path.join(cache_dir, path))
+                    samples.append(measure(tts, text, streaming))
+                report(name, samples)
+
+if __name__ == "__main__":
+    main()
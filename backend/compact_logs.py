@@ -0,0 +1,17 @@
+from models.log_store import compact_logs, LOG_RETENTION_DAYS, LOG_RETENTION_MODE, RETENTION_MODES
+import argparse
+import logging
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Roll up and archive interaction logs past the retention window")
+    parser.add_argument("--retention-days", type=float, default=LOG_RETENTION_DAYS)
+    parser.add_argument("--mode", choices=RETENTION_MODES, default=LOG_RETENTION_MODE)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+    compact_logs(args.retention_days, args.mode, args.batch_size)
@@ -1,9 +1,18 @@
-from models.stt import transcribe_audio
-from models.tts import speak_response
-from models.intent import extract_intent_entities
+from models.stt import transcribe_audio, transcribe_batch
+from models.audio import decode_audio
+from models.tts import speak_response, register_template, prewarm, tts_cache_stats
+from models.intent import extract_intents, CART_INTENTS
 from models.sentiment import detect_sentiment
-from models.cart import add_to_cart, remove_from_cart, show_cart
-from models.database import log_collection
+from models.cart import add_to_cart, remove_from_cart, show_cart, apply_cart_ops, DEFAULT_SESSION
+from models.interaction_log import log_interaction
+from models.analytics import record_interaction, relabel_sentiment
+from models.metrics import span, trace
+from models.routing import route, defer_sentiment, routing_stats, FULL_TIERS
+from models.dedupe import (
+    DEDUPE_CACHE, Probe, lookup, store, claim_idempotency_key, release_idempotency_key,
+    record_cart_replay, dedupe_stats
+)
+import datetime
 import sys
 import logging
 
@@ -14,72 +23,296 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def handle_action(entities):
+# Reply texts; fixed ones are synthesized ahead of time and templates are
+# stitched from cached fragments (see models/tts.py)
+NEGATIVE_RESPONSE = "You sound frustrated. Let me connect you to a support agent."
+EMPTY_CART_RESPONSE = "Your cart is empty."
+UNKNOWN_RESPONSE = "Sorry, I didn't understand that. Can you rephrase?"
+ERROR_RESPONSE = "I encountered an error processing your request. Please try again."
+ADDED_TEMPLATE = "Added {qty} {product} to your cart."
+REMOVED_TEMPLATE = "Removed {product} from your cart."
+CART_TEMPLATE = "Your cart has: {items}"
+
+FIXED_RESPONSES = [NEGATIVE_RESPONSE, EMPTY_CART_RESPONSE, UNKNOWN_RESPONSE, ERROR_RESPONSE]
+for template in (ADDED_TEMPLATE, REMOVED_TEMPLATE, CART_TEMPLATE):
+    register_template(template)
+
+def prewarm_responses():
+    prewarm(FIXED_RESPONSES)
+
+def handle_action(entities, session_id=DEFAULT_SESSION, apply=True):
+    # apply=False builds the same reply without changing the cart
     try:
         intent = entities['intent']
         product = entities['product']
         qty = entities['quantity']
 
         if intent == "add_to_cart":
-            add_to_cart(product, qty)
-            return f"Added {qty} {product} to your cart."
+            if apply:
+                add_to_cart(session_id, product, qty)
+            return ADDED_TEMPLATE.format(qty=qty, product=product)
         elif intent == "remove_from_cart":
-            remove_from_cart(product)
-            return f"Removed {product} from your cart."
+            if apply:
+                remove_from_cart(session_id, product, qty)
+            return REMOVED_TEMPLATE.format(product=product)
         elif intent == "show_cart":
-            cart = show_cart()
+            cart = show_cart(session_id)
             if cart:
-                return "Your cart has: " + ", ".join(f"{item['quantity']} {item['product']}" for item in cart)
+                return CART_TEMPLATE.format(items=", ".join(f"{item['quantity']} {item['product']}" for item in cart))
             else:
-                return "Your cart is empty."
+                return EMPTY_CART_RESPONSE
         else:
-            return "Sorry, I didn't understand that. Can you rephrase?"
+            return UNKNOWN_RESPONSE
     except Exception as e:
         logger.error(f"Action handling failed: {str(e)}")
-        return "I encountered an error processing your request. Please try again."
+        return ERROR_RESPONSE
 
-def main(input_file="input.wav"):
+def handle_actions(ops, session_id=DEFAULT_SESSION, apply=True):
+    # Several cart intents from one utterance, applied in a single bulk write
     try:
-        logger.info(f"Processing audio file: {input_file}")
-        
-        # Transcribe audio
-        text = transcribe_audio(input_file)
-        logger.info(f"You said: {text}")
+        if apply:
+            apply_cart_ops(session_id, ops)
+        replies = []
+        for op in ops:
+            if op["intent"] == "add_to_cart":
+                replies.append(ADDED_TEMPLATE.format(qty=op["quantity"], product=op["product"]))
+            else:
+                replies.append(REMOVED_TEMPLATE.format(product=op["product"]))
+        return " ".join(replies)
+    except Exception as e:
+        logger.error(f"Action handling failed: {str(e)}")
+        return ERROR_RESPONSE
+
+def _log_or_defer(log_entry, text):
+    # Update the dashboard counters first, so the app's "sentiment" event
+    # for this job already counts it; backfill_analytics.py picks up failures
+    log_entry["rolled_up"] = record_interaction(log_entry)
+    if log_entry["sentiment"] is not None:
+        # Buffered and written in batches off the request path
+        log_interaction(log_entry)
+        return
+
+    # Fast path: counted as NEUTRAL until the model has run in the
+    # background, then moved to its label, and the log is written
+    def finish(label, score):
+        log_entry["sentiment"] = label
+        if log_entry["rolled_up"]:
+            relabel_sentiment(log_entry, None, label)
+        log_interaction(log_entry)
+    defer_sentiment(text, finish)
+
+def _replay(entry, outcome, session_id, speak, idempotency_key):
+    # A resent recording: answer from the dedupe cache. The cart change is
+    # only repeated when the client sent an idempotency key not used before.
+    meta = entry["meta"]
+    transcript = meta["result"]["transcript"]
+    logger.info(f"Dedupe cache {outcome} for session {session_id}: {transcript}")
+    changes_cart = any(op["intent"] in CART_INTENTS for op in meta["ops"] or [])
+    if meta["ops"] is None or (changes_cart and (outcome == "near" or meta.get("session_id") != session_id)):
+        # Only the transcript is reused when the reply depends on the cart at
+        # the time (show cart), or when a cart change wasn't this session's
+        # own resend: a near match or another shopper's recording is a new
+        # request, not a retry
+        result = run_text_pipeline(transcript, session_id, speak, idempotency_key)
+        result["dedupe"] = outcome
+        return result
+    result = dict(meta["result"])
+    result["cart_replayed"] = False
+    if idempotency_key and changes_cart and claim_idempotency_key(session_id, idempotency_key):
+        try:
+            with span("cart"):
+                apply_cart_ops(session_id, meta["ops"])
+        except Exception:
+            release_idempotency_key(session_id, idempotency_key)
+            raise
+        result["cart_replayed"] = True
+        record_cart_replay()
+    result["audio"] = (entry["audio"] or speak_response(result["response"])) if speak else None
+    result["logged"] = result["intent"] is not None  # as the original was (not negative replies)
+    if result["logged"]:
+        log_entry = {
+            "session_id": session_id,
+            "user_input": transcript,
+            "intent": result["intent"],
+            "response": result["response"],
+            "sentiment": result["sentiment"],
+            "sentiment_tier": result["sentiment_tier"],
+            "dedupe": outcome,
+            "created_at": datetime.datetime.utcnow()
+        }
+        if len(meta["ops"]) > 1:
+            log_entry["intents"] = meta["ops"]
+        with span("log"):
+            _log_or_defer(log_entry, transcript)
+    result["dedupe"] = outcome
+    return result
+
+def _remember(probe, result, session_id):
+    if result["response"] == ERROR_RESPONSE or probe.duration == 0:
+        return  # let the retry run the pipeline again
+    ops = result.get("intents") or []
+    if any(op["intent"] == "show_cart" for op in ops):
+        ops = None
+    store(probe, result, ops, session_id)
 
+def _prepare(audio, session_id, sample_rate, speak, idempotency_key):
+    # audio is a file path, or the uploaded bytes (WAV, raw PCM at
+    # sample_rate, or anything ffmpeg reads) decoded in memory. Returns
+    # (audio for Whisper, dedupe probe, result when answered from the cache).
+    probe = None
+    if isinstance(audio, (bytes, bytearray)):
+        logger.info(f"Processing {len(audio)} bytes of uploaded audio (session {session_id})")
+        with span("decode"):
+            audio = decode_audio(audio, sample_rate)
+        if DEDUPE_CACHE:
+            with span("dedupe"):
+                probe = Probe(audio)
+                entry, outcome = lookup(probe)
+            if entry is not None:
+                return audio, probe, _replay(entry, outcome, session_id, speak, idempotency_key)
+    else:
+        logger.info(f"Processing audio file: {audio} (session {session_id})")
+    return audio, probe, None
+
+def _complete(text, probe, session_id, speak, idempotency_key):
+    logger.info(f"You said: {text}")
+    result = run_text_pipeline(text, session_id, speak, idempotency_key)
+    if probe is not None:
+        _remember(probe, result, session_id)
+        result["dedupe"] = "miss"
+        logger.info(f"Dedupe cache: {dedupe_stats()}")
+    return result
+
+def run_pipeline(audio="input.wav", session_id=DEFAULT_SESSION, sample_rate=None, speak=True, idempotency_key=None):
+    audio, probe, result = _prepare(audio, session_id, sample_rate, speak, idempotency_key)
+    if result is not None:
+        return result
+    return _complete(transcribe_audio(audio), probe, session_id, speak, idempotency_key)
+
+def run_pipeline_batch(jobs):
+    # jobs: run_pipeline argument tuples for uploads that arrived together.
+    # Whisper runs once for all of them; everything else runs per upload.
+    # Returns, in order, each result (with its stage timings) or the
+    # exception its upload raised.
+    results = [None] * len(jobs)
+    timings = [{} for _ in jobs]
+    pending = []
+    for index, job in enumerate(jobs):
+        try:
+            with trace() as timings[index]:
+                audio, probe, results[index] = _prepare(*job)
+        except Exception as e:
+            results[index] = e
+            continue
+        if results[index] is None:
+            pending.append((index, audio, probe))
+    if pending:
+        with trace() as shared:
+            texts = transcribe_batch([audio for _, audio, _ in pending])
+        for (index, _, probe), text in zip(pending, texts):
+            results[index] = text
+            if isinstance(text, Exception):
+                continue
+            # Each upload waited for the whole batched pass
+            timings[index].update(shared)
+            _, session_id, _, speak, idempotency_key = jobs[index]
+            try:
+                with trace() as stages:
+                    results[index] = _complete(text, probe, session_id, speak, idempotency_key)
+                timings[index].update(stages)
+            except Exception as e:
+                results[index] = e
+    for result, stages in zip(results, timings):
+        if isinstance(result, dict):
+            result["timings"] = stages
+    return results
+
+def run_text_pipeline(text, session_id=DEFAULT_SESSION, speak=True, idempotency_key=None):
+    # Everything after speech-to-text; streaming uploads enter here with the
+    # transcript they already have. With speak=False the reply is left for
+    # the caller to synthesize clause by clause (see PipelineEngine.stream_speech).
+    # Extract intent(s) first; the rules are cheap and decide whether the
+    # sentiment model is needed before replying (see models/routing.py)
+    with span("intent"):
+        ops = extract_intents(text)
+        entities = ops[0]
+        logger.info(f"Extracted entities: {ops}")
+        tier, _ = route(text, ops)
+
+    label = None
+    if tier in FULL_TIERS:
         # Sentiment analysis
         label, score = detect_sentiment(text)
         logger.info(f"Sentiment: {label} ({score})")
 
         # Handle negative sentiment
         if label == "NEGATIVE":
-            response = "You sound frustrated. Let me connect you to a support agent."
+            response = NEGATIVE_RESPONSE
             logger.info(f"AI: {response}")
-            speak_response(response, "audio_files/response.wav")
-            return
-
-        # Extract intent
-        entities = extract_intent_entities(text)
-        logger.info(f"Extracted entities: {entities}")
-
-        # Generate response
-        reply = handle_action(entities)
-        logger.info(f"AI: {reply}")
-
-        # Speak response
-        speak_response(reply, "audio_files/response.wav")
-
-        # Log interaction
-        log_collection.insert_one({
-            "user_input": text,
-            "intent": entities,
-            "response": reply,
-            "sentiment": label
-        })
-        
+            return {
+                "transcript": text,
+                "sentiment": label,
+                "sentiment_tier": tier,
+                "intent": None,
+                "response": response,
+                "audio": speak_response(response) if speak else None,
+                "logged": False
+            }
+
+    # Generate response. With an idempotency key the cart changes at most
+    # once per key, however often the request is retried.
+    apply = True
+    if idempotency_key and any(op["intent"] in CART_INTENTS for op in ops):
+        apply = claim_idempotency_key(session_id, idempotency_key)
+        if not apply:
+            logger.info(f"Idempotency key {idempotency_key} already applied, leaving the cart as is")
+    with span("cart"):
+        reply = handle_actions(ops, session_id, apply) if len(ops) > 1 else handle_action(entities, session_id, apply)
+    if apply and idempotency_key and reply == ERROR_RESPONSE:
+        release_idempotency_key(session_id, idempotency_key)
+    logger.info(f"AI: {reply}")
+
+    # Speak response
+    audio = speak_response(reply) if speak else None
+    logger.info(f"TTS cache: {tts_cache_stats()}")
+
+    # Log interaction
+    log_entry = {
+        "session_id": session_id,
+        "user_input": text,
+        "intent": entities,
+        "response": reply,
+        "sentiment": label,
+        "sentiment_tier": tier,
+        "created_at": datetime.datetime.utcnow()
+    }
+    if len(ops) > 1:
+        log_entry["intents"] = ops
+    with span("log"):
+        _log_or_defer(log_entry, text)
+    logger.info(f"Routing: {routing_stats()}")
+
+    return {
+        "transcript": text,
+        "sentiment": label,
+        "sentiment_tier": tier,
+        "intent": entities,
+        "response": reply,
+        "audio": audio,
+        "intents": ops,
+        "logged": True
+    }
+
+def main(input_file="input.wav", session_id=DEFAULT_SESSION):
+    try:
+        return run_pipeline(input_file, session_id)
     except Exception as e:
         logger.error(f"Processing failed: {str(e)}")
-        raise  # Re-raise to capture in subprocess
+        raise  # Re-raise to capture in the caller
 
 if __name__ == "__main__":
     input_file = sys.argv[1] if len(sys.argv) > 1 else "input.wav"
-    main(input_file)
\ No newline at end of file
+    session_id = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_SESSION
+    result = main(input_file, session_id)
+    with open("response.wav", "wb") as f:
+        f.write(result["audio"])
\ No newline at end of file
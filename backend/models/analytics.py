@@ -0,0 +1,231 @@
+from models.database import db, log_collection, ensure_index
+from bson import ObjectId
+from pymongo import UpdateOne, ASCENDING, DESCENDING
+from pymongo.errors import PyMongoError, BulkWriteError
+import datetime
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Running totals plus per-minute/hour/day buckets, all $inc-ed in one
+# bulk_write when an interaction is logged, so the dashboard never has to
+# scan log_collection.
+rollup_collection = db['rollups']
+TOTALS_ID = "totals"
+GRANULARITIES = {
+    "minute": lambda at: at.replace(second=0, microsecond=0),
+    "hour": lambda at: at.replace(minute=0, second=0, microsecond=0),
+    "day": lambda at: at.replace(hour=0, minute=0, second=0, microsecond=0)
+}
+
+DUPLICATE_KEY = 11000
+# A backfill claim this old belongs to a run that died; the next run finishes it
+BACKFILL_CLAIM_TIMEOUT = float(os.getenv("BACKFILL_CLAIM_TIMEOUT", "600"))
+
+ensure_index(
+    rollup_collection.name,
+    [("granularity", ASCENDING), ("bucket", DESCENDING)],
+    name="granularity_bucket"
+)
+ensure_index(log_collection.name, [("rollup_claim", ASCENDING)], sparse=True, name="rollup_claim")
+
+def _field(name):
+    # Product names become field names: no dots or leading "$" allowed
+    return str(name).replace(".", "_").replace("$", "_") or "unknown"
+
+def _counters(entry):
+    counters = {"count": 1, f"sentiment.{_field(entry.get('sentiment') or 'NEUTRAL')}": 1}
+    if entry.get("sentiment_tier"):
+        counters[f"routing.{_field(entry['sentiment_tier'])}"] = 1
+    intents = entry.get("intents") or ([entry["intent"]] if entry.get("intent") else [])
+    for entities in intents:
+        intent = entities.get("intent", "unknown")
+        key = f"intent.{_field(intent)}"
+        counters[key] = counters.get(key, 0) + 1
+        product = entities.get("product")
+        if product and product != "item" and intent in ("add_to_cart", "remove_from_cart"):
+            key = f"product.{_field(product)}"
+            counters[key] = counters.get(key, 0) + entities.get("quantity", 1)
+    return counters
+
+def _timestamp(entry):
+    at = entry.get("created_at")
+    if at is None and entry.get("_id") is not None and hasattr(entry["_id"], "generation_time"):
+        at = entry["_id"].generation_time.replace(tzinfo=None)
+    return at or datetime.datetime.utcnow()
+
+def _targets(at):
+    # (_id, fields set on insert) of every rollup document an entry counts in
+    yield TOTALS_ID, {"granularity": "total"}
+    for granularity, truncate in GRANULARITIES.items():
+        bucket = truncate(at)
+        yield f"{granularity}:{bucket.isoformat()}", {"granularity": granularity, "bucket": bucket}
+
+def _rollup_ops(counters, at):
+    return [
+        UpdateOne({"_id": _id}, {"$inc": counters, "$setOnInsert": fields}, upsert=True)
+        for _id, fields in _targets(at)
+    ]
+
+def record_interaction(entry):
+    # Returns True once the entry is reflected in the totals and buckets
+    try:
+        rollup_collection.bulk_write(_rollup_ops(_counters(entry), _timestamp(entry)), ordered=False)
+        return True
+    except PyMongoError as e:
+        logger.error(f"Analytics rollup failed: {str(e)}")
+        return False
+
+def relabel_sentiment(entry, old, new):
+    # Moves an entry that is already counted from one sentiment label to
+    # another, in the totals and in its buckets; returns True on success
+    return relabel_sentiments([(entry, old, new)])
+
+def relabel_sentiments(changes):
+    # relabel_sentiment for many (entry, old label, new label) changes, as
+    # one $inc per rollup document
+    targets = {}
+    for entry, old, new in changes:
+        old, new = _field(old or "NEUTRAL"), _field(new or "NEUTRAL")
+        if old == new:
+            continue
+        for _id, fields in _targets(_timestamp(entry)):
+            totals = targets.setdefault(_id, (fields, {}))[1]
+            totals[f"sentiment.{old}"] = totals.get(f"sentiment.{old}", 0) - 1
+            totals[f"sentiment.{new}"] = totals.get(f"sentiment.{new}", 0) + 1
+    ops = [
+        UpdateOne({"_id": _id}, {"$inc": totals, "$setOnInsert": fields}, upsert=True)
+        for _id, (fields, totals) in targets.items()
+    ]
+    if not ops:
+        return True
+    try:
+        rollup_collection.bulk_write(ops, ordered=False)
+        return True
+    except PyMongoError as e:
+        logger.error(f"Analytics relabel failed: {str(e)}")
+        return False
+
+def _apply_claim(token):
+    # Folds the logs claimed under token into the rollups exactly once, even
+    # when re-run after a crash: each rollup document records the token in
+    # the same update that increments it, and skips the increment if it
+    # already has it (the upsert then hits a duplicate key, ignored).
+    entries = 0
+    targets = {}
+    for entry in log_collection.find({"rollup_claim": token}):
+        counters = _counters(entry)
+        for _id, fields in _targets(_timestamp(entry)):
+            totals = targets.setdefault(_id, (fields, {}))[1]
+            for name, amount in counters.items():
+                totals[name] = totals.get(name, 0) + amount
+        entries += 1
+    ops = [
+        UpdateOne(
+            {"_id": _id, "claims": {"$ne": token}},
+            {"$inc": totals, "$setOnInsert": fields, "$addToSet": {"claims": token}},
+            upsert=True
+        )
+        for _id, (fields, totals) in targets.items()
+    ]
+    if ops:
+        try:
+            rollup_collection.bulk_write(ops, ordered=False)
+        except BulkWriteError as e:
+            if any(error.get("code") != DUPLICATE_KEY for error in e.details.get("writeErrors", [])):
+                raise
+    log_collection.update_many({"rollup_claim": token}, {"$set": {"rolled_up": True}, "$unset": {"rollup_claim": ""}})
+    rollup_collection.update_many({"claims": token}, {"$pull": {"claims": token}})
+    return entries
+
+def backfill(batch_size=500, query=None):
+    # Fold logs written before rollups existed (or whose rollup failed) into
+    # the counters. Each batch is first claimed with a token, then counted
+    # once per token (see _apply_claim) and flagged rolled_up, so the job is
+    # safe to re-run or interrupt and never double counts live traffic.
+    # query narrows the logs considered (e.g. only those about to be
+    # compacted).
+    processed = 0
+    abandoned = {"rollup_claim": {"$lt": ObjectId.from_datetime(
+        datetime.datetime.utcnow() - datetime.timedelta(seconds=BACKFILL_CLAIM_TIMEOUT)
+    )}}
+    for token in log_collection.distinct("rollup_claim", abandoned):
+        logger.info(f"Finishing abandoned backfill claim {token}")
+        processed += _apply_claim(token)
+    unclaimed = dict(query or {}, rolled_up={"$ne": True}, rollup_claim={"$exists": False})
+    while True:
+        ids = [entry["_id"] for entry in log_collection.find(unclaimed, {"_id": 1}).limit(batch_size)]
+        if not ids:
+            break
+        token = ObjectId()
+        log_collection.update_many(dict(unclaimed, _id={"$in": ids}), {"$set": {"rollup_claim": token}})
+        processed += _apply_claim(token)
+        logger.info(f"Backfilled {processed} log(s)")
+    logger.info(f"Backfill complete: {processed} log(s) rolled up")
+    return processed
+
+def sentiment_totals():
+    totals = rollup_collection.find_one({"_id": TOTALS_ID}, {"sentiment": 1}) or {}
+    sentiments = totals.get("sentiment", {})
+    return {
+        "positive": sentiments.get("POSITIVE", 0),
+        "negative": sentiments.get("NEGATIVE", 0),
+        "neutral": sentiments.get("NEUTRAL", 0)
+    }
+
+def routing_totals():
+    # How often each sentiment routing tier was taken (see models/routing.py)
+    totals = rollup_collection.find_one({"_id": TOTALS_ID}, {"routing": 1}) or {}
+    tiers = totals.get("routing", {})
+    routed = sum(tiers.values())
+    return {"tiers": tiers, "fast_path_rate": round(tiers.get("fast", 0) / routed, 4) if routed else 0.0}
+
+def _buckets(granularity, since=None, until=None, limit=60, projection=None):
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"Unknown granularity: {granularity}")
+    query = {"granularity": granularity}
+    if since or until:
+        query["bucket"] = {}
+        if since:
+            query["bucket"]["$gte"] = since
+        if until:
+            query["bucket"]["$lt"] = until
+    fields = {"_id": 0, "bucket": 1, "count": 1}
+    fields.update({name: 1 for name in (projection or [])})
+    docs = list(rollup_collection.find(query, fields).sort("bucket", DESCENDING).limit(limit))
+    docs.reverse()
+    return docs
+
+def sentiment_series(granularity="minute", since=None, until=None, limit=60):
+    return [
+        {
+            "bucket": doc["bucket"].isoformat(),
+            "count": doc.get("count", 0),
+            "positive": doc.get("sentiment", {}).get("POSITIVE", 0),
+            "negative": doc.get("sentiment", {}).get("NEGATIVE", 0),
+            "neutral": doc.get("sentiment", {}).get("NEUTRAL", 0)
+        }
+        for doc in _buckets(granularity, since, until, limit, ["sentiment"])
+    ]
+
+def intent_distribution(granularity="hour", since=None, until=None, limit=24):
+    totals = {}
+    series = []
+    for doc in _buckets(granularity, since, until, limit, ["intent"]):
+        intents = doc.get("intent", {})
+        for intent, count in intents.items():
+            totals[intent] = totals.get(intent, 0) + count
+        series.append({"bucket": doc["bucket"].isoformat(), "intents": intents})
+    return {"totals": totals, "series": series}
+
+def top_products(limit=10, granularity=None, since=None, until=None, buckets=24):
+    if granularity is None:
+        counts = (rollup_collection.find_one({"_id": TOTALS_ID}, {"product": 1}) or {}).get("product", {})
+    else:
+        counts = {}
+        for doc in _buckets(granularity, since, until, buckets, ["product"]):
+            for product, count in doc.get("product", {}).items():
+                counts[product] = counts.get(product, 0) + count
+    ranked = sorted(counts.items(), key=lambda item: item[1], reverse=True)[:limit]
+    return [{"product": product, "quantity": count} for product, count in ranked]
@@ -0,0 +1,96 @@
+import numpy as np
+import subprocess
+import struct
+import logging
+import wave
+import io
+
+logger = logging.getLogger(__name__)
+
+# Whisper's input format: 16 kHz mono float32 in [-1, 1]
+SAMPLE_RATE = 16000
+
+def resample(samples, sample_rate, target_rate=SAMPLE_RATE):
+    if sample_rate == target_rate or not len(samples):
+        return samples.astype(np.float32, copy=False)
+    duration = len(samples) / sample_rate
+    target = np.linspace(0, duration, int(duration * target_rate), endpoint=False)
+    return np.interp(target, np.arange(len(samples)) / sample_rate, samples).astype(np.float32)
+
+def pcm16_to_float(data, sample_rate=SAMPLE_RATE):
+    # Little-endian 16-bit mono PCM -> 16 kHz float32
+    samples = np.frombuffer(data[:len(data) - len(data) % 2], dtype="<i2").astype(np.float32) / 32768
+    return resample(samples, sample_rate)
+
+def is_wav(data):
+    return data[:4] == b"RIFF" and data[8:12] == b"WAVE"
+
+def decode_wav(data):
+    # Integer PCM WAV bytes -> 16 kHz mono float32, no temp file or ffmpeg.
+    # Raises wave.Error for formats the stdlib reader doesn't handle.
+    with wave.open(io.BytesIO(data), "rb") as wav:
+        channels = wav.getnchannels()
+        width = wav.getsampwidth()
+        sample_rate = wav.getframerate()
+        frames = wav.readframes(wav.getnframes())
+    if width == 1:
+        samples = (np.frombuffer(frames, dtype=np.uint8).astype(np.float32) - 128) / 128
+    elif width == 2:
+        samples = np.frombuffer(frames, dtype="<i2").astype(np.float32) / 32768
+    elif width == 3:
+        raw = np.frombuffer(frames, dtype=np.uint8).reshape(-1, 3)
+        samples = (raw[:, 0].astype(np.int32) | raw[:, 1].astype(np.int32) << 8 | raw[:, 2].astype(np.int8).astype(np.int32) << 16)
+        samples = samples.astype(np.float32) / 8388608
+    else:
+        samples = np.frombuffer(frames, dtype="<i4").astype(np.float32) / 2147483648
+    if channels > 1:
+        samples = samples[:len(samples) - len(samples) % channels].reshape(-1, channels).mean(axis=1)
+    return resample(samples, sample_rate)
+
+def decode_ffmpeg(data):
+    # Compressed uploads (webm/opus from MediaRecorder, mp3, float WAV):
+    # piped through ffmpeg's stdin/stdout instead of a file on disk
+    cmd = [
+        "ffmpeg", "-nostdin", "-loglevel", "error", "-threads", "0",
+        "-i", "pipe:0",
+        "-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le", "-ar", str(SAMPLE_RATE),
+        "pipe:1"
+    ]
+    try:
+        out = subprocess.run(cmd, input=data, capture_output=True, check=True).stdout
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"Failed to decode audio: {e.stderr.decode(errors='replace').strip()}") from e
+    return pcm16_to_float(out)
+
+def decode_audio(data, sample_rate=None):
+    # Uploaded bytes -> 16 kHz mono float32. Headerless data is taken as raw
+    # 16-bit PCM when the caller says its sample rate.
+    if is_wav(data):
+        try:
+            return decode_wav(data)
+        except (wave.Error, EOFError) as e:
+            logger.info(f"WAV not readable in-process ({str(e)}), decoding with ffmpeg")
+    elif sample_rate:
+        return pcm16_to_float(data, sample_rate)
+    return decode_ffmpeg(data)
+
+def float_to_pcm16(waveform):
+    return (np.clip(waveform, -1.0, 1.0) * 32767).astype("<i2").tobytes()
+
+def wav_header(sample_rate, data_size=None):
+    # 16-bit mono WAV header. Without a data_size the lengths are left at
+    # their maximum, which players accept for audio streamed before its
+    # total length is known.
+    if data_size is None:
+        data_size = 0xFFFFFFFF - 36
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", data_size + 36, b"WAVE",
+        b"fmt ", 16, 1, 1, sample_rate, sample_rate * 2, 2, 16,
+        b"data", data_size
+    )
+
+def encode_wav(waveform, sample_rate):
+    # float waveform -> 16-bit mono WAV bytes
+    pcm = float_to_pcm16(waveform)
+    return wav_header(sample_rate, len(pcm)) + pcm
@@ -0,0 +1,93 @@
+from concurrent.futures import Future
+import threading
+import logging
+import queue
+import time
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class MicroBatcher:
+    # Collects items submitted from many threads and hands them to
+    # run_batch(items) in groups of up to max_batch_size, waiting at most
+    # max_wait_ms for a batch to fill. run_batch returns one result per item,
+    # in order (an exception instance fails only its item), or a Future of
+    # that list when the batch completes elsewhere (a worker process). Only
+    # batches what reaches it concurrently in this process.
+    def __init__(self, run_batch, max_batch_size=8, max_wait_ms=50, name="batcher"):
+        self.run_batch = run_batch
+        self.name = name
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+        self.batches = 0
+        self.items = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, name=self.name, daemon=True)
+        self._thread.start()
+
+    def submit(self, item):
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "pending": self.pending()
+        }
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = [(item, future) for item, future in self._collect() if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            self.batches += 1
+            self.items += len(batch)
+            try:
+                results = self.run_batch([item for item, _ in batch])
+            except Exception as e:
+                self._fail(batch, e)
+                continue
+            if isinstance(results, Future):
+                results.add_done_callback(lambda done, batch=batch: self._resolve_later(batch, done))
+            else:
+                self._resolve(batch, results)
+
+    def _resolve_later(self, batch, done):
+        try:
+            results = done.result()
+        except Exception as e:
+            self._fail(batch, e)
+            return
+        self._resolve(batch, results)
+
+    def _resolve(self, batch, results):
+        for (_, future), result in zip(batch, results):
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def _fail(self, batch, e):
+        logger.error(f"{self.name} batch failed: {str(e)}")
+        for _, future in batch:
+            future.set_exception(e)
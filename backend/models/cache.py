@@ -0,0 +1,85 @@
+from collections import OrderedDict
+import threading
+import time
+
+class LRUCache:
+    # Thread-safe LRU map with an optional per-entry TTL (seconds) and
+    # hit/miss/eviction counters for the /api stats endpoints. With maxbytes
+    # set it is also bounded by the summed sizeof(value) of its entries.
+    def __init__(self, maxsize=1024, ttl=None, maxbytes=None, sizeof=len):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.maxbytes = maxbytes
+        self.sizeof = sizeof
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _remove(self, key):
+        self.bytes -= self._data.pop(key)[2]
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires_at, _ = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                self._remove(key)
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        size = self.sizeof(value) if self.maxbytes else 0
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            if self.maxbytes and size > self.maxbytes:
+                return  # would only evict everything else and then itself
+            self._data[key] = (value, expires_at, size)
+            self.bytes += size
+            while len(self._data) > self.maxsize or (self.maxbytes and self.bytes > self.maxbytes):
+                self._remove(next(iter(self._data)))
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            self._remove(key)
+            return entry[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+
+    def __contains__(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            return entry is not None and (entry[1] is None or entry[1] > time.monotonic())
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        stats = {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+        if self.maxbytes:
+            stats["bytes"] = self.bytes
+            stats["maxbytes"] = self.maxbytes
+        return stats
@@ -1,75 +1,281 @@
-from models.database import cart_collection
-from pymongo.errors import PyMongoError
+from models.database import client, cart_collection, orders_collection, ensure_index
+from models.catalog import get_catalog
+from pymongo import ReturnDocument, UpdateOne, DeleteOne, ASCENDING
+from pymongo.errors import PyMongoError, OperationFailure
+import threading
+import datetime
 import logging
+import time
+import os
 
 logger = logging.getLogger(__name__)
 
-def add_to_cart(product, qty=1):
-    try:
-        logger.info(f"Adding to cart: {qty} x {product}")
-        # Normalize product name for consistent storage
-        normalized_product = product.lower().strip()
-        
-        # Update or insert the item
-        result = cart_collection.update_one(
-            {"product": normalized_product},
+# Cart used when no session is supplied (e.g. running main.py from the CLI)
+DEFAULT_SESSION = "default"
+
+# "mongo" talks to MongoDB directly; "cached" puts CachedCartStore in front of it
+CART_STORE = os.getenv("CART_STORE", "mongo")
+# Other processes (pipeline workers, app) write the same carts, so cached
+# reads are only trusted for this long after loading from MongoDB
+CART_CACHE_TTL = float(os.getenv("CART_CACHE_TTL", "2.0"))
+
+# Every cart query is scoped to one session, so (session_id, product) both
+# serves the lookups and keeps one document per product per cart.
+ensure_index(
+    cart_collection.name,
+    [("session_id", ASCENDING), ("product", ASCENDING)],
+    unique=True,
+    name="session_product"
+)
+
+# Store instance shared by the whole process
+_store = None
+_store_lock = threading.Lock()
+
+def _normalize(product):
+    # Normalize product name for consistent storage
+    return product.lower().strip()
+
+def _item_filter(session_id, normalized_product):
+    return {"session_id": session_id, "product": normalized_product}
+
+def _add_op(session_id, normalized_product, qty):
+    return UpdateOne(_item_filter(session_id, normalized_product), {"$inc": {"quantity": qty}}, upsert=True)
+
+def _remove_ops(session_id, normalized_product, qty):
+    # One atomic decrement clamped at zero, then a cleanup that only matches
+    # a zero row, both in one bulk_write round trip. No other writer can
+    # ever see a negative quantity, and a concurrent add landing between the
+    # two is kept (its row is no longer zero). Reads skip zero rows, so one
+    # left behind by an interrupted write is never shown.
+    item_filter = _item_filter(session_id, normalized_product)
+    return [
+        UpdateOne(item_filter, [{"$set": {"quantity": {"$max": [0, {"$subtract": ["$quantity", qty]}]}}}]),
+        DeleteOne({**item_filter, "quantity": {"$lte": 0}})
+    ]
+
+def _to_ops(entities):
+    # Entity dicts from extract_intents() -> (kind, product, qty) cart ops
+    ops = []
+    for entity in entities:
+        if entity["intent"] == "add_to_cart":
+            ops.append(("add", _normalize(entity["product"]), entity.get("quantity", 1)))
+        elif entity["intent"] == "remove_from_cart":
+            ops.append(("remove", _normalize(entity["product"]), entity.get("quantity", 1)))
+    return ops
+
+class MongoCartStore:
+    # Every call is one round trip to MongoDB
+    def add(self, session_id, product, qty):
+        # Upsert and read back the updated item in a single round trip
+        return cart_collection.find_one_and_update(
+            _item_filter(session_id, product),
             {"$inc": {"quantity": qty}},
-            upsert=True
+            projection={"_id": 0, "session_id": 0},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
         )
-        
-        # Verify the operation
-        if result.upserted_id:
-            logger.info(f"Added new item: {normalized_product}")
+
+    def remove(self, session_id, product, qty):
+        result = cart_collection.bulk_write(_remove_ops(session_id, product, qty), ordered=True)
+        if result.matched_count == 0:
+            logger.warning(f"Product not found: {product}")
+        elif result.deleted_count:
+            logger.info(f"Removed {product} from cart (quantity reached zero)")
         else:
-            logger.info(f"Updated existing item: {normalized_product}")
-            
-        # Return the updated cart item
-        return cart_collection.find_one({"product": normalized_product}, {"_id": 0})
-        
+            logger.info(f"Decremented quantity of {product} by {qty}")
+        return result
+
+    def write(self, ops):
+        # ops: (session_id, kind, product, qty) tuples, applied in order
+        requests = []
+        for session_id, kind, product, qty in ops:
+            if kind == "add":
+                requests.append(_add_op(session_id, product, qty))
+            else:
+                requests.extend(_remove_ops(session_id, product, qty))
+        if not requests:
+            return None
+        result = cart_collection.bulk_write(requests, ordered=True)
+        logger.info(
+            f"Cart bulk write: {result.upserted_count} added, {result.modified_count} updated, "
+            f"{result.deleted_count} removed"
+        )
+        return result
+
+    def items(self, session_id, db_session=None):
+        return list(cart_collection.find(
+            {"session_id": session_id, "quantity": {"$gt": 0}}, {"_id": 0, "session_id": 0}, session=db_session
+        ))
+
+    def _move_cart_to_order(self, session_id, db_session=None):
+        items = self.items(session_id, db_session=db_session)
+        if not items:
+            return None
+        subtotal = get_catalog().price_items(items)
+        order_doc = {
+            "session_id": session_id,
+            "items": items,
+            "subtotal": round(subtotal, 2),
+            "created_at": datetime.datetime.utcnow(),
+            "status": "completed"
+        }
+        orders_collection.insert_one(order_doc, session=db_session)
+        cart_collection.delete_many({"session_id": session_id}, session=db_session)
+        return order_doc
+
+    def checkout(self, session_id):
+        try:
+            with client.start_session() as db_session:
+                return db_session.with_transaction(lambda s: self._move_cart_to_order(session_id, db_session=s))
+        except OperationFailure as e:
+            # Standalone mongod (local stand-in) has no transactions
+            if e.code != 20 and "replica set" not in str(e):
+                raise
+            logger.warning("Transactions unavailable, checking out without one")
+            return self._move_cart_to_order(session_id)
+
+class CachedCartStore:
+    # In-process read cache in front of a backing store; writes go straight
+    # to the backend. Pipeline workers and the app write the same carts from
+    # different processes, so a cached cart is only trusted for ttl seconds
+    # (and dropped by invalidate_cart after a known outside write): opt in
+    # with CART_STORE=cached only where that staleness is acceptable.
+    def __init__(self, backend, ttl=CART_CACHE_TTL):
+        self.backend = backend
+        self.ttl = ttl
+        self._carts = {}       # session_id -> (loaded_at, {product: quantity})
+        self._lock = threading.Lock()
+        self.metrics = {
+            "hits": 0,
+            "misses": 0,
+            "writes": 0
+        }
+
+    def _apply_local(self, cart, kind, product, qty):
+        if kind == "add":
+            cart[product] = cart.get(product, 0) + qty
+        elif product in cart:
+            cart[product] -= qty
+            if cart[product] <= 0:
+                del cart[product]
+
+    def add(self, session_id, product, qty):
+        item = self.backend.add(session_id, product, qty)
+        with self._lock:
+            self.metrics["writes"] += 1
+            cached = self._carts.get(session_id)
+            if cached is not None:
+                cached[1][product] = item.get("quantity", qty)
+        return item
+
+    def remove(self, session_id, product, qty):
+        self.write([(session_id, "remove", product, qty)])
+
+    def write(self, ops):
+        result = self.backend.write(ops)
+        with self._lock:
+            self.metrics["writes"] += len(ops)
+            for session_id, kind, product, qty in ops:
+                cached = self._carts.get(session_id)
+                if cached is not None:
+                    self._apply_local(cached[1], kind, product, qty)
+        return result
+
+    def items(self, session_id):
+        with self._lock:
+            cached = self._carts.get(session_id)
+            if cached is not None and time.monotonic() - cached[0] < self.ttl:
+                self.metrics["hits"] += 1
+                return [{"product": product, "quantity": qty} for product, qty in cached[1].items()]
+            self.metrics["misses"] += 1
+        loaded = {item["product"]: item.get("quantity", 1) for item in self.backend.items(session_id)}
+        with self._lock:
+            self._carts[session_id] = (time.monotonic(), loaded)
+        return [{"product": product, "quantity": qty} for product, qty in loaded.items()]
+
+    def invalidate(self, session_id):
+        with self._lock:
+            self._carts.pop(session_id, None)
+
+    def checkout(self, session_id):
+        with self._lock:
+            self._carts.pop(session_id, None)
+        return self.backend.checkout(session_id)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.metrics)
+            stats["cached_carts"] = len(self._carts)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        stats["mode"] = "cached"
+        return stats
+
+def get_cart_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                backend = MongoCartStore()
+                _store = CachedCartStore(backend) if CART_STORE == "cached" else backend
+                logger.info(f"Cart store: {CART_STORE}")
+    return _store
+
+def cart_store_stats():
+    store = get_cart_store()
+    return store.stats() if hasattr(store, "stats") else {"mode": "direct"}
+
+def invalidate_cart(session_id):
+    # Drop this process's cached copy after another process changed the cart
+    store = get_cart_store()
+    if hasattr(store, "invalidate"):
+        store.invalidate(session_id)
+
+def add_to_cart(session_id, product, qty=1):
+    try:
+        logger.info(f"Adding to cart {session_id}: {qty} x {product}")
+        return get_cart_store().add(session_id, _normalize(product), qty)
     except PyMongoError as e:
         logger.error(f"Cart update failed: {str(e)}")
         raise
 
-def remove_from_cart(product, qty=1):
+def remove_from_cart(session_id, product, qty=1):
     try:
-        normalized_product = product.lower().strip()
-        logger.info(f"Removing {qty} from cart: {normalized_product}")
-        item = cart_collection.find_one({"product": normalized_product})
-        if not item:
-            logger.warning(f"Product not found: {normalized_product}")
-            return
-        new_qty = item.get("quantity", 1) - qty
-        if new_qty > 0:
-            cart_collection.update_one({"product": normalized_product}, {"$set": {"quantity": new_qty}})
-            logger.info(f"Decremented quantity of {normalized_product} to {new_qty}")
-        else:
-            cart_collection.delete_one({"product": normalized_product})
-            logger.info(f"Removed {normalized_product} from cart (quantity zero or less)")
+        normalized_product = _normalize(product)
+        logger.info(f"Removing {qty} from cart {session_id}: {normalized_product}")
+        get_cart_store().remove(session_id, normalized_product, qty)
     except PyMongoError as e:
         logger.error(f"Cart deletion failed: {str(e)}")
         raise
 
-def show_cart():
+def apply_cart_ops(session_id, entities):
+    # entities: dicts from extract_intents(); cart intents are applied in
+    # order with a single bulk write, everything else is ignored.
+    ops = _to_ops(entities)
+    if not ops:
+        return None
     try:
-        logger.info("Retrieving cart contents")
-        items = list(cart_collection.find({}, {"_id": 0}))
+        logger.info(f"Applying {len(ops)} cart operation(s) to {session_id} in one bulk write")
+        return get_cart_store().write([(session_id, kind, product, qty) for kind, product, qty in ops])
+    except PyMongoError as e:
+        logger.error(f"Cart bulk update failed: {str(e)}")
+        raise
+
+def show_cart(session_id):
+    try:
+        logger.info(f"Retrieving cart contents for {session_id}")
+        items = get_cart_store().items(session_id)
         logger.info(f"Found {len(items)} items in cart")
         # Add price and total_price to each item
-        import json
-        try:
-            with open("product.json") as f:
-                products_data = json.load(f)
-            price_map = {p["name"].lower(): p.get("price", 0) for p in products_data}
-        except Exception as e:
-            logger.error(f"Failed to load product prices: {str(e)}")
-            price_map = {}
-        for item in items:
-            product_name = item.get("product", "").lower()
-            price = price_map.get(product_name, 0)
-            quantity = item.get("quantity", 1)
-            item["price"] = price
-            item["total_price"] = price * quantity
+        get_catalog().price_items(items)
         return items
     except PyMongoError as e:
         logger.error(f"Cart retrieval failed: {str(e)}")
-        return []
\ No newline at end of file
+        return []
+
+def checkout(session_id):
+    # Move this session's items to orders atomically; returns the order or
+    # None when the cart is empty.
+    logger.info(f"Checking out cart {session_id}")
+    return get_cart_store().checkout(session_id)
@@ -0,0 +1,138 @@
+import threading
+import hashlib
+import logging
+import json
+import time
+import os
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+PRODUCT_FILE = os.getenv("PRODUCT_FILE", "product.json")
+CATALOG_CHECK_INTERVAL = float(os.getenv("CATALOG_CHECK_INTERVAL", "1.0"))
+
+# Catalog instance shared by the whole process
+_catalog = None
+_catalog_lock = threading.Lock()
+
+def normalize_name(name):
+    return " ".join((name or "").lower().split())
+
+class Catalog:
+    # product.json parsed once and indexed by normalized name and category.
+    # The file's mtime is checked at most every CATALOG_CHECK_INTERVAL seconds;
+    # on change only the added/removed/modified products are re-indexed.
+    def __init__(self, path=PRODUCT_FILE):
+        self.path = path
+        self.version = 0
+        self.etag = None
+        self.json_bytes = b"[]"
+        self._products = []
+        self._by_name = {}
+        self._by_category = {}
+        self._mtime = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._refresh(force=True)
+
+    def _refresh(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._checked_at < CATALOG_CHECK_INTERVAL:
+            return
+        with self._lock:
+            self._checked_at = now
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+            except OSError as e:
+                if self._mtime is not None or force:
+                    logger.error(f"Failed to stat product catalog: {str(e)}")
+                return
+            if mtime == self._mtime:
+                return
+            try:
+                with open(self.path, "rb") as f:
+                    raw = f.read()
+                products = json.loads(raw)
+            except Exception as e:
+                # Keep serving the last good catalog while the file is being edited
+                logger.error(f"Failed to load products: {str(e)}")
+                return
+            self._apply(products)
+            self._mtime = mtime
+
+    def _apply(self, products):
+        new_by_name = {}
+        for prod in products:
+            key = normalize_name(prod.get("name"))
+            if key and key not in new_by_name:
+                new_by_name[key] = prod
+        added = [key for key in new_by_name if key not in self._by_name]
+        removed = [key for key in self._by_name if key not in new_by_name]
+        changed = [key for key in new_by_name if key in self._by_name and self._by_name[key] != new_by_name[key]]
+        for key in removed + changed:
+            self._unindex(self._by_name.pop(key))
+        for key in added + changed:
+            self._by_name[key] = new_by_name[key]
+            self._by_category.setdefault(new_by_name[key].get("category"), []).append(new_by_name[key])
+        self._products = products
+        self.json_bytes = json.dumps(products).encode("utf-8")
+        self.etag = hashlib.sha1(self.json_bytes).hexdigest()
+        self.version += 1
+        logger.info(
+            f"Loaded {len(new_by_name)} products (v{self.version}: "
+            f"+{len(added)} -{len(removed)} ~{len(changed)})"
+        )
+
+    def _unindex(self, prod):
+        bucket = self._by_category.get(prod.get("category"), [])
+        if prod in bucket:
+            bucket.remove(prod)
+        if not bucket:
+            self._by_category.pop(prod.get("category"), None)
+
+    def products(self):
+        self._refresh()
+        return self._products
+
+    def get(self, name):
+        self._refresh()
+        return self._by_name.get(normalize_name(name))
+
+    def price(self, name):
+        prod = self.get(name)
+        return prod.get("price", 0) if prod else 0
+
+    def by_category(self, category):
+        self._refresh()
+        return list(self._by_category.get(category, []))
+
+    def categories(self):
+        self._refresh()
+        return sorted(c for c in self._by_category if c)
+
+    def serialized(self):
+        # Pre-encoded /api/products body and its ETag
+        self._refresh()
+        return self.json_bytes, self.etag
+
+    def price_items(self, items):
+        # Adds price and total_price to cart items in place
+        self._refresh()
+        subtotal = 0.0
+        for item in items:
+            prod = self._by_name.get(normalize_name(item.get("product", "")))
+            price = prod.get("price", 0) if prod else 0
+            quantity = item.get("quantity", 1)
+            item["price"] = price
+            item["total_price"] = price * quantity
+            subtotal += price * quantity
+        return subtotal
+
+def get_catalog():
+    global _catalog
+    if _catalog is None:
+        with _catalog_lock:
+            if _catalog is None:
+                _catalog = Catalog()
+    return _catalog
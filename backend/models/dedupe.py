@@ -0,0 +1,286 @@
+from models.cache import LRUCache
+from models.audio import SAMPLE_RATE
+from models.database import db, ensure_index
+from pymongo import ASCENDING
+from pymongo.errors import DuplicateKeyError
+import numpy as np
+import threading
+import datetime
+import hashlib
+import logging
+import json
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+# Results of recent recordings, keyed by a hash of their normalized PCM, so
+# a resent recording (retry after an error, double-click) skips Whisper,
+# sentiment and TTS. Entries live in memory and on disk (shared by all
+# pipeline workers), each tier bounded in bytes and evicted LRU.
+DEDUPE_CACHE = os.getenv("DEDUPE_CACHE", "1") == "1"
+DEDUPE_TTL = float(os.getenv("DEDUPE_TTL", "3600"))
+DEDUPE_MEMORY_MB = float(os.getenv("DEDUPE_MEMORY_MB", "32"))
+DEDUPE_DISK_MB = float(os.getenv("DEDUPE_DISK_MB", "256"))  # 0: memory only
+DEDUPE_CACHE_DIR = os.getenv("DEDUPE_CACHE_DIR", "audio_files/dedupe_cache")
+# Near-duplicates: recordings whose 64-bit spectral fingerprints differ in
+# at most DEDUPE_NEAR_BITS bits and whose durations are within
+# DEDUPE_NEAR_DURATION of each other. 0: exact matches only; around 6
+# tolerates mild noise (tune with benchmarks/dedupe_cache.py).
+DEDUPE_NEAR_BITS = int(os.getenv("DEDUPE_NEAR_BITS", "0"))
+DEDUPE_NEAR_DURATION = float(os.getenv("DEDUPE_NEAR_DURATION", "0.1"))
+# How long an Idempotency-Key stays claimed once its cart change is applied
+IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", "86400"))
+
+TRIM_LEVEL = 0.02  # of the peak; quieter leading/trailing samples are dropped
+FRAME = 512
+BANDS = 8
+SLOTS = BANDS + 1  # 8 bands x 8 slot-to-slot deltas = 64 bits
+NOISE_FLOOR = 1e-2
+DISK_SCAN_EVERY = 0.05  # of DEDUPE_DISK_MB, see _maybe_evict_disk
+
+idempotency_collection = db['idempotency_keys']
+ensure_index(idempotency_collection.name, [("created_at", ASCENDING)], name="created_at_ttl",
+             expireAfterSeconds=IDEMPOTENCY_TTL)
+
+def _entry_size(entry):
+    return len(entry.get("audio") or b"") + len(json.dumps(entry["meta"], default=str))
+
+_memory_cache = LRUCache(maxsize=1 << 20, ttl=DEDUPE_TTL or None,
+                         maxbytes=int(DEDUPE_MEMORY_MB * 1024 * 1024), sizeof=_entry_size)
+# Fingerprints of cached entries in memory or on disk: key -> (fingerprint, duration)
+_near_index = {}
+_index_lock = threading.Lock()
+_disk_lock = threading.Lock()
+_disk_written = 0  # bytes this process stored since it last evicted
+_stats_lock = threading.Lock()
+_stats = {
+    "hits": 0,
+    "near_hits": 0,
+    "misses": 0,
+    "stores": 0,
+    "disk_hits": 0,
+    "disk_evictions": 0,
+    "cart_replays": 0
+}
+
+def _record(stat, amount=1):
+    with _stats_lock:
+        _stats[stat] += amount
+
+class Probe:
+    # What a recording is looked up and stored by, computed once per upload
+    def __init__(self, samples):
+        pcm = normalize(samples)
+        self.key = hashlib.sha256(pcm.tobytes()).hexdigest()
+        self.duration = len(pcm) / SAMPLE_RATE
+        self.fingerprint = fingerprint(pcm.astype(np.float32)) if DEDUPE_NEAR_BITS > 0 else None
+
+def normalize(samples):
+    # 16 kHz mono float samples -> int16 PCM with leading/trailing silence
+    # trimmed and the peak scaled to full range, so the same recording
+    # re-encoded, padded or played back louder hashes the same
+    samples = np.asarray(samples, dtype=np.float32)
+    peak = float(np.max(np.abs(samples))) if len(samples) else 0.0
+    if peak <= 0:
+        return np.zeros(0, dtype=np.int16)
+    loud = np.flatnonzero(np.abs(samples) >= peak * TRIM_LEVEL)
+    samples = samples[loud[0]:loud[-1] + 1] / peak
+    return np.round(samples * 32767).astype(np.int16)
+
+def fingerprint(pcm):
+    # Log band energies over SLOTS equal stretches of the recording; each bit
+    # says whether a band got louder from one stretch to the next. Robust to
+    # gain, mild noise and a few ms of offset; costs a few ms per clip.
+    count = len(pcm) // FRAME
+    if count < SLOTS:
+        return 0
+    frames = pcm[:count * FRAME].reshape(count, FRAME) * np.hanning(FRAME)
+    power = np.abs(np.fft.rfft(frames, axis=1)) ** 2
+    # Line the slots up on the speech itself: frames 30 dB below the
+    # loudest at either end are dropped, as background noise may have kept
+    # normalize() from trimming them
+    energy = power.sum(axis=1)
+    voiced = np.flatnonzero(energy >= energy.max() * 1e-3)
+    power = power[voiced[0]:voiced[-1] + 1]
+    if len(power) < SLOTS:
+        return 0
+    edges = np.unique(np.geomspace(2, power.shape[1], BANDS + 1).astype(int))
+    bands = np.stack([power[:, lo:hi].sum(axis=1) for lo, hi in zip(edges[:-1], edges[1:])], axis=1)
+    # Bands more than 20 dB below the loudest are floored, so near-silent
+    # ones give stable 0 bits instead of coin flips on noise
+    slots = np.stack([chunk.mean(axis=0) for chunk in np.array_split(bands, SLOTS)])
+    slots = np.log(np.maximum(slots, slots.max() * NOISE_FLOOR + 1e-12))
+    value = 0
+    for bit in (slots[1:] > slots[:-1]).flatten():
+        value = (value << 1) | int(bit)
+    return value
+
+def _close(probe, fingerprint, duration):
+    return (
+        bin(probe.fingerprint ^ fingerprint).count("1") <= DEDUPE_NEAR_BITS
+        and abs(probe.duration - duration) <= DEDUPE_NEAR_DURATION * max(probe.duration, duration)
+    )
+
+def _disk_paths(key):
+    return os.path.join(DEDUPE_CACHE_DIR, f"{key}.json"), os.path.join(DEDUPE_CACHE_DIR, f"{key}.wav")
+
+def _load(key):
+    entry = _memory_cache.get(key)
+    if entry is not None or DEDUPE_DISK_MB <= 0:
+        return entry
+    meta_path, wav_path = _disk_paths(key)
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if DEDUPE_TTL and time.time() - meta["stored_at"] > DEDUPE_TTL:
+            return None
+        audio = None
+        if meta.get("has_audio"):
+            with open(wav_path, "rb") as f:
+                audio = f.read()
+        os.utime(meta_path)  # recency for disk eviction
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning(f"Discarding unreadable dedupe cache entry {key}: {str(e)}")
+        return None
+    entry = {"meta": meta, "audio": audio}
+    _memory_cache.set(key, entry)
+    _record("disk_hits")
+    return entry
+
+def _refresh_index():
+    # Picks up entries other workers wrote to disk since the last lookup
+    if DEDUPE_DISK_MB <= 0 or not os.path.isdir(DEDUPE_CACHE_DIR):
+        return
+    for name in os.listdir(DEDUPE_CACHE_DIR):
+        key = name[:-5]
+        if not name.endswith(".json") or key in _near_index:
+            continue
+        try:
+            with open(os.path.join(DEDUPE_CACHE_DIR, name)) as f:
+                meta = json.load(f)
+            if meta.get("fingerprint") is not None:
+                _near_index[key] = (meta["fingerprint"], meta["duration"])
+        except (OSError, ValueError, KeyError):
+            continue
+
+def lookup(probe):
+    # (entry, "hit" | "near") for a cached recording, else (None, "miss")
+    entry = _load(probe.key)
+    if entry is not None:
+        _record("hits")
+        return entry, "hit"
+    if probe.fingerprint is not None:
+        with _index_lock:
+            _refresh_index()
+            candidates = [key for key, (fp, duration) in _near_index.items() if _close(probe, fp, duration)]
+        for key in candidates:
+            entry = _load(key)
+            if entry is not None:
+                _record("near_hits")
+                return entry, "near"
+            with _index_lock:
+                _near_index.pop(key, None)  # evicted or expired
+    _record("misses")
+    return None, "miss"
+
+def _evict_disk():
+    # Oldest-used entries first until the directory fits DEDUPE_DISK_MB
+    entries = []
+    total = 0
+    for name in os.listdir(DEDUPE_CACHE_DIR):
+        if not name.endswith(".json"):
+            continue
+        meta_path, wav_path = _disk_paths(name[:-5])
+        try:
+            size = os.path.getsize(meta_path) + (os.path.getsize(wav_path) if os.path.exists(wav_path) else 0)
+            entries.append((os.path.getmtime(meta_path), size, name[:-5]))
+        except OSError:
+            continue
+        total += size
+    limit = DEDUPE_DISK_MB * 1024 * 1024
+    for _, size, key in sorted(entries):
+        if total <= limit:
+            break
+        for path in _disk_paths(key):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        total -= size
+        _record("disk_evictions")
+
+def _maybe_evict_disk(size):
+    # Scanning the directory costs a listdir plus a stat per entry, so it
+    # only happens once this process has written another DISK_SCAN_EVERY of
+    # the budget (other workers' writes can overshoot it by as much each)
+    global _disk_written
+    with _disk_lock:
+        _disk_written += size
+        if _disk_written < DEDUPE_DISK_MB * 1024 * 1024 * DISK_SCAN_EVERY:
+            return
+        _disk_written = 0
+        _evict_disk()
+
+def store(probe, result, ops, session_id=None):
+    # ops: the cart operations the result applied, replayed under an
+    # idempotency key on later hits from the same session_id
+    meta = {
+        "key": probe.key,
+        "session_id": session_id,
+        "fingerprint": probe.fingerprint,
+        "duration": round(probe.duration, 3),
+        "stored_at": time.time(),
+        "has_audio": bool(result.get("audio")),
+        "ops": ops,
+        "result": {name: result.get(name) for name in ("transcript", "sentiment", "sentiment_tier", "intent", "response")}
+    }
+    entry = {"meta": meta, "audio": result.get("audio")}
+    _memory_cache.set(probe.key, entry)
+    if probe.fingerprint is not None:
+        with _index_lock:
+            _near_index[probe.key] = (probe.fingerprint, meta["duration"])
+    _record("stores")
+    if DEDUPE_DISK_MB <= 0:
+        return
+    meta_path, wav_path = _disk_paths(probe.key)
+    try:
+        os.makedirs(DEDUPE_CACHE_DIR, exist_ok=True)
+        # Audio first, metadata last: a reader that finds the .json finds both
+        suffix = f".{os.getpid()}.tmp"
+        if entry["audio"]:
+            with open(wav_path + suffix, "wb") as f:
+                f.write(entry["audio"])
+            os.replace(wav_path + suffix, wav_path)
+        with open(meta_path + suffix, "w") as f:
+            json.dump(meta, f)
+        os.replace(meta_path + suffix, meta_path)
+        _maybe_evict_disk(os.path.getsize(meta_path) + (len(entry["audio"]) if entry["audio"] else 0))
+    except OSError as e:
+        logger.warning(f"Failed to persist dedupe cache entry: {str(e)}")
+
+def claim_idempotency_key(session_id, key):
+    # True the first time (session_id, key) is seen; the caller then applies
+    # its cart change. Every later claim, from any worker, returns False.
+    try:
+        idempotency_collection.insert_one({"_id": f"{session_id}:{key}", "created_at": datetime.datetime.utcnow()})
+        return True
+    except DuplicateKeyError:
+        return False
+
+def release_idempotency_key(session_id, key):
+    # The cart change failed: let a retry with the same key apply it
+    idempotency_collection.delete_one({"_id": f"{session_id}:{key}"})
+
+def record_cart_replay():
+    _record("cart_replays")
+
+def dedupe_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats["hits"] + stats["near_hits"] + stats["misses"]
+    stats["hit_rate"] = round((stats["hits"] + stats["near_hits"]) / lookups, 4) if lookups else 0.0
+    stats["memory"] = _memory_cache.stats()
+    return stats
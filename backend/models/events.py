@@ -0,0 +1,72 @@
+import threading
+import logging
+import queue
+import json
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIBER_QUEUE_SIZE = 100
+
+class Subscription:
+    def __init__(self, session_id=None):
+        self.session_id = session_id
+        self.queue = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.closed = False
+
+    def get(self, timeout=None):
+        # Next formatted SSE message, or None on timeout
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+class EventBus:
+    # Fan-out of dashboard updates to Server-Sent Events subscribers in this
+    # process. Events with a session_id only reach that session's streams.
+    def __init__(self):
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self.published = 0
+        self.dropped_subscribers = 0
+
+    def subscribe(self, session_id=None):
+        subscription = Subscription(session_id)
+        with self._lock:
+            self._subscribers.add(subscription)
+        logger.info(f"Event subscriber added ({len(self._subscribers)} connected)")
+        return subscription
+
+    def unsubscribe(self, subscription):
+        subscription.closed = True
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def publish(self, event, data, session_id=None):
+        message = format_sse(event, data)
+        with self._lock:
+            subscribers = list(self._subscribers)
+            self.published += 1
+        for subscription in subscribers:
+            if session_id is not None and subscription.session_id != session_id:
+                continue
+            try:
+                subscription.queue.put_nowait(message)
+            except queue.Full:
+                # A client that stopped reading; it reconnects and reloads the snapshot
+                logger.warning("Dropping slow event subscriber")
+                self.dropped_subscribers += 1
+                self.unsubscribe(subscription)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "subscribers": len(self._subscribers),
+                "published": self.published,
+                "dropped_subscribers": self.dropped_subscribers
+            }
+
+def format_sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+# Bus shared by every request thread in this process
+event_bus = EventBus()
@@ -0,0 +1,94 @@
+import logging
+import shutil
+import os
+
+logger = logging.getLogger(__name__)
+
+# torch: fp32 PyTorch (default); torch-int8: the same model with its Linear
+# layers dynamically quantized to int8; onnx / onnx-int8: the model exported
+# to ONNX Runtime through optimum (pip install optimum[onnxruntime]).
+BACKENDS = ("torch", "torch-int8", "onnx", "onnx-int8")
+INFERENCE_THREADS = int(os.getenv("INFERENCE_THREADS", "0"))  # 0: library default
+ONNX_CACHE_DIR = os.getenv("ONNX_CACHE_DIR", "models_cache/onnx")
+
+def check_backend(backend):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend {backend!r}, expected one of {', '.join(BACKENDS)}")
+    return backend
+
+def configure_threads(threads=INFERENCE_THREADS):
+    # Intra-op threads for torch and ONNX Runtime in this process. Several
+    # pipeline workers on one box should split the cores, not each take all.
+    global INFERENCE_THREADS
+    if threads <= 0:
+        return
+    import torch
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass  # only settable before the first parallel op
+    INFERENCE_THREADS = threads
+    logger.info(f"Inference threads set to {threads}")
+
+def quantize_dynamic(model, linear_types=()):
+    # int8 weights for every nn.Linear, activations quantized on the fly.
+    # quantize_dynamic only matches exact types, so subclasses (Whisper's
+    # Linear, which only casts the weight to the input dtype) are passed in
+    # linear_types and turned back into plain nn.Linear first; on fp32 CPU
+    # they compute the same thing.
+    import torch
+    from torch.ao.nn.quantized.dynamic import Linear as DynamicLinear
+    for module in model.modules():
+        if linear_types and isinstance(module, tuple(linear_types)):
+            module.__class__ = torch.nn.Linear
+    quantized = torch.quantization.quantize_dynamic(model.eval(), {torch.nn.Linear}, dtype=torch.qint8)
+    swapped = sum(isinstance(module, DynamicLinear) for module in quantized.modules())
+    remaining = sum(isinstance(module, torch.nn.Linear) for module in quantized.modules())
+    if not swapped:
+        raise RuntimeError(f"int8 quantization converted no layers of {type(model).__name__}")
+    if remaining:
+        logger.warning(f"int8 quantization left {remaining} Linear layer(s) of {type(model).__name__} in fp32")
+    logger.info(f"Quantized {swapped} Linear layer(s) of {type(model).__name__} to int8")
+    return quantized
+
+def session_options():
+    import onnxruntime
+    options = onnxruntime.SessionOptions()
+    options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if INFERENCE_THREADS > 0:
+        options.intra_op_num_threads = INFERENCE_THREADS
+        options.inter_op_num_threads = 1
+    return options
+
+def load_ort_model(model_cls, model_id, quantize=False):
+    # Exports model_id to ONNX once (and quantizes it once, for int8) under
+    # ONNX_CACHE_DIR; later loads only read the saved graphs
+    try:
+        from optimum.onnxruntime import ORTQuantizer
+        from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    except ImportError as e:
+        raise ImportError("ONNX backends need optimum with ONNX Runtime: pip install optimum[onnxruntime]") from e
+    export_dir = os.path.join(ONNX_CACHE_DIR, model_id.replace("/", "--"))
+    if not os.path.isdir(export_dir):
+        logger.info(f"Exporting {model_id} to ONNX in {export_dir}")
+        model_cls.from_pretrained(model_id, export=True).save_pretrained(export_dir + ".tmp")
+        os.replace(export_dir + ".tmp", export_dir)
+    model_dir = export_dir
+    if quantize:
+        model_dir = export_dir + "-int8"
+        if not os.path.isdir(model_dir):
+            logger.info(f"Quantizing {model_id} ONNX graphs to int8 in {model_dir}")
+            tmp_dir = model_dir + ".tmp"
+            os.makedirs(tmp_dir, exist_ok=True)
+            config = AutoQuantizationConfig.avx2(is_static=False, per_channel=False)
+            for name in sorted(os.listdir(export_dir)):
+                if name.endswith(".onnx"):
+                    quantizer = ORTQuantizer.from_pretrained(export_dir, file_name=name)
+                    quantizer.quantize(save_dir=tmp_dir, quantization_config=config)
+                    # Keep the exported file names so from_pretrained finds them
+                    os.replace(os.path.join(tmp_dir, name[:-5] + "_quantized.onnx"), os.path.join(tmp_dir, name))
+                elif os.path.isfile(os.path.join(export_dir, name)):
+                    shutil.copy(os.path.join(export_dir, name), tmp_dir)
+            os.replace(tmp_dir, model_dir)
+    return model_cls.from_pretrained(model_dir, session_options=session_options())
@@ -1,21 +1,126 @@
-import re
-import json
+from models.catalog import get_catalog
+import threading
 import logging
+import re
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Load products from JSON
-try:
-    with open('product.json') as f:
-        products_data = json.load(f)
-        product_names = [p["name"].lower() for p in products_data]
-        logger.info(f"Loaded {len(product_names)} products")
-except Exception as e:
-    logger.error(f"Failed to load products: {str(e)}")
-    products_data = []
-    product_names = []
+NUMBER_WORDS = {"one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "a": 1, "an": 1}
+METRICS = {"kg", "kilogram", "litre", "liter", "dozen", "dozens", "packet", "packets", "bottle", "bottles", "piece", "pieces"}
+
+# Digits and letters split apart so "5kg rice" reads as "5", "kg", "rice"
+_TOKEN_RE = re.compile(r"\d+|[a-z]+(?:'[a-z]+)*")
+_TERMINAL = "\0"
+
+def tokenize(text):
+    return _TOKEN_RE.findall(text.lower())
+
+class ProductMatcher:
+    # Token trie over normalized product names (plus singular/plural variants
+    # of the last word), built once per catalog. match() walks the utterance
+    # once and returns the longest product mention with its quantity and unit.
+    def __init__(self, products):
+        self.trie = {}
+        self.word_index = {}
+        self.size = 0
+        for order, prod in enumerate(products):
+            name = prod.get("name")
+            if not name:
+                continue
+            tokens = tokenize(name)
+            if not tokens:
+                continue
+            self.size += 1
+            self._insert(tokens, order, name, False)
+            last = tokens[-1]
+            variant = last[:-1] if last.endswith("s") and len(last) > 1 else last + "s"
+            self._insert(tokens[:-1] + [variant], order, name, True)
+            for word in tokens:
+                if word not in self.word_index or self.word_index[word][0] > order:
+                    self.word_index[word] = (order, name)
+
+    def _insert(self, tokens, order, name, is_variant):
+        node = self.trie
+        for token in tokens:
+            node = node.setdefault(token, {})
+        # Longest mention wins, exact spelling before plural variant, then catalog order
+        rank = (-len(" ".join(tokens)), is_variant, order)
+        node.setdefault(_TERMINAL, []).append((rank, name))
+
+    def match(self, text):
+        tokens = tokenize(text)
+        best = None
+        for start in range(len(tokens)):
+            node = self.trie
+            for end in range(start, len(tokens)):
+                node = node.get(tokens[end])
+                if node is None:
+                    break
+                for rank, name in node.get(_TERMINAL, ()):
+                    if best is None or rank < best[0]:
+                        best = (rank, name, start)
+        if best is None:
+            return None
+        _, product, start = best
+        qty = 1
+        metric = None
+        i = start - 1
+        if i >= 0 and tokens[i] in METRICS:
+            metric = tokens[i]
+            i -= 1
+        if i >= 0:
+            if tokens[i].isdigit():
+                qty = int(tokens[i])
+            elif tokens[i] in NUMBER_WORDS:
+                qty = NUMBER_WORDS[tokens[i]]
+        return product, qty, metric
+
+    def match_word(self, text):
+        # Fallback: first product in catalog order sharing any word with the text
+        hits = [self.word_index[token] for token in tokenize(text) if token in self.word_index]
+        return min(hits)[1] if hits else None
+
+# Matcher for the current catalog version, rebuilt when product.json changes
+_matcher = None
+_matcher_version = None
+_matcher_lock = threading.Lock()
+
+def get_matcher():
+    global _matcher, _matcher_version
+    catalog = get_catalog()
+    products = catalog.products()
+    if _matcher_version != catalog.version:
+        with _matcher_lock:
+            if _matcher_version != catalog.version:
+                version = catalog.version
+                _matcher = ProductMatcher(products)
+                _matcher_version = version
+                logger.info(f"Built product matcher over {_matcher.size} products")
+    return _matcher
+
+# Clause boundaries for utterances carrying several commands
+_CLAUSE_SPLIT_RE = re.compile(r",|;|\bthen\b|\band\b")
+CART_INTENTS = ("add_to_cart", "remove_from_cart")
+
+def extract_intents(text):
+    # "add two milk and remove bread" -> one entity dict per clause. Clauses
+    # without a verb inherit the previous one ("add milk and two eggs").
+    clauses = [clause.strip() for clause in _CLAUSE_SPLIT_RE.split(text.lower()) if clause.strip()]
+    if len(clauses) > 1:
+        ops = []
+        last_intent = "unknown"
+        for clause in clauses:
+            entities = extract_intent_entities(clause)
+            if entities["intent"] == "unknown" and entities["product"] != "item":
+                entities["intent"] = last_intent
+            if entities["intent"] in CART_INTENTS and entities["product"] != "item":
+                ops.append(entities)
+                last_intent = entities["intent"]
+        if len(ops) > 1:
+            return ops
+    return [extract_intent_entities(text)]
 
 def extract_intent_entities(text):
     try:
@@ -29,59 +134,15 @@ def extract_intent_entities(text):
             intent = "remove_from_cart"
         elif any(phrase in text for phrase in ["what's in", "show cart", "view cart", "my cart"]):
             intent = "show_cart"
-        # Improved product, quantity, and metric extraction
+        # Product, quantity, and metric extraction from the precomputed index
         qty = 1
         metric = None
-        product = None
-        best_match = None
-        best_match_len = 0
-        metrics_list = ["kg", "kilogram", "litre", "liter", "dozen", "dozens", "packet", "packets", "bottle", "bottles", "piece", "pieces"]
-        for prod in products_data:
-            prod_name = prod["name"].lower()
-            # Look for patterns like '2 kg rice', '3 packets milk', '5kg rice', etc.
-            pattern = r"(\d+|one|two|three|four|five|a|an)?\s*(%s)?\s*%s" % ("|".join(metrics_list), re.escape(prod_name))
-            match = re.search(pattern, text)
-            if not match:
-                # Also try to match patterns like '5kg rice' (no space)
-                pattern_nospace = r"(\d+|one|two|three|four|five|a|an)(%s)%s" % ("|".join(metrics_list), re.escape(prod_name))
-                match = re.search(pattern_nospace, text)
-            if match:
-                if len(prod_name) > best_match_len:
-                    best_match = prod["name"]
-                    best_match_len = len(prod_name)
-                    qty_str = match.group(1)
-                    metric_str = match.group(2)
-                    if qty_str:
-                        if qty_str.isdigit():
-                            qty = int(qty_str)
-                        else:
-                            numbers = {"one":1, "two":2, "three":3, "four":4, "five":5, "a":1, "an":1}
-                            qty = numbers.get(qty_str.lower(), 1)
-                    else:
-                        qty = 1
-                    if metric_str:
-                        metric = metric_str
-                    else:
-                        metric = None
-        if best_match:
-            product = best_match
+        matcher = get_matcher()
+        match = matcher.match(text)
+        if match:
+            product, qty, metric = match
         else:
-            # fallback to old logic for partial matches
-            for prod in products_data:
-                prod_name = prod["name"].lower()
-                # Try to match any single word from the product name
-                for word in prod_name.split():
-                    if word in text.split():
-                        product = prod["name"]
-                        break
-                if product:
-                    break
-            if not product:
-                for prod in products_data:
-                    prod_name = prod["name"].lower()
-                    if prod_name in text or prod_name.rstrip('s') in text or (prod_name + 's') in text:
-                        product = prod["name"]
-                        break
+            product = matcher.match_word(text)
         if not product:
             product = "item"
         logger.info(f"Extracted entities - Intent: {intent}, Product: {product}, Qty: {qty}, Metric: {metric}")
@@ -0,0 +1,227 @@
+from models.database import log_collection
+from bson import ObjectId, json_util
+from pymongo.errors import PyMongoError, BulkWriteError
+import threading
+import logging
+import atexit
+import queue
+import glob
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_FLUSH_SIZE = int(os.getenv("LOG_FLUSH_SIZE", "100"))
+LOG_FLUSH_INTERVAL_MS = float(os.getenv("LOG_FLUSH_INTERVAL_MS", "500"))
+LOG_SPILL_DIR = os.getenv("LOG_SPILL_DIR", "audio_files/log_spill")
+LOG_REPLAY_INTERVAL = float(os.getenv("LOG_REPLAY_INTERVAL", "30"))
+DUPLICATE_KEY = 11000
+
+# Writer instance shared by the whole process
+_writer = None
+_writer_lock = threading.Lock()
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # exists, owned by someone else
+    return True
+
+class InteractionLogWriter:
+    # Buffers interaction logs in a bounded queue and writes them with
+    # insert_many from a background thread, off the request path. Batches that
+    # cannot reach MongoDB are appended to a per-process JSONL spill file and
+    # replayed (from any process's spill file) after the next good flush.
+    def __init__(self, collection=log_collection, maxsize=LOG_QUEUE_SIZE, flush_size=LOG_FLUSH_SIZE,
+                 flush_interval_ms=LOG_FLUSH_INTERVAL_MS, spill_dir=LOG_SPILL_DIR):
+        self.collection = collection
+        self.flush_size = max(1, flush_size)
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.spill_dir = spill_dir
+        self.spill_file = os.path.join(spill_dir, f"interactions-{os.getpid()}.jsonl")
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._last_replay = 0.0
+        self.metrics = {
+            "enqueued": 0,
+            "written": 0,
+            "dropped": 0,
+            "spilled": 0,
+            "replayed": 0,
+            "flushes": 0,
+            "flush_failures": 0,
+            "last_flush_ms": 0.0,
+            "max_flush_ms": 0.0,
+            "total_flush_ms": 0.0
+        }
+        self._thread = threading.Thread(target=self._loop, name="log-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self.metrics[name] += amount
+
+    def write(self, record):
+        # Never blocks the caller; returns False when the record was dropped
+        record.setdefault("_id", ObjectId())  # fixed up front so replays are idempotent
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self._count("dropped")
+            logger.warning("Interaction log queue full, dropping record")
+            return False
+        self._count("enqueued")
+        if self._queue.qsize() >= self.flush_size:
+            self._wakeup.set()
+        return True
+
+    def _drain(self, limit):
+        batch = []
+        while len(batch) < limit:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _insert(self, records):
+        try:
+            self.collection.insert_many(records, ordered=False)
+        except BulkWriteError as e:
+            # Records already written by an earlier, partially failed attempt
+            if any(error.get("code") != DUPLICATE_KEY for error in e.details.get("writeErrors", [])):
+                raise
+
+    def _spill(self, records):
+        try:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            with open(self.spill_file, "a") as f:
+                for record in records:
+                    f.write(json_util.dumps(record) + "\n")
+            self._count("spilled", len(records))
+        except OSError as e:
+            self._count("dropped", len(records))
+            logger.error(f"Failed to spill {len(records)} interaction log(s): {str(e)}")
+
+    def _claim(self):
+        # Spill files nobody is replaying: unclaimed ones, this process's
+        # earlier claims (a failed replay keeps its claim), and claims left
+        # behind by a process that died mid-replay. Renaming is atomic, so
+        # only one process gets to replay each file.
+        paths = [(path, path) for path in glob.glob(os.path.join(self.spill_dir, "*.jsonl"))]
+        for claimed in glob.glob(os.path.join(self.spill_dir, "*.jsonl.replay-*")):
+            path, _, pid = claimed.rpartition(".replay-")
+            if pid.isdigit() and (int(pid) == os.getpid() or not _alive(int(pid))):
+                paths.append((claimed, path))
+        for current, path in paths:
+            claimed = f"{path}.replay-{os.getpid()}"
+            try:
+                os.rename(current, claimed)
+            except OSError:
+                continue
+            yield path, claimed
+
+    def _load(self, path, claimed):
+        # Lines that don't parse (a spill cut short by a crash, a bad disk
+        # write) go to <file>.bad for inspection instead of blocking the rest
+        records = []
+        bad = []
+        with open(claimed, errors="replace") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    records.append(json_util.loads(line))
+                except (ValueError, TypeError):
+                    bad.append(line if line.endswith("\n") else line + "\n")
+        if bad:
+            logger.warning(f"Quarantining {len(bad)} unreadable line(s) of {path} in {path}.bad")
+            with open(f"{path}.bad", "a") as f:
+                f.writelines(bad)
+        return records
+
+    def _replay(self):
+        for path, claimed in self._claim():
+            try:
+                records = self._load(path, claimed)
+                for start in range(0, len(records), self.flush_size):
+                    self._insert(records[start:start + self.flush_size])
+            except (PyMongoError, OSError) as e:
+                # Stays claimed by this process (renaming it back could
+                # clobber a new spill file of the same name)
+                logger.warning(f"Replay of {path} failed, keeping it for later: {str(e)}")
+                return
+            os.remove(claimed)
+            self._count("replayed", len(records))
+            logger.info(f"Replayed {len(records)} spilled interaction log(s) from {path}")
+
+    def flush(self):
+        with self._flush_lock:
+            written = 0
+            while True:
+                batch = self._drain(self.flush_size)
+                if not batch:
+                    break
+                start = time.perf_counter()
+                try:
+                    self._insert(batch)
+                except PyMongoError as e:
+                    logger.error(f"Interaction log flush failed, spilling {len(batch)} record(s): {str(e)}")
+                    self._count("flush_failures")
+                    self._spill(batch + self._drain(self._queue.qsize()))
+                    return written
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                written += len(batch)
+                with self._lock:
+                    self.metrics["written"] += len(batch)
+                    self.metrics["flushes"] += 1
+                    self.metrics["last_flush_ms"] = round(elapsed_ms, 2)
+                    self.metrics["max_flush_ms"] = round(max(self.metrics["max_flush_ms"], elapsed_ms), 2)
+                    self.metrics["total_flush_ms"] += elapsed_ms
+            # Replay right after MongoDB proves reachable again, else periodically
+            if os.path.isdir(self.spill_dir) and (written or time.monotonic() - self._last_replay >= LOG_REPLAY_INTERVAL):
+                self._last_replay = time.monotonic()
+                self._replay()
+            return written
+
+    def _loop(self):
+        while True:
+            # Flush every interval, or as soon as a full batch is waiting
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Interaction log writer error: {str(e)}")
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.metrics)
+        stats["queue_depth"] = self._queue.qsize()
+        stats["avg_flush_ms"] = round(stats.pop("total_flush_ms") / stats["flushes"], 2) if stats["flushes"] else 0.0
+        return stats
+
+def get_log_writer():
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = InteractionLogWriter()
+    return _writer
+
+def log_interaction(record):
+    return get_log_writer().write(record)
+
+def log_writer_stats():
+    # This process's writer stats, or None before it has logged anything.
+    # Pipeline workers return them with each job (see models/pipeline.py).
+    if _writer is None:
+        return None
+    return dict(_writer.stats(), pid=os.getpid())
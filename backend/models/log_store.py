@@ -0,0 +1,147 @@
+from models.database import db, log_collection, ensure_index
+from models.analytics import backfill
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import ASCENDING, DESCENDING
+import datetime
+import logging
+import itertools
+import os
+
+logger = logging.getLogger(__name__)
+
+LOG_PAGE_SIZE = int(os.getenv("LOG_PAGE_SIZE", "20"))
+LOG_PAGE_MAX = int(os.getenv("LOG_PAGE_MAX", "200"))
+# Raw logs older than LOG_RETENTION_DAYS (0: keep forever) leave the logs
+# collection once they are counted in the analytics rollups:
+#   archive: compact_logs() moves them into hourly buckets in logs_archive,
+#            themselves expired after LOG_ARCHIVE_DAYS (0: kept forever)
+#   ttl:     a TTL index deletes them; only the rollups remain
+LOG_RETENTION_DAYS = float(os.getenv("LOG_RETENTION_DAYS", "30"))
+LOG_RETENTION_MODE = os.getenv("LOG_RETENTION_MODE", "archive")
+LOG_ARCHIVE_DAYS = float(os.getenv("LOG_ARCHIVE_DAYS", "365"))
+LOG_ARCHIVE_BUCKET_SIZE = int(os.getenv("LOG_ARCHIVE_BUCKET_SIZE", "500"))
+RETENTION_MODES = ("archive", "ttl")
+
+archive_collection = db['logs_archive']
+SENTIMENTS = ("POSITIVE", "NEGATIVE", "NEUTRAL")
+# Never returned by query_logs: the session id is the only credential for a
+# shopper's cart, jobs and reply audio, and the rest is bookkeeping
+PRIVATE_FIELDS = {"session_id": 0, "rolled_up": 0, "rollup_claim": 0}
+
+# Logs are paged newest first by _id (an ObjectId, so roughly creation
+# order), and time ranges become _id bounds too. Each filter combination
+# then reads one index range in sort order and stops after a page, however
+# many logs there are.
+LOG_INDEXES = [
+    ([("sentiment", ASCENDING), ("_id", DESCENDING)], {"name": "sentiment_id"}),
+    ([("intent.intent", ASCENDING), ("_id", DESCENDING)], {"name": "intent_id"}),
+    ([("intent.intent", ASCENDING), ("sentiment", ASCENDING), ("_id", DESCENDING)], {"name": "intent_sentiment_id"})
+]
+if LOG_RETENTION_DAYS > 0 and LOG_RETENTION_MODE == "ttl":
+    # Partial, so logs the rollups have not counted yet never expire
+    LOG_INDEXES.append(([("created_at", ASCENDING)], {
+        "name": "retention_ttl",
+        "expireAfterSeconds": int(LOG_RETENTION_DAYS * 86400),
+        "partialFilterExpression": {"rolled_up": True}
+    }))
+
+for keys, options in LOG_INDEXES:
+    ensure_index(log_collection.name, keys, **options)
+if LOG_ARCHIVE_DAYS > 0:
+    ensure_index(archive_collection.name, [("bucket", ASCENDING)], name="bucket_ttl",
+                 expireAfterSeconds=int(LOG_ARCHIVE_DAYS * 86400))
+else:
+    ensure_index(archive_collection.name, [("bucket", ASCENDING)], name="bucket")
+
+def _object_id(value):
+    try:
+        return ObjectId(value)
+    except (InvalidId, TypeError):
+        raise ValueError(f"Invalid cursor: {value!r}")
+
+def _filter(sentiment=None, intent=None, since=None, until=None, cursor=None):
+    query = {}
+    if sentiment:
+        if sentiment.upper() not in SENTIMENTS:
+            raise ValueError(f"Unknown sentiment: {sentiment}")
+        query["sentiment"] = sentiment.upper()
+    if intent:
+        query["intent.intent"] = intent
+    bounds = {}
+    if since:
+        bounds["$gte"] = ObjectId.from_datetime(since)
+    # The cursor is the last _id of the previous page; the next page starts
+    # strictly below it (and below until, whichever is lower)
+    upper = [ObjectId.from_datetime(until)] if until else []
+    if cursor:
+        upper.append(_object_id(cursor))
+    if upper:
+        bounds["$lt"] = min(upper)
+    if bounds:
+        query["_id"] = bounds
+    return query
+
+def query_logs(limit=LOG_PAGE_SIZE, cursor=None, sentiment=None, intent=None, since=None, until=None,
+               collection=log_collection):
+    # One page of logs, newest first, plus the cursor for the next page
+    # (None on the last one)
+    limit = max(1, min(limit, LOG_PAGE_MAX))
+    query = _filter(sentiment, intent, since, until, cursor)
+    docs = list(collection.find(query, PRIVATE_FIELDS).sort("_id", DESCENDING).limit(limit + 1))
+    next_cursor = str(docs[limit - 1]["_id"]) if len(docs) > limit else None
+    logs = []
+    for doc in docs[:limit]:
+        doc["id"] = str(doc.pop("_id"))
+        logs.append(doc)
+    return {"logs": logs, "next_cursor": next_cursor}
+
+def _hour(log_id):
+    return log_id.generation_time.replace(tzinfo=None, minute=0, second=0, microsecond=0)
+
+def _archive(docs):
+    # Buckets named after their first log, so re-running a batch that was
+    # archived but not yet deleted (a crash in between) rewrites nothing
+    written = 0
+    for hour, group in itertools.groupby(docs, key=lambda doc: _hour(doc["_id"])):
+        group = list(group)
+        for start in range(0, len(group), LOG_ARCHIVE_BUCKET_SIZE):
+            chunk = group[start:start + LOG_ARCHIVE_BUCKET_SIZE]
+            archive_collection.update_one(
+                {"_id": chunk[0]["_id"]},
+                {"$setOnInsert": {
+                    "bucket": hour,
+                    "count": len(chunk),
+                    "last_id": chunk[-1]["_id"],
+                    "logs": chunk
+                }},
+                upsert=True
+            )
+            written += 1
+    log_collection.delete_many({"_id": {"$in": [doc["_id"] for doc in docs]}})
+    return written
+
+def compact_logs(retention_days=LOG_RETENTION_DAYS, mode=LOG_RETENTION_MODE, batch_size=1000):
+    # Folds raw logs past the retention window into the analytics rollups,
+    # then (archive mode) moves them out of the logs collection. Safe to
+    # re-run: rollups are only ever added once per log (see backfill).
+    if mode not in RETENTION_MODES:
+        raise ValueError(f"Unknown retention mode {mode!r}, expected one of {', '.join(RETENTION_MODES)}")
+    if retention_days <= 0:
+        logger.info("Log retention disabled, nothing to compact")
+        return {"rolled_up": 0, "archived": 0, "buckets": 0}
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=retention_days)
+    old = {"_id": {"$lt": ObjectId.from_datetime(cutoff)}}
+    rolled_up = backfill(batch_size, query=old)
+    archived = buckets = 0
+    if mode == "archive":
+        query = dict(old, rolled_up=True)
+        while True:
+            docs = list(log_collection.find(query).sort("_id", ASCENDING).limit(batch_size))
+            if not docs:
+                break
+            buckets += _archive(docs)
+            archived += len(docs)
+            logger.info(f"Archived {archived} log(s) into {buckets} bucket(s)")
+    logger.info(f"Compaction complete: {rolled_up} rolled up, {archived} archived (cutoff {cutoff.isoformat()})")
+    return {"rolled_up": rolled_up, "archived": archived, "buckets": buckets}
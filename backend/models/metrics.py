@@ -0,0 +1,211 @@
+import contextvars
+import functools
+import threading
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds; stages range from sub-millisecond cart lookups
+# to multi-second transcriptions
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+class Histogram:
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {labels: list(series) for labels, series in self._series.items()}
+        for labels, series in sorted(snapshot.items()):
+            names = self.labelnames + ("le",)
+            for bound, count in zip(self.buckets, series):
+                lines.append(f"{self.name}_bucket{_labels(names, labels + (repr(float(bound)),))} {count}")
+            lines.append(f"{self.name}_bucket{_labels(names, labels + ('+Inf',))} {series[-1]}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {series[-2]}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {series[-1]}")
+        return lines
+
+class Counter:
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            snapshot = dict(self._values)
+        for labels, value in sorted(snapshot.items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {value}")
+        return lines
+
+class Gauge:
+    # Read from a callback at scrape time, so existing stats() dicts can be
+    # exported without being kept in sync
+    def __init__(self, name, help_text, fn):
+        self.name = name
+        self.help_text = help_text
+        self.fn = fn
+
+    def render(self):
+        try:
+            value = self.fn()
+        except Exception as e:
+            logger.warning(f"Gauge {self.name} failed: {str(e)}")
+            return []
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge", f"{self.name} {value}"]
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name, help_text, fn):
+        return self._register(Gauge(name, help_text, fn))
+
+    def render(self):
+        # Prometheus text exposition format
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+# Registry shared by everything in this process
+registry = Registry()
+stage_seconds = registry.histogram("pipeline_stage_seconds", "Time spent in each pipeline stage", ("stage",))
+
+# Stage timings of the request or job running in this context
+_current = contextvars.ContextVar("stage_timings", default=None)
+
+# In pipeline workers, whose registry nobody scrapes, spans outside any
+# trace (deferred sentiment, background threads) are held here until the
+# next job carries them back to the app (see hold_untraced)
+UNTRACED_LIMIT = 10000
+_untraced = None
+_untraced_lock = threading.Lock()
+
+def _observe_untraced(stage, seconds):
+    if _untraced is None:
+        stage_seconds.observe(seconds, stage)
+        return
+    with _untraced_lock:
+        if len(_untraced) < UNTRACED_LIMIT:
+            _untraced.append((stage, seconds))
+
+def hold_untraced():
+    global _untraced
+    _untraced = []
+
+def drain_untraced():
+    # [(stage, seconds), ...] held since the last call
+    global _untraced
+    with _untraced_lock:
+        if _untraced is None:
+            return []
+        held, _untraced = _untraced, []
+    return held
+
+class span:
+    # Times a pipeline stage: "with span('stt'):" or "@span('stt')". Inside
+    # a trace() the time is added to that trace (repeated stages add up);
+    # otherwise it goes straight into pipeline_stage_seconds.
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self._start
+        timings = _current.get()
+        if timings is None:
+            _observe_untraced(self.stage, elapsed)
+        else:
+            timings[self.stage] = timings.get(self.stage, 0.0) + elapsed
+        return False
+
+    def __call__(self, fn):
+        # A fresh span per call, so concurrent calls don't share a start time
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(self.stage):
+                return fn(*args, **kwargs)
+        return wrapper
+
+class trace:
+    # Collects the spans of one request or job into a {stage: seconds} dict
+    def __enter__(self):
+        self.timings = {}
+        self._token = _current.set(self.timings)
+        return self.timings
+
+    def __exit__(self, *exc):
+        _current.reset(self._token)
+        return False
+
+def add_timings(timings):
+    # Stage timings measured elsewhere (a pipeline worker) join the current trace
+    current = _current.get()
+    for stage, seconds in (timings or {}).items():
+        if current is None:
+            _observe_untraced(stage, seconds)
+        else:
+            current[stage] = current.get(stage, 0.0) + seconds
+
+def observe(timings):
+    for stage, seconds in timings.items():
+        stage_seconds.observe(seconds, stage)
+
+def observe_each(observations):
+    # (stage, seconds) pairs a worker held back (see drain_untraced)
+    for stage, seconds in observations or ():
+        stage_seconds.observe(seconds, stage)
+
+def server_timing(timings):
+    # Server-Timing header value, durations in milliseconds
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items())
@@ -0,0 +1,316 @@
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from models.batching import MicroBatcher
+from models.tts import split_clauses
+from models.metrics import registry, span, trace, add_timings, hold_untraced, drain_untraced
+from models.database import connection_uri
+from models.interaction_log import log_writer_stats
+import multiprocessing
+import threading
+import logging
+import os
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+PIPELINE_WORKERS = int(os.getenv("PIPELINE_WORKERS", "1"))
+PIPELINE_TIMEOUT = float(os.getenv("PIPELINE_TIMEOUT", "30"))
+# Default split of the machine's cores between workers (INFERENCE_THREADS overrides)
+WORKER_THREADS = max(1, (os.cpu_count() or 1) // max(1, PIPELINE_WORKERS))
+# Uploads that arrive within STT_MAX_WAIT_MS of each other go to one worker
+# as a single job and share one batched Whisper pass
+STT_BATCHING = os.getenv("STT_BATCHING", "0") == "1"
+STT_MAX_BATCH_SIZE = int(os.getenv("STT_MAX_BATCH_SIZE", "8"))
+STT_MAX_WAIT_MS = float(os.getenv("STT_MAX_WAIT_MS", "50"))
+# Streaming uploads transcribe on their own workers (Whisper only), so
+# partial transcripts never queue behind full uploads. Partials are skipped,
+# not queued, while STREAM_MAX_PENDING transcriptions per worker are running.
+STREAM_WORKERS = int(os.getenv("STREAM_WORKERS", "1"))
+STREAM_MAX_PENDING = int(os.getenv("STREAM_MAX_PENDING", "2"))
+# Streamed replies (/api/response-audio/stream) synthesize on their own
+# workers (TTS only), so the first clause never queues behind uploads
+SPEECH_WORKERS = int(os.getenv("SPEECH_WORKERS", "1"))
+
+timeouts_total = registry.counter("pipeline_timeouts_total", "Jobs whose caller stopped waiting, by whether they were cancelled", ("outcome",))
+
+# Engine instance shared by all request threads
+_engine = None
+_engine_lock = threading.Lock()
+
+class StillRunning(FutureTimeout):
+    # The caller's timeout passed after a worker had started the job: it can
+    # no longer be cancelled and will still change the cart. future resolves
+    # to the job's result.
+    def __init__(self, future):
+        super().__init__("Pipeline job still running after the timeout")
+        self.future = future
+
+def _init_worker():
+    # Runs once in every worker process: load the models up front so that
+    # jobs only pay for inference, never for imports or weight loading.
+    from models.inference import configure_threads, INFERENCE_THREADS
+    from models.stt import load_model
+    from models.sentiment import get_sentiment_pipeline
+    from models.tts import get_tts
+    from main import prewarm_responses
+    from models.database import get_client
+    logger.info(f"Preloading models in worker {os.getpid()}")
+    hold_untraced()
+    if INFERENCE_THREADS or PIPELINE_WORKERS > 1:
+        configure_threads(INFERENCE_THREADS or WORKER_THREADS)
+    load_model()
+    get_sentiment_pipeline()
+    get_tts()
+    prewarm_responses()
+    get_client()  # open this worker's own connection pool now
+    logger.info(f"Worker {os.getpid()} ready")
+
+def _init_stream_worker():
+    from models.inference import configure_threads, INFERENCE_THREADS
+    from models.stt import load_model
+    logger.info(f"Preloading Whisper in stream worker {os.getpid()}")
+    hold_untraced()
+    configure_threads(INFERENCE_THREADS or max(1, (os.cpu_count() or 1) // max(1, PIPELINE_WORKERS + STREAM_WORKERS)))
+    load_model()
+    logger.info(f"Stream worker {os.getpid()} ready")
+
+def _init_speech_worker():
+    from models.inference import configure_threads, INFERENCE_THREADS
+    from models.tts import get_tts
+    from main import prewarm_responses
+    logger.info(f"Preloading TTS in speech worker {os.getpid()}")
+    hold_untraced()
+    configure_threads(INFERENCE_THREADS or max(1, (os.cpu_count() or 1) // max(1, PIPELINE_WORKERS + SPEECH_WORKERS)))
+    get_tts()
+    prewarm_responses()
+    logger.info(f"Speech worker {os.getpid()} ready")
+
+def _traced(fn, *args):
+    # Stage timings measured in the worker travel back with the result,
+    # along with any the worker measured outside a job since the last one
+    # and the stats of the worker's interaction log writer
+    with trace() as timings:
+        with span("worker"):
+            result = fn(*args)
+    result["timings"] = timings
+    result["untraced_timings"] = drain_untraced()
+    result["log_writer"] = log_writer_stats()
+    return result
+
+def _timed(fn, *args):
+    # _traced for jobs whose result isn't a dict: (result, stage timings)
+    with trace() as timings:
+        with span("worker"):
+            result = fn(*args)
+    return result, timings
+
+def _run_job(audio, session_id, sample_rate=None, speak=True, idempotency_key=None):
+    from main import run_pipeline
+    return _traced(run_pipeline, audio, session_id, sample_rate, speak, idempotency_key)
+
+def _run_batch_job(jobs):
+    from main import run_pipeline_batch
+    with trace() as timings:
+        with span("worker"):
+            results = run_pipeline_batch(jobs)
+    untraced = drain_untraced()
+    log_writer = log_writer_stats()
+    for result in results:
+        if isinstance(result, dict):
+            result["timings"]["worker"] = timings["worker"]
+            result["untraced_timings"], untraced = untraced, []
+            result["log_writer"] = log_writer
+    return results
+
+def _run_text_job(text, session_id, speak=True):
+    from main import run_text_pipeline
+    return _traced(run_text_pipeline, text, session_id, speak)
+
+def _run_speech_job(clause, leading_gap):
+    from models.tts import speak_clause
+    return _timed(span("tts")(speak_clause), clause, leading_gap)
+
+def _run_transcribe_job(samples):
+    from models.stt import transcribe_audio
+    return _timed(transcribe_audio, samples)
+
+def _ping():
+    return os.getpid()
+
+class PipelineEngine:
+    def __init__(self, workers=PIPELINE_WORKERS, batching=STT_BATCHING):
+        self.workers = max(1, workers)
+        self._lock = threading.Lock()
+        self._executor = self._create_executor()
+        self._stream_executor = None  # started by the first streaming upload
+        self._stream_jobs = 0
+        self._speech_executor = None  # started by the first streamed reply
+        # Runs in the app process, where concurrent uploads meet: each batch
+        # becomes one _run_batch_job, submitted without waiting so the next
+        # batch fills (and can go to another worker) while this one runs
+        self._batcher = MicroBatcher(
+            self._submit_batch, STT_MAX_BATCH_SIZE, STT_MAX_WAIT_MS, name="upload-batcher"
+        ) if batching else None
+
+    def _create_executor(self, workers=None, initializer=_init_worker, name="pipeline"):
+        # "spawn" keeps torch and the MongoDB client out of a forked Flask process
+        workers = workers or self.workers
+        logger.info(f"Starting {name} pool with {workers} worker(s)")
+        connection_uri()  # workers inherit a resolved MONGODB_URI (e.g. the in-memory mongod)
+        return ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=initializer
+        )
+
+    def _restart(self, executor):
+        with self._lock:
+            if self._executor is executor:
+                logger.warning("Pipeline worker pool broken, restarting")
+                executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = self._create_executor()
+            return self._executor
+
+    def _submit(self, fn, *args):
+        executor = self._executor
+        try:
+            return executor.submit(fn, *args)
+        except BrokenProcessPool:
+            return self._restart(executor).submit(fn, *args)
+
+    def _wait(self, future, timeout):
+        executor = self._executor
+        try:
+            return future.result(timeout=timeout)
+        except BrokenProcessPool:
+            # A worker died mid-job (e.g. OOM); replace the pool for the next request
+            self._restart(executor)
+            raise
+        except FutureTimeout:
+            # Not started yet: dropped, so the caller may safely retry.
+            # Started: the worker will finish it anyway, so hand it back.
+            if future.cancel():
+                timeouts_total.inc("cancelled")
+                raise
+            timeouts_total.inc("late")
+            raise StillRunning(future) from None
+
+    def _submit_batch(self, jobs):
+        executor = self._executor
+        future = self._submit(_run_batch_job, jobs)
+        future.add_done_callback(lambda done: self._check_pool(executor, done))
+        return future
+
+    def _check_pool(self, executor, future):
+        if not future.cancelled() and isinstance(future.exception(), BrokenProcessPool):
+            self._restart(executor)
+
+    def submit(self, audio, session_id, sample_rate=None, speak=True, idempotency_key=None):
+        # audio: a file path or the uploaded bytes, decoded in the worker
+        if self._batcher is not None:
+            return self._batcher.submit((audio, session_id, sample_rate, speak, idempotency_key))
+        executor = self._executor
+        future = self._submit(_run_job, audio, session_id, sample_rate, speak, idempotency_key)
+        future.add_done_callback(lambda done: self._check_pool(executor, done))
+        return future
+
+    def process(self, audio, session_id, timeout=PIPELINE_TIMEOUT, sample_rate=None, speak=True, idempotency_key=None):
+        return self._wait(self.submit(audio, session_id, sample_rate, speak, idempotency_key), timeout)
+
+    def _stream_pool(self):
+        with self._lock:
+            if self._stream_executor is None:
+                self._stream_executor = self._create_executor(STREAM_WORKERS, _init_stream_worker, "stream")
+            return self._stream_executor
+
+    def _speech_pool(self):
+        with self._lock:
+            if self._speech_executor is None:
+                self._speech_executor = self._create_executor(SPEECH_WORKERS, _init_speech_worker, "speech")
+            return self._speech_executor
+
+    def _discard_pool(self, attr, executor, name):
+        # A broken stream or speech pool is replaced on its next use
+        with self._lock:
+            if getattr(self, attr) is executor:
+                logger.warning(f"{name} worker pool broken, restarting on next use")
+                executor.shutdown(wait=False, cancel_futures=True)
+                setattr(self, attr, None)
+
+    def _stream_done(self, executor, job, future):
+        # Resolves the caller's future with the transcript; the job's stage
+        # timings join this process's metrics
+        with self._lock:
+            self._stream_jobs -= 1
+        try:
+            result, timings = job.result()
+        except BaseException as e:
+            if isinstance(e, BrokenProcessPool):
+                self._discard_pool("_stream_executor", executor, "Stream")
+            future.set_exception(e)
+            return
+        add_timings(timings)
+        future.set_result(result)
+
+    def submit_transcription(self, samples, partial=False):
+        # 16 kHz mono float32 samples -> future resolving to the transcript,
+        # or None for a partial the stream workers are too busy for
+        with self._lock:
+            if partial and self._stream_jobs >= STREAM_WORKERS * STREAM_MAX_PENDING:
+                return None
+            self._stream_jobs += 1
+        executor = self._stream_pool()
+        future = Future()
+        try:
+            job = executor.submit(_run_transcribe_job, samples)
+        except Exception:
+            with self._lock:
+                self._stream_jobs -= 1
+            raise
+        job.add_done_callback(lambda job: self._stream_done(executor, job, future))
+        return future
+
+    def process_text(self, text, session_id, timeout=PIPELINE_TIMEOUT, speak=True):
+        return self._wait(self._submit(_run_text_job, text, session_id, speak), timeout)
+
+    def stream_speech(self, text, timeout=PIPELINE_TIMEOUT):
+        # Yields (pcm16 bytes, sample_rate) per clause, in order. Every clause
+        # is queued up front so later ones synthesize on other speech
+        # workers while the first is being played.
+        executor = self._speech_pool()
+        futures = []
+        try:
+            for index, clause in enumerate(split_clauses(text)):
+                futures.append(executor.submit(_run_speech_job, clause, index > 0))
+            for future in futures:
+                speech, timings = future.result(timeout=timeout)
+                add_timings(timings)
+                yield speech
+        except BrokenProcessPool:
+            self._discard_pool("_speech_executor", executor, "Speech")
+            raise
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def warmup(self):
+        # Submit one no-op per worker so every process loads its models now
+        futures = [self._executor.submit(_ping) for _ in range(self.workers)]
+        pids = {future.result() for future in futures}
+        logger.info(f"Pipeline engine warm: {len(pids)} worker(s) ready")
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+            for executor in (self._stream_executor, self._speech_executor):
+                if executor is not None:
+                    executor.shutdown(wait=wait, cancel_futures=True)
+
+def get_engine():
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = PipelineEngine()
+    return _engine
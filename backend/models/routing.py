@@ -0,0 +1,132 @@
+from models.intent import tokenize, CART_INTENTS
+from models.sentiment import detect_sentiment_batch, SENTIMENT_BATCH_SIZE
+from models.batching import MicroBatcher
+from models.metrics import span
+import threading
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# "tiered": skip the sentiment model for clear commands without frustration
+# cues; "always": run it on every utterance (the old behaviour); "never":
+# only ever run it off the request path.
+SENTIMENT_POLICY = os.getenv("SENTIMENT_POLICY", "tiered")
+FAST_PATH_MAX_WORDS = int(os.getenv("FAST_PATH_MAX_WORDS", "12"))
+SENTIMENT_ASYNC = os.getenv("SENTIMENT_ASYNC", "1") == "1"
+# Deferred texts are scored in batches; nobody waits on them, so the window
+# is long enough to collect the fast-path jobs a worker gets through meanwhile
+SENTIMENT_ASYNC_MAX_WAIT_MS = float(os.getenv("SENTIMENT_ASYNC_MAX_WAIT_MS", "500"))
+
+# Tiers an utterance can take; FULL_TIERS run the model before replying
+FAST, AMBIGUOUS, FLAGGED, FULL = "fast", "ambiguous", "flagged", "full"
+FULL_TIERS = (AMBIGUOUS, FLAGGED, FULL)
+
+FRUSTRATION_WORDS = {
+    "angry", "annoyed", "annoying", "frustrated", "frustrating", "furious", "upset", "terrible",
+    "horrible", "awful", "useless", "stupid", "dumb", "ridiculous", "hate", "worst", "wrong",
+    "broken", "ugh", "seriously", "damn", "sucks", "garbage", "rubbish", "disappointed", "idiot"
+}
+FRUSTRATION_PHRASES = [
+    "not working", "doesn't work", "does not work", "didn't work", "still not", "i said",
+    "i already", "already told", "how many times", "for the last time", "are you kidding",
+    "what's wrong", "what is wrong", "talk to a human", "speak to a human", "real person",
+    "an agent", "a manager", "never mind", "forget it", "come on"
+]
+
+_stats_lock = threading.Lock()
+_stats = {FAST: 0, AMBIGUOUS: 0, FLAGGED: 0, FULL: 0, "async_submitted": 0, "async_completed": 0, "async_failed": 0}
+
+# Background batcher for deferred sentiment, created on first use
+_batcher = None
+_batcher_lock = threading.Lock()
+
+def _record(stat, amount=1):
+    with _stats_lock:
+        _stats[stat] += amount
+
+def frustration_cues(text):
+    # Cheap lexical check: frustration words and phrases, plus the same word
+    # said three times in a row ("no no no")
+    tokens = tokenize(text)
+    joined = " ".join(tokens)
+    cues = [token for token in tokens if token in FRUSTRATION_WORDS]
+    cues.extend(phrase for phrase in FRUSTRATION_PHRASES if f" {phrase} " in f" {joined} ")
+    for i in range(len(tokens) - 2):
+        if tokens[i] == tokens[i + 1] == tokens[i + 2]:
+            cues.append(" ".join(tokens[i:i + 3]))
+            break
+    return cues
+
+def _is_clear(text, ops):
+    if len(tokenize(text)) > FAST_PATH_MAX_WORDS:
+        return False
+    for entities in ops:
+        if entities["intent"] in CART_INTENTS:
+            if entities["product"] == "item":
+                return False
+        elif entities["intent"] != "show_cart":
+            return False
+    return True
+
+def route(text, ops):
+    # Decide, from the already extracted intents, whether the sentiment
+    # model has to run before replying. Returns (tier, frustration cues).
+    cues = frustration_cues(text)
+    if SENTIMENT_POLICY == "always":
+        tier = FULL
+    elif cues and SENTIMENT_POLICY != "never":
+        tier = FLAGGED
+    elif SENTIMENT_POLICY == "never" or _is_clear(text, ops):
+        tier = FAST
+    else:
+        tier = AMBIGUOUS
+    _record(tier)
+    logger.info(f"Routing tier: {tier}" + (f" (cues: {', '.join(cues)})" if cues else ""))
+    return tier, cues
+
+@span("sentiment_async")
+def _score(texts):
+    # Outside any job's trace: a pipeline worker sends this timing back with
+    # its next job (see metrics.hold_untraced)
+    return detect_sentiment_batch(texts)
+
+def _get_batcher():
+    global _batcher
+    if _batcher is None:
+        with _batcher_lock:
+            if _batcher is None:
+                _batcher = MicroBatcher(_score, SENTIMENT_BATCH_SIZE, SENTIMENT_ASYNC_MAX_WAIT_MS, name="sentiment-async")
+    return _batcher
+
+def _deferred(future, callback):
+    try:
+        label, score = future.result()
+    except Exception as e:
+        _record("async_failed")
+        logger.error(f"Deferred sentiment failed: {str(e)}")
+        label, score = None, None
+    else:
+        _record("async_completed")
+    callback(label, score)
+
+def defer_sentiment(text, callback):
+    # Runs the model off the request path for analytics, then calls
+    # callback(label, score) on a background thread ((None, None) on
+    # failure or when SENTIMENT_ASYNC is off)
+    if not SENTIMENT_ASYNC:
+        callback(None, None)
+        return
+    _record("async_submitted")
+    _get_batcher().submit(text).add_done_callback(lambda future: _deferred(future, callback))
+
+def routing_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    routed = sum(stats[tier] for tier in (FAST, AMBIGUOUS, FLAGGED, FULL))
+    stats["fast_path_rate"] = round(stats[FAST] / routed, 4) if routed else 0.0
+    stats["async_pending"] = stats["async_submitted"] - stats["async_completed"] - stats["async_failed"]
+    stats["policy"] = SENTIMENT_POLICY
+    if _batcher is not None:
+        stats["async_batcher"] = _batcher.stats()
+    return stats
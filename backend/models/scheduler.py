@@ -0,0 +1,205 @@
+from models.metrics import registry
+from models.pipeline import PIPELINE_WORKERS, STT_BATCHING, STT_MAX_BATCH_SIZE
+from concurrent.futures import Future
+import collections
+import threading
+import logging
+import math
+import time
+import uuid
+import os
+
+logger = logging.getLogger(__name__)
+
+# At most ADMISSION_MAX_RUNNING jobs run at once (ADMISSION_JOBS_PER_CPU,
+# when set, derives it from the core count instead); up to
+# ADMISSION_QUEUE_SIZE more wait, and none waits longer than
+# ADMISSION_QUEUE_DEADLINE seconds before it is shed. With STT_BATCHING a
+# full batch per worker has to be running for batches to fill.
+ADMISSION_JOBS_PER_CPU = float(os.getenv("ADMISSION_JOBS_PER_CPU", "0"))
+ADMISSION_MAX_RUNNING = int(os.getenv(
+    "ADMISSION_MAX_RUNNING", PIPELINE_WORKERS * (STT_MAX_BATCH_SIZE if STT_BATCHING else 1)
+))
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "0"))  # 0: 4 per running slot
+ADMISSION_QUEUE_DEADLINE = float(os.getenv("ADMISSION_QUEUE_DEADLINE", "15"))
+ADMISSION_JOB_TTL = float(os.getenv("ADMISSION_JOB_TTL", "300"))
+
+QUEUED, RUNNING, DONE, FAILED, SHED = "queued", "running", "done", "failed", "shed"
+
+wait_seconds = registry.histogram("admission_wait_seconds", "Time jobs spent queued before running")
+jobs_total = registry.counter("admission_jobs_total", "Jobs by admission outcome", ("outcome",))
+
+class QueueFull(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"Job queue full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+class Job:
+    def __init__(self, session_id, payload):
+        self.id = uuid.uuid4().hex
+        self.session_id = session_id
+        self.payload = payload
+        self.status = QUEUED
+        self.result = None
+        self.error = None
+        self.exception = None
+        self.timings = {}
+        self.created_at = time.monotonic()
+        self.started_at = None
+        self.finished_at = None
+        self._done = threading.Event()
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def _finish(self, status, result=None, error=None):
+        self.status = status
+        self.result = result
+        self.error = error
+        self.finished_at = time.monotonic()
+        self.payload = None  # drop the uploaded audio as soon as possible
+        self._done.set()
+
+    def to_dict(self):
+        info = {"job_id": self.id, "status": self.status}
+        if self.status == DONE:
+            info["result"] = self.result
+        elif self.status in (FAILED, SHED):
+            info["error"] = self.error
+        return info
+
+class JobScheduler:
+    # Bounded admission in front of the pipeline: a fixed set of runner
+    # threads call run(job) for the oldest queued job. run may return a
+    # Future when the work finishes elsewhere (a worker process); the job
+    # keeps its slot until that resolves. Submissions beyond the queue size
+    # are rejected with a retry hint instead of piling up.
+    def __init__(self, run, max_running=None, queue_size=None, deadline=ADMISSION_QUEUE_DEADLINE, name="jobs"):
+        if max_running is None:
+            max_running = ADMISSION_MAX_RUNNING
+            if ADMISSION_JOBS_PER_CPU > 0:
+                max_running = int((os.cpu_count() or 1) * ADMISSION_JOBS_PER_CPU)
+        self.max_running = max(1, max_running)
+        self.queue_size = queue_size or ADMISSION_QUEUE_SIZE or 4 * self.max_running
+        self.deadline = deadline
+        self._run = run
+        self._queue = collections.deque()
+        self._jobs = {}
+        self._running = 0
+        self._avg_run_seconds = None
+        self._cond = threading.Condition()
+        for i in range(self.max_running):
+            threading.Thread(target=self._loop, name=f"{name}-runner-{i}", daemon=True).start()
+        for metric, key, help_text in (
+            ("admission_queue_depth", "queued", "Jobs waiting to run"),
+            ("admission_running", "running", "Jobs running"),
+            ("admission_max_running", "max_running", "Jobs allowed to run at once"),
+            ("admission_queue_size", "queue_size", "Jobs allowed to wait"),
+            ("admission_avg_run_seconds", "avg_run_seconds", "Moving average of job run time")
+        ):
+            registry.gauge(metric, help_text, lambda key=key: self.stats()[key])
+        logger.info(f"Job scheduler: {self.max_running} running, {self.queue_size} queued, {self.deadline}s deadline")
+
+    def _shed_expired(self, now):
+        # Oldest first: a job past its deadline would time out anyway
+        while self._queue and now - self._queue[0].created_at > self.deadline:
+            job = self._queue.popleft()
+            job._finish(SHED, error="Waited too long in the queue")
+            jobs_total.inc(SHED)
+            logger.warning(f"Shed job {job.id} after {now - job.created_at:.1f}s in the queue")
+
+    def retry_after(self):
+        # Rough time for the queue ahead to drain, in whole seconds
+        per_job = self._avg_run_seconds or 5.0
+        return max(1, math.ceil(per_job * (len(self._queue) + 1) / self.max_running))
+
+    def submit(self, session_id, payload):
+        with self._cond:
+            now = time.monotonic()
+            self._shed_expired(now)
+            self._reap(now)
+            if len(self._queue) >= self.queue_size:
+                jobs_total.inc("rejected")
+                raise QueueFull(self.retry_after())
+            job = Job(session_id, payload)
+            self._queue.append(job)
+            self._jobs[job.id] = job
+            jobs_total.inc("accepted")
+            self._cond.notify()
+            return job
+
+    def get(self, job_id):
+        with self._cond:
+            return self._jobs.get(job_id)
+
+    def position(self, job):
+        with self._cond:
+            try:
+                return self._queue.index(job)
+            except ValueError:
+                return None
+
+    def _reap(self, now):
+        for job_id in [job_id for job_id, job in self._jobs.items()
+                       if job.finished_at is not None and now - job.finished_at > ADMISSION_JOB_TTL]:
+            del self._jobs[job_id]
+
+    def _next(self):
+        with self._cond:
+            while True:
+                self._shed_expired(time.monotonic())
+                if self._queue and self._running < self.max_running:
+                    job = self._queue.popleft()
+                    self._running += 1
+                    return job
+                self._cond.wait(self.deadline)
+
+    def _loop(self):
+        while True:
+            job = self._next()
+            job.started_at = time.monotonic()
+            job.status = RUNNING
+            wait_seconds.observe(job.started_at - job.created_at)
+            job.timings["admission"] = job.started_at - job.created_at
+            try:
+                result = self._run(job)
+            except Exception as e:
+                self._complete(job, error=e)
+                continue
+            if isinstance(result, Future):
+                result.add_done_callback(lambda done, job=job: self._settle(job, done))
+            else:
+                self._complete(job, result)
+
+    def _settle(self, job, future):
+        try:
+            result = future.result()
+        except Exception as e:
+            self._complete(job, error=e)
+        else:
+            self._complete(job, result)
+
+    def _complete(self, job, result=None, error=None):
+        if error is not None:
+            logger.error(f"Job {job.id} failed: {str(error)}")
+            job.exception = error
+            job._finish(FAILED, error=str(error) or type(error).__name__)
+            jobs_total.inc(FAILED)
+        else:
+            job._finish(DONE, result=result)
+            jobs_total.inc(DONE)
+        elapsed = time.monotonic() - job.started_at
+        with self._cond:
+            self._running -= 1
+            self._avg_run_seconds = elapsed if self._avg_run_seconds is None else 0.8 * self._avg_run_seconds + 0.2 * elapsed
+            self._cond.notify()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "max_running": self.max_running,
+                "running": self._running,
+                "queued": len(self._queue),
+                "queue_size": self.queue_size,
+                "avg_run_seconds": round(self._avg_run_seconds or 0.0, 3)
+            }
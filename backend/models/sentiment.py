@@ -1,20 +1,93 @@
-from transformers import pipeline
+from transformers import pipeline, AutoTokenizer
+from models.cache import LRUCache
+from models.metrics import span
+from models.inference import check_backend, quantize_dynamic, load_ort_model
+import threading
 import logging
+import re
+import os
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+SENTIMENT_MODEL = os.getenv("SENTIMENT_MODEL", "distilbert-base-uncased-finetuned-sst-2-english")
+SENTIMENT_BACKEND = check_backend(os.getenv("SENTIMENT_BACKEND", "torch"))
+SENTIMENT_BATCH_SIZE = int(os.getenv("SENTIMENT_BATCH_SIZE", "16"))
+SENTIMENT_CACHE_SIZE = int(os.getenv("SENTIMENT_CACHE_SIZE", "4096"))
+SENTIMENT_CACHE_TTL = float(os.getenv("SENTIMENT_CACHE_TTL", "3600"))
+
 # Load model only once
 _sentiment_pipeline = None
+# Request-path calls and deferred batches (models/routing.py) share the model
+_model_lock = threading.Lock()
 
-def detect_sentiment(text):
+# Results keyed by normalized transcript; voice commands repeat a lot
+_cache = LRUCache(maxsize=SENTIMENT_CACHE_SIZE, ttl=SENTIMENT_CACHE_TTL or None)
+
+def get_sentiment_pipeline():
     global _sentiment_pipeline
     if _sentiment_pipeline is None:
-        logger.info("Loading sentiment model...")
-        _sentiment_pipeline = pipeline("sentiment-analysis")
+        logger.info(f"Loading sentiment model ({SENTIMENT_BACKEND})...")
+        _sentiment_pipeline = load_sentiment_pipeline(SENTIMENT_BACKEND)
         logger.info("Sentiment model loaded")
-    
+    return _sentiment_pipeline
+
+def load_sentiment_pipeline(backend=SENTIMENT_BACKEND):
+    # SENTIMENT_MODEL on the given inference backend (see models/inference.py)
+    check_backend(backend)
+    if backend.startswith("onnx"):
+        from optimum.onnxruntime import ORTModelForSequenceClassification
+        model = load_ort_model(ORTModelForSequenceClassification, SENTIMENT_MODEL, quantize=backend == "onnx-int8")
+        return pipeline("sentiment-analysis", model=model, tokenizer=AutoTokenizer.from_pretrained(SENTIMENT_MODEL))
+    sentiment_pipeline = pipeline("sentiment-analysis", model=SENTIMENT_MODEL)
+    if backend == "torch-int8":
+        sentiment_pipeline.model = quantize_dynamic(sentiment_pipeline.model)
+    return sentiment_pipeline
+
+def normalize_text(text):
+    text = re.sub(r"[^\w\s']", " ", (text or "").lower())
+    return " ".join(text.split())
+
+def _run_model(texts, batch_size=SENTIMENT_BATCH_SIZE):
+    pipe = get_sentiment_pipeline()
+    with _model_lock:
+        results = pipe(list(texts), batch_size=batch_size, truncation=True)
+    return [(result['label'], result['score']) for result in results]
+
+@span("sentiment")
+def detect_sentiment(text):
+    key = normalize_text(text)
+    cached = _cache.get(key)
+    if cached is not None:
+        logger.info(f"Sentiment cache hit: {key}")
+        return cached
     logger.info(f"Analyzing sentiment: {text}")
-    result = _sentiment_pipeline(text)[0]
-    return result['label'], result['score']
\ No newline at end of file
+    # One text per call: a pipeline worker runs one job at a time, so there
+    # is nothing to batch with (deferred sentiment is batched, see
+    # models/routing.py)
+    result = _run_model([text], batch_size=1)[0]
+    _cache.set(key, result)
+    return result
+
+def detect_sentiment_batch(texts, batch_size=SENTIMENT_BATCH_SIZE):
+    keys = [normalize_text(text) for text in texts]
+    results = {}
+    pending = {}
+    for key, text in zip(keys, texts):
+        if key in results or key in pending:
+            continue
+        cached = _cache.get(key)
+        if cached is not None:
+            results[key] = cached
+        else:
+            pending[key] = text
+    if pending:
+        logger.info(f"Analyzing sentiment for {len(pending)} of {len(texts)} text(s)")
+        for key, result in zip(pending, _run_model(pending.values(), batch_size=batch_size)):
+            _cache.set(key, result)
+            results[key] = result
+    return [results[key] for key in keys]
+
+def sentiment_cache_stats():
+    return _cache.stats()
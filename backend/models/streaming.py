@@ -0,0 +1,135 @@
+from models.audio import SAMPLE_RATE, pcm16_to_float
+from models.vad import EnergyVAD
+import numpy as np
+import threading
+import logging
+import time
+import uuid
+import os
+
+logger = logging.getLogger(__name__)
+
+STREAM_PARTIAL_INTERVAL_MS = float(os.getenv("STREAM_PARTIAL_INTERVAL_MS", "700"))
+STREAM_WINDOW_SECONDS = float(os.getenv("STREAM_WINDOW_SECONDS", "10"))
+STREAM_MAX_SECONDS = float(os.getenv("STREAM_MAX_SECONDS", "30"))
+STREAM_IDLE_TIMEOUT = float(os.getenv("STREAM_IDLE_TIMEOUT", "60"))
+
+class AudioStream:
+    # One utterance being recorded. Chunks are appended as they arrive, the VAD
+    # watches for the end of speech, and a sliding window of the latest audio
+    # is re-transcribed every STREAM_PARTIAL_INTERVAL_MS of new speech.
+    def __init__(self, session_id, sample_rate, transcribe):
+        self.id = uuid.uuid4().hex
+        self.session_id = session_id
+        self.sample_rate = sample_rate
+        self.created_at = time.monotonic()
+        self.last_active = self.created_at
+        self.partial = ""
+        self.done = False
+        self._transcribe = transcribe  # (samples, partial) -> Future[str], or None when a partial is skipped
+        self._vad = EnergyVAD()
+        self._chunks = []
+        self._samples = 0
+        self._pending = None            # (future, samples covered)
+        self._partial_samples = 0
+        self._leftover = b""            # odd trailing byte of the last chunk
+        self._lock = threading.Lock()
+
+    @property
+    def seconds(self):
+        return self._samples / SAMPLE_RATE
+
+    def audio(self):
+        return np.concatenate(self._chunks) if self._chunks else np.zeros(0, dtype=np.float32)
+
+    def feed(self, data):
+        # Returns True once the utterance has ended
+        with self._lock:
+            # A chunk may split a 16-bit sample: keep the odd byte for the next one
+            data = self._leftover + bytes(data)
+            cut = len(data) - len(data) % 2
+            data, self._leftover = data[:cut], data[cut:]
+            samples = pcm16_to_float(data, self.sample_rate)
+            self.last_active = time.monotonic()
+            self._chunks.append(samples)
+            self._samples += len(samples)
+            endpoint = self._vad.feed(samples) or self.seconds >= STREAM_MAX_SECONDS
+            self._collect_partial()
+            if not endpoint and not self.done and self._vad.in_speech:
+                self._maybe_start_partial()
+            return endpoint
+
+    def _collect_partial(self):
+        if self._pending is not None and self._pending[0].done():
+            future, covered = self._pending
+            self._pending = None
+            try:
+                self.partial = future.result().strip()
+                self._partial_samples = covered
+            except Exception as e:
+                logger.warning(f"Partial transcription failed: {str(e)}")
+
+    def _maybe_start_partial(self):
+        new_audio_ms = (self._samples - self._partial_samples) * 1000 / SAMPLE_RATE
+        if self._pending is not None or new_audio_ms < STREAM_PARTIAL_INTERVAL_MS:
+            return
+        window = self.audio()[-int(STREAM_WINDOW_SECONDS * SAMPLE_RATE):]
+        future = self._transcribe(window, True)
+        if future is not None:  # else the workers are busy: try again on the next chunk
+            self._pending = (future, self._samples)
+
+    def final_transcript(self, timeout=None):
+        # Reuse the last partial when it already heard everything up to the
+        # trailing silence; otherwise transcribe the whole utterance once.
+        with self._lock:
+            self.done = True
+            pending = self._pending
+        # Waited for outside the lock, so a chunk arriving meanwhile isn't blocked
+        if pending is not None:
+            try:
+                pending[0].result(timeout=timeout)
+            except Exception:
+                pass
+        with self._lock:
+            self._collect_partial()
+            speech_end = self._samples - self._vad.trailing_silence * self._vad.frame_size
+            window_start = self._samples - int(STREAM_WINDOW_SECONDS * SAMPLE_RATE)
+            if self.partial and self._partial_samples >= speech_end and window_start <= 0:
+                return self.partial
+            audio = self.audio()
+        if not len(audio):
+            return ""
+        return self._transcribe(audio, False).result(timeout=timeout).strip()
+
+class StreamManager:
+    def __init__(self, transcribe):
+        self._transcribe = transcribe
+        self._streams = {}
+        self._lock = threading.Lock()
+
+    def open(self, session_id, sample_rate=SAMPLE_RATE):
+        self._reap()
+        stream = AudioStream(session_id, sample_rate, self._transcribe)
+        with self._lock:
+            self._streams[stream.id] = stream
+        logger.info(f"Opened audio stream {stream.id} for session {session_id}")
+        return stream
+
+    def get(self, stream_id):
+        with self._lock:
+            return self._streams.get(stream_id)
+
+    def close(self, stream_id):
+        with self._lock:
+            return self._streams.pop(stream_id, None)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._streams)
+
+    def _reap(self):
+        now = time.monotonic()
+        with self._lock:
+            for stream_id in [sid for sid, s in self._streams.items() if now - s.last_active > STREAM_IDLE_TIMEOUT]:
+                logger.info(f"Dropping idle audio stream {stream_id}")
+                del self._streams[stream_id]
@@ -1,20 +1,124 @@
+from models.metrics import span
+from models.inference import check_backend, quantize_dynamic, load_ort_model
 import whisper
+import torch
 import logging
+import os
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+STT_MODEL = os.getenv("STT_MODEL", "base")
+STT_BACKEND = check_backend(os.getenv("STT_BACKEND", "torch"))
+
 # Load model only once
 model = None
 
-def transcribe_audio(file_path="input.wav"):
+def load_model():
     global model
     if model is None:
-        logger.info("Loading Whisper model...")
-        model = whisper.load_model("base")
+        logger.info(f"Loading Whisper model ({STT_MODEL}, {STT_BACKEND})...")
+        model = load_whisper(STT_BACKEND)
         logger.info("Whisper model loaded")
-    
-    logger.info(f"Transcribing audio: {file_path}")
-    result = model.transcribe(file_path)
-    return result['text']
\ No newline at end of file
+    return model
+
+def load_whisper(backend=STT_BACKEND, name=STT_MODEL):
+    # Whisper on the given inference backend (see models/inference.py). Every
+    # variant answers transcribe(audio, fp16=False) -> {"text": ...}.
+    check_backend(backend)
+    if backend.startswith("onnx"):
+        return OnnxWhisper(name, quantize=backend == "onnx-int8")
+    if backend == "torch-int8":
+        # Dynamic quantization only has CPU kernels
+        return quantize_dynamic(whisper.load_model(name, device="cpu"), linear_types=(whisper.model.Linear,))
+    return whisper.load_model(name)
+
+class OnnxWhisper:
+    # openai/whisper-<name> exported to ONNX Runtime, decoded by the
+    # transformers ASR pipeline (which also handles clips over 30 s)
+    def __init__(self, name, quantize=False):
+        from optimum.onnxruntime import ORTModelForSpeechSeq2Seq
+        from transformers import WhisperProcessor, pipeline
+        model_id = f"openai/whisper-{name}"
+        processor = WhisperProcessor.from_pretrained(model_id)
+        self.pipeline = pipeline(
+            "automatic-speech-recognition",
+            model=load_ort_model(ORTModelForSpeechSeq2Seq, model_id, quantize),
+            tokenizer=processor.tokenizer,
+            feature_extractor=processor.feature_extractor,
+            chunk_length_s=30
+        )
+
+    def _inputs(self, audio):
+        samples = whisper.load_audio(audio) if isinstance(audio, str) else audio
+        return {"raw": samples, "sampling_rate": whisper.audio.SAMPLE_RATE}
+
+    def transcribe(self, audio, **kwargs):
+        return {"text": self.pipeline(self._inputs(audio))["text"]}
+
+    def transcribe_batch(self, clips):
+        results = self.pipeline([self._inputs(audio) for audio in clips], batch_size=len(clips))
+        return [result["text"] for result in results]
+
+@span("stt")
+def transcribe_audio(file_path="input.wav"):
+    model = load_model()
+    # file_path may also be a 16 kHz mono float32 array (streaming uploads)
+    logger.info(f"Transcribing audio: {file_path if isinstance(file_path, str) else f'{len(file_path)} samples'}")
+    result = model.transcribe(file_path, fp16=False)
+    return result['text']
+
+def _transcribe_one(model, audio):
+    # A clip's transcript, or the exception it raised
+    try:
+        return model.transcribe(audio, fp16=False)["text"]
+    except Exception as e:
+        return e
+
+@span("stt")
+def transcribe_batch(clips):
+    # File paths or 16 kHz mono float32 arrays -> one transcript per clip, in
+    # order, or the exception that clip raised. Clips up to 30 s share one
+    # batched log-mel + decode pass; if that pass fails, each clip is
+    # transcribed on its own so one bad clip doesn't fail the others.
+    model = load_model()
+    if isinstance(model, OnnxWhisper):
+        logger.info(f"Transcribing batch of {len(clips)} utterance(s)")
+        try:
+            return model.transcribe_batch(clips)
+        except Exception as e:
+            logger.warning(f"Batched transcription failed, transcribing clips one by one: {str(e)}")
+            return [_transcribe_one(model, audio) for audio in clips]
+    texts = [None] * len(clips)
+    short_items = []
+    for index, audio in enumerate(clips):
+        try:
+            samples = whisper.load_audio(audio) if isinstance(audio, str) else audio
+        except Exception as e:
+            texts[index] = e
+            continue
+        if len(samples) > whisper.audio.N_SAMPLES:
+            # Longer than one 30 s window: needs the sliding-window decoder
+            texts[index] = _transcribe_one(model, samples)
+        else:
+            short_items.append((index, samples))
+    if not short_items:
+        return texts
+    # The encoder takes fixed 30 s windows, so every short clip pads to one mel shape
+    logger.info(f"Transcribing batch of {len(short_items)} utterance(s)")
+    try:
+        mel = torch.stack([
+            whisper.log_mel_spectrogram(whisper.pad_or_trim(samples))
+            for _, samples in short_items
+        ]).to(model.device)
+        options = whisper.DecodingOptions(fp16=False, without_timestamps=True)
+        results = whisper.decode(model, mel, options)
+    except Exception as e:
+        logger.warning(f"Batched decode failed, transcribing clips one by one: {str(e)}")
+        for index, samples in short_items:
+            texts[index] = _transcribe_one(model, samples)
+        return texts
+    for (index, _), result in zip(short_items, results):
+        texts[index] = result.text
+    return texts
@@ -1,27 +1,212 @@
-from TTS.api import TTS
+from models.cache import LRUCache
+from models.metrics import span
+from models.audio import encode_wav, float_to_pcm16
+import numpy as np
+import threading
+import hashlib
 import logging
+import json
+import time
+import wave
+import re
+import os
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+TTS_MODEL_NAME = "tts_models/en/ljspeech/tacotron2-DDC"
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", "audio_files/tts_cache")
+TTS_MEMORY_CACHE_SIZE = int(os.getenv("TTS_MEMORY_CACHE_SIZE", "256"))
+TTS_STITCHING = os.getenv("TTS_STITCHING", "1") == "1"
+TTS_CLAUSE_MIN_CHARS = int(os.getenv("TTS_CLAUSE_MIN_CHARS", "12"))
+FRAGMENT_GAP_SECONDS = 0.08
+
 # Singleton model instance
 _tts_instance = None
 
+# Synthesized clips: (waveform, sample_rate, synth_seconds) keyed by content hash
+_memory_cache = LRUCache(maxsize=TTS_MEMORY_CACHE_SIZE)
+_templates = []
+_stats_lock = threading.Lock()
+_stats = {
+    "memory_hits": 0,
+    "disk_hits": 0,
+    "misses": 0,
+    "synthesis_seconds": 0.0,
+    "seconds_saved": 0.0,
+    "stitched": 0
+}
+
 def get_tts():
     global _tts_instance
     if _tts_instance is None:
+        # Imported here so the app process can use split_clauses without
+        # pulling in the TTS/torch stack
+        from TTS.api import TTS
         logger.info("Loading TTS model...")
-        _tts_instance = TTS(model_name="tts_models/en/ljspeech/tacotron2-DDC", progress_bar=False)
+        _tts_instance = TTS(model_name=TTS_MODEL_NAME, progress_bar=False)
         logger.info("TTS model loaded")
     return _tts_instance
 
-def speak_response(text, file_path="response.wav"):
+def _cache_key(text):
+    return hashlib.sha256(f"{TTS_MODEL_NAME}\0{text}".encode("utf-8")).hexdigest()
+
+def _record(stat, amount=1):
+    with _stats_lock:
+        _stats[stat] += amount
+
+def write_wav(path, waveform, sample_rate):
+    with open(path, "wb") as f:
+        f.write(encode_wav(waveform, sample_rate))
+
+def read_wav(path):
+    with wave.open(path, "rb") as wav:
+        sample_rate = wav.getframerate()
+        pcm = np.frombuffer(wav.readframes(wav.getnframes()), dtype=np.int16)
+    return pcm.astype(np.float32) / 32767, sample_rate
+
+def _disk_paths(key):
+    return os.path.join(TTS_CACHE_DIR, f"{key}.wav"), os.path.join(TTS_CACHE_DIR, f"{key}.json")
+
+def synthesize(text):
+    # Returns (waveform, sample_rate) from memory, disk, or a fresh Tacotron2 run
+    key = _cache_key(text)
+    entry = _memory_cache.get(key)
+    if entry is not None:
+        _record("memory_hits")
+        _record("seconds_saved", entry[2])
+        return entry[0], entry[1]
+
+    wav_path, meta_path = _disk_paths(key)
+    if os.path.exists(wav_path) and os.path.exists(meta_path):
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            waveform, sample_rate = read_wav(wav_path)
+            _memory_cache.set(key, (waveform, sample_rate, meta.get("synth_seconds", 0.0)))
+            _record("disk_hits")
+            _record("seconds_saved", meta.get("synth_seconds", 0.0))
+            return waveform, sample_rate
+        except Exception as e:
+            logger.warning(f"Discarding unreadable TTS cache entry {key}: {str(e)}")
+
+    tts = get_tts()
+    logger.info(f"Synthesizing speech: {text}")
+    start = time.perf_counter()
+    waveform = np.asarray(tts.tts(text=text), dtype=np.float32)
+    synth_seconds = time.perf_counter() - start
+    sample_rate = tts.synthesizer.output_sample_rate
+    _record("misses")
+    _record("synthesis_seconds", synth_seconds)
+    _memory_cache.set(key, (waveform, sample_rate, synth_seconds))
+    try:
+        os.makedirs(TTS_CACHE_DIR, exist_ok=True)
+        # Write to temp names and rename so readers never see partial files
+        suffix = f".{os.getpid()}.tmp"
+        write_wav(wav_path + suffix, waveform, sample_rate)
+        with open(meta_path + suffix, "w") as f:
+            json.dump({"model": TTS_MODEL_NAME, "text": text, "synth_seconds": synth_seconds}, f)
+        os.replace(wav_path + suffix, wav_path)
+        os.replace(meta_path + suffix, meta_path)
+    except OSError as e:
+        logger.warning(f"Failed to persist TTS cache entry: {str(e)}")
+    return waveform, sample_rate
+
+def register_template(template):
+    # "Added {qty} {product} to your cart." -> static fragments ("Added",
+    # "to your cart.") that are cached once, plus one dynamic fragment per
+    # run of adjacent placeholders ("{qty} {product}").
+    fragments = []
+    for part in re.split(r"((?:\{\w+\}\s*)+)", template):
+        if not part.strip():
+            continue
+        is_dynamic = part.startswith("{")
+        fragments.append((is_dynamic, part.strip()))
+    pattern = re.escape(template)
+    for name in re.findall(r"\{(\w+)\}", template):
+        pattern = pattern.replace(re.escape("{%s}" % name), f"(?P<{name}>.+?)", 1)
+    _templates.append((re.compile(f"^{pattern}$"), fragments))
+
+def _fragments_for(text):
+    for pattern, fragments in _templates:
+        match = pattern.match(text)
+        if match:
+            values = match.groupdict()
+            return [part.format(**values) if is_dynamic else part for is_dynamic, part in fragments]
+    return None
+
+def _synthesize_reply(text):
+    fragments = _fragments_for(text) if TTS_STITCHING else None
+    if not fragments or len(fragments) < 2:
+        return synthesize(text)
+    clips = [synthesize(fragment) for fragment in fragments]
+    sample_rate = clips[0][1]
+    gap = np.zeros(int(sample_rate * FRAGMENT_GAP_SECONDS), dtype=np.float32)
+    pieces = []
+    for waveform, _ in clips:
+        if pieces:
+            pieces.append(gap)
+        pieces.append(waveform)
+    _record("stitched")
+    return np.concatenate(pieces), sample_rate
+
+def prewarm(texts):
+    # Synthesize the fixed replies and every template's static fragments
+    start = time.perf_counter()
+    phrases = list(texts)
+    for _, fragments in _templates:
+        phrases.extend(part for is_dynamic, part in fragments if not is_dynamic)
+    for phrase in dict.fromkeys(phrases):
+        synthesize(phrase)
+    logger.info(f"Prewarmed {len(phrases)} TTS phrase(s) in {time.perf_counter() - start:.2f}s")
+
+def tts_cache_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+    stats["hit_rate"] = round((stats["memory_hits"] + stats["disk_hits"]) / lookups, 4) if lookups else 0.0
+    stats["synthesis_seconds"] = round(stats["synthesis_seconds"], 3)
+    stats["seconds_saved"] = round(stats["seconds_saved"], 3)
+    stats["memory"] = _memory_cache.stats()
+    return stats
+
+@span("tts")
+def speak_response(text):
+    # Returns the reply as WAV bytes; callers decide where it goes, so
+    # concurrent requests never share an output file
     try:
-        tts = get_tts()
         logger.info(f"Generating speech: {text}")
-        tts.tts_to_file(text=text, file_path=file_path)
-        logger.info(f"Audio saved to {file_path}")
+        waveform, sample_rate = _synthesize_reply(text)
+        audio = encode_wav(waveform, sample_rate)
+        logger.info(f"Generated {len(audio)} bytes of audio")
+        return audio
     except Exception as e:
         logger.error(f"TTS failed: {str(e)}")
-        raise
\ No newline at end of file
+        raise
+
+def split_clauses(text):
+    # Sentence and clause boundaries (". ! ? ; :" and commas). Pieces shorter
+    # than TTS_CLAUSE_MIN_CHARS are joined with the next so every chunk is
+    # worth a synthesis call; "Your cart has:" still comes out on its own.
+    clauses = []
+    buffer = ""
+    for part in re.split(r"(?<=[.!?;:,])\s+", text.strip()):
+        buffer = f"{buffer} {part}".strip()
+        if len(buffer) >= TTS_CLAUSE_MIN_CHARS:
+            clauses.append(buffer)
+            buffer = ""
+    if buffer:
+        if clauses:
+            clauses[-1] = f"{clauses[-1]} {buffer}"
+        else:
+            clauses.append(buffer)
+    return clauses
+
+def speak_clause(text, leading_gap=False):
+    # One chunk of a streamed reply as (16-bit PCM bytes, sample_rate).
+    # Every clause after the first starts with a short pause.
+    waveform, sample_rate = _synthesize_reply(text)
+    if leading_gap:
+        waveform = np.concatenate([np.zeros(int(sample_rate * FRAGMENT_GAP_SECONDS), dtype=np.float32), waveform])
+    return float_to_pcm16(waveform), sample_rate
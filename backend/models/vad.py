@@ -0,0 +1,52 @@
+from models.audio import SAMPLE_RATE
+import numpy as np
+import os
+
+VAD_FRAME_MS = int(os.getenv("VAD_FRAME_MS", "30"))
+VAD_SILENCE_MS = int(os.getenv("VAD_SILENCE_MS", "600"))
+VAD_MIN_SPEECH_MS = int(os.getenv("VAD_MIN_SPEECH_MS", "150"))
+VAD_THRESHOLD_DB = float(os.getenv("VAD_THRESHOLD_DB", "12"))
+
+class EnergyVAD:
+    # Frame-energy voice activity detector. Tracks an adaptive noise floor;
+    # frames louder than floor + VAD_THRESHOLD_DB count as speech. The
+    # utterance endpoint is VAD_SILENCE_MS of non-speech after at least
+    # VAD_MIN_SPEECH_MS of speech.
+    def __init__(self, sample_rate=SAMPLE_RATE, frame_ms=VAD_FRAME_MS, silence_ms=VAD_SILENCE_MS,
+                 min_speech_ms=VAD_MIN_SPEECH_MS, threshold_db=VAD_THRESHOLD_DB):
+        self.frame_size = int(sample_rate * frame_ms / 1000)
+        self.silence_frames = max(1, silence_ms // frame_ms)
+        self.min_speech_frames = max(1, min_speech_ms // frame_ms)
+        self.threshold_db = threshold_db
+        self.noise_floor_db = None
+        self.speech_frames = 0
+        self.trailing_silence = 0
+        self.endpoint = False
+        self._remainder = np.zeros(0, dtype=np.float32)
+
+    @property
+    def in_speech(self):
+        return self.speech_frames >= self.min_speech_frames
+
+    def feed(self, samples):
+        # Returns True once the endpoint has been reached
+        samples = np.concatenate([self._remainder, samples])
+        usable = len(samples) - len(samples) % self.frame_size
+        self._remainder = samples[usable:]
+        for frame in samples[:usable].reshape(-1, self.frame_size):
+            energy_db = 10 * np.log10(np.mean(frame ** 2) + 1e-10)
+            if self.noise_floor_db is None:
+                self.noise_floor_db = energy_db
+            is_speech = energy_db > self.noise_floor_db + self.threshold_db
+            if is_speech:
+                self.speech_frames += 1
+                self.trailing_silence = 0
+            else:
+                # Follow the floor down quickly, up slowly
+                rate = 0.3 if energy_db < self.noise_floor_db else 0.02
+                self.noise_floor_db += rate * (energy_db - self.noise_floor_db)
+                if self.in_speech:
+                    self.trailing_silence += 1
+            if self.in_speech and self.trailing_silence >= self.silence_frames:
+                self.endpoint = True
+        return self.endpoint
@@ -0,0 +1,62 @@
+from models.sentiment import detect_sentiment_batch, sentiment_cache_stats
+from models.database import log_collection
+from models.analytics import relabel_sentiments
+from pymongo import UpdateOne
+import argparse
+import logging
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+def rescore(batch_size=256, dry_run=False):
+    cursor = log_collection.find(
+        {"user_input": {"$exists": True}},
+        {"user_input": 1, "sentiment": 1, "created_at": 1, "rolled_up": 1}
+    ).batch_size(batch_size)
+    scanned = changed = 0
+    chunk = []
+
+    def flush(chunk):
+        nonlocal changed
+        results = detect_sentiment_batch([doc.get("user_input") or "" for doc in chunk])
+        ops = []
+        relabeled = []
+        for doc, (label, score) in zip(chunk, results):
+            if doc.get("sentiment") != label:
+                changed += 1
+                # Logs not rolled up yet are counted with the new label by
+                # backfill_analytics.py; the others move in the rollups
+                if doc.get("rolled_up"):
+                    relabeled.append((doc, doc.get("sentiment"), label))
+            ops.append(UpdateOne(
+                {"_id": doc["_id"]},
+                {"$set": {"sentiment": label, "sentiment_score": score}}
+            ))
+        if ops and not dry_run:
+            log_collection.bulk_write(ops, ordered=False)
+            if relabeled and not relabel_sentiments(relabeled):
+                raise RuntimeError(f"Failed to move {len(relabeled)} relabeled log(s) in the sentiment rollups")
+
+    for doc in cursor:
+        chunk.append(doc)
+        scanned += 1
+        if len(chunk) >= batch_size:
+            flush(chunk)
+            chunk = []
+            logger.info(f"Rescored {scanned} log(s), {changed} label change(s)")
+    if chunk:
+        flush(chunk)
+    logger.info(f"Done: rescored {scanned} log(s), {changed} label change(s)")
+    logger.info(f"Sentiment cache: {sentiment_cache_stats()}")
+    return scanned, changed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-score sentiment for every logged interaction")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    rescore(args.batch_size, args.dry_run)
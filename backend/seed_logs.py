@@ -0,0 +1,90 @@
+from models.database import db, log_collection
+from bson import ObjectId
+import datetime
+import argparse
+import logging
+import random
+import json
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+INTENTS = [("add_to_cart", 0.55), ("remove_from_cart", 0.2), ("show_cart", 0.15), ("unknown", 0.1)]
+SENTIMENTS = [("POSITIVE", 0.5), ("NEUTRAL", 0.35), ("NEGATIVE", 0.15)]
+TIERS = ["fast", "ambiguous", "flagged", "full"]
+
+def _products():
+    with open("product.json") as f:
+        return [product["name"].lower() for product in json.load(f)]
+
+def _pick(rng, weighted):
+    return rng.choices([value for value, _ in weighted], [weight for _, weight in weighted])[0]
+
+def _object_id(rng, at):
+    # ObjectIds carry their creation second, so seeded logs page and filter
+    # by time exactly like ones written at that moment
+    timestamp = int(at.replace(tzinfo=datetime.timezone.utc).timestamp())
+    return ObjectId(timestamp.to_bytes(4, "big") + rng.getrandbits(64).to_bytes(8, "big"))
+
+def generate_logs(count, days=90, sessions=500, rolled_up=False, seed=0):
+    # Synthetic interaction logs shaped like main.run_text_pipeline's,
+    # spread evenly (with jitter) over the last `days` days, oldest first
+    rng = random.Random(seed)
+    products = _products()
+    end = datetime.datetime.utcnow()
+    step = datetime.timedelta(days=days) / max(1, count)
+    for i in range(count):
+        at = end - datetime.timedelta(days=days) + step * i + step * rng.random()
+        intent = _pick(rng, INTENTS)
+        product = rng.choice(products) if intent in ("add_to_cart", "remove_from_cart") else "item"
+        quantity = rng.randint(1, 5)
+        yield {
+            "_id": _object_id(rng, at),
+            "session_id": f"seed-{rng.randrange(sessions)}",
+            "user_input": f"{intent.replace('_', ' ')} {quantity} {product}",
+            "intent": {"intent": intent, "product": product, "quantity": quantity, "metric": None},
+            "response": f"Seeded {intent}",
+            "sentiment": _pick(rng, SENTIMENTS),
+            "sentiment_tier": rng.choice(TIERS),
+            "created_at": at.replace(microsecond=at.microsecond // 1000 * 1000),
+            "rolled_up": rolled_up,
+            "seeded": True
+        }
+
+def seed_logs(count, collection=log_collection, days=90, batch_size=5000, rolled_up=False, seed=0):
+    batch = []
+    written = 0
+    for doc in generate_logs(count, days, rolled_up=rolled_up, seed=seed):
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            collection.insert_many(batch, ordered=False)
+            written += len(batch)
+            batch = []
+            logger.info(f"Seeded {written}/{count} log(s)")
+    if batch:
+        collection.insert_many(batch, ordered=False)
+        written += len(batch)
+    logger.info(f"Seeded {written} log(s) into {collection.name}")
+    return written
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Insert synthetic interaction logs for load and retention testing")
+    parser.add_argument("--count", type=int, default=100000)
+    parser.add_argument("--days", type=float, default=90)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--collection", default=log_collection.name,
+                        help="target collection (default: the real logs)")
+    parser.add_argument("--rolled-up", action="store_true",
+                        help="mark the logs as already counted, so compaction won't add them to the rollups")
+    parser.add_argument("--delete", action="store_true", help="remove previously seeded logs instead")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    collection = db[args.collection]
+    if args.delete:
+        logger.info(f"Deleted {collection.delete_many({'seeded': True}).deleted_count} seeded log(s)")
+    else:
+        seed_logs(args.count, collection, args.days, args.batch_size, args.rolled_up, args.seed)
@@ -0,0 +1,26 @@
+import sys
+import os
+
+import mongomock
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import database  # noqa: E402
+
+@pytest.fixture
+def mongo(monkeypatch):
+    # A fresh in-process MongoDB per test, created where the real client would be
+    mock = mongomock.MongoClient()
+    monkeypatch.setattr(database, "MongoClient", lambda uri, **kwargs: mock)
+    monkeypatch.setattr(database, "_client", None)
+    database._collections.clear()
+    yield mock[database.MONGODB_DB]
+    database._collections.clear()
+
+@pytest.fixture
+def client(mongo):
+    from app import app
+    app.config["TESTING"] = True
+    with app.test_client() as client:
+        yield client
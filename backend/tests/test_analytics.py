@@ -0,0 +1,32 @@
+import datetime
+
+from models import analytics
+
+def test_relabel_moves_a_counted_entry_to_its_sentiment(mongo):
+    entry = {"user_input": "hi", "intent": {"intent": "show_cart"}, "sentiment": None,
+             "created_at": datetime.datetime(2026, 1, 2, 3, 4, 5)}
+    assert analytics.record_interaction(entry)
+    assert analytics.sentiment_totals() == {"positive": 0, "negative": 0, "neutral": 1}
+
+    assert analytics.relabel_sentiment(entry, None, "POSITIVE")
+    assert analytics.sentiment_totals() == {"positive": 1, "negative": 0, "neutral": 0}
+    minute = analytics.sentiment_series("minute")
+    assert [(bucket["count"], bucket["positive"], bucket["neutral"]) for bucket in minute] == [(1, 1, 0)]
+    assert analytics.rollup_collection.find_one({"_id": "day:2026-01-02T00:00:00"})["sentiment"] == {
+        "NEUTRAL": 0, "POSITIVE": 1
+    }
+
+def test_relabel_many_adds_up_per_rollup_document(mongo):
+    at = datetime.datetime(2026, 1, 2, 3, 4, 5)
+    entries = [{"sentiment": label, "created_at": at} for label in ("NEGATIVE", "NEGATIVE", "POSITIVE")]
+    for entry in entries:
+        analytics.record_interaction(entry)
+
+    assert analytics.relabel_sentiments([
+        (entries[0], "NEGATIVE", "POSITIVE"),
+        (entries[1], "NEGATIVE", "NEUTRAL"),
+        (entries[2], "POSITIVE", "POSITIVE")
+    ])
+    assert analytics.sentiment_totals() == {"positive": 2, "negative": 0, "neutral": 1}
+    hour = analytics.sentiment_series("hour")
+    assert [(bucket["count"], bucket["positive"], bucket["negative"], bucket["neutral"]) for bucket in hour] == [(3, 2, 0, 1)]
@@ -0,0 +1,34 @@
+import atexit
+import time
+
+from pymongo.errors import ServerSelectionTimeoutError
+
+import app as app_module
+from models.interaction_log import InteractionLogWriter
+
+class Unreachable:
+    def insert_many(self, records, ordered=True):
+        raise ServerSelectionTimeoutError("no servers")
+
+def test_writer_counts_dropped_and_spilled_records(tmp_path):
+    writer = InteractionLogWriter(Unreachable(), maxsize=1, flush_interval_ms=60000, spill_dir=str(tmp_path))
+    atexit.unregister(writer.flush)  # MongoDB stays unreachable for this writer
+    assert writer.write({"user_input": "first"})
+    assert not writer.write({"user_input": "second"})
+    writer.flush()
+
+    stats = writer.stats()
+    assert (stats["enqueued"], stats["dropped"], stats["spilled"], stats["flush_failures"]) == (1, 1, 1, 1)
+    assert stats["queue_depth"] == 0
+
+def test_worker_writer_stats_reach_metrics(client):
+    start = time.perf_counter()
+    for pid, dropped in ((101, 2), (102, 3)):
+        app_module._worker_result({"transcript": "hi", "timings": {}, "untraced_timings": [],
+                                   "log_writer": {"pid": pid, "dropped": dropped, "spilled": 1}}, start)
+    # A later job from the same worker replaces its earlier stats
+    app_module._worker_result({"log_writer": {"pid": 101, "dropped": 4, "spilled": 1}}, start)
+
+    body = client.get("/api/metrics").get_data(as_text=True)
+    assert "interaction_log_dropped 7" in body
+    assert "interaction_log_spilled 2" in body
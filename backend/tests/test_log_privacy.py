@@ -0,0 +1,48 @@
+import datetime
+
+from bson import ObjectId
+
+PRIVATE = ("session_id", "rolled_up", "rollup_claim")
+
+def _seed(mongo):
+    mongo["logs"].insert_many([
+        {
+            "session_id": "victim",
+            "user_input": "add two milk",
+            "intent": {"intent": "add_to_cart", "product": "milk", "quantity": 2},
+            "response": "Added 2 milk to your cart.",
+            "sentiment": "POSITIVE",
+            "created_at": datetime.datetime.utcnow(),
+            "rolled_up": False,
+            "rollup_claim": ObjectId()
+        },
+        {
+            "session_id": "victim",
+            "user_input": "show my cart",
+            "intent": {"intent": "show_cart"},
+            "response": "Your cart is empty.",
+            "sentiment": "NEUTRAL",
+            "created_at": datetime.datetime.utcnow(),
+            "rolled_up": True
+        }
+    ])
+
+def test_logs_endpoint_hides_private_fields(client, mongo):
+    _seed(mongo)
+    response = client.get("/api/logs")
+    assert response.status_code == 200
+    logs = response.get_json()["logs"]
+    assert [log["user_input"] for log in logs] == ["show my cart", "add two milk"]
+    for log in logs:
+        assert not set(PRIVATE) & set(log)
+    assert b"victim" not in response.data
+
+def test_dashboard_hides_other_sessions(client, mongo):
+    _seed(mongo)
+    response = client.get("/api/dashboard")
+    assert response.status_code == 200
+    body = response.get_json()
+    assert len(body["logs"]) == 2
+    for log in body["logs"]:
+        assert not set(PRIVATE) & set(log)
+    assert b"victim" not in response.data
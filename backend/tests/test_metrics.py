@@ -0,0 +1,30 @@
+import app as app_module
+from models import cart
+
+def test_cart_cache_stats_reach_metrics(client, monkeypatch):
+    store = cart.CachedCartStore(cart.MongoCartStore())
+    monkeypatch.setattr(cart, "_store", store)
+    cart.add_to_cart("s", "milk", 2)
+    cart.show_cart("s")
+    cart.show_cart("s")
+
+    body = client.get("/api/metrics").get_data(as_text=True)
+    assert "cart_cache_writes 1" in body
+    assert "cart_cache_cached_carts 1" in body
+    stats = store.stats()
+    assert f"cart_cache_hits {stats['hits']}" in body and stats["hits"] >= 1
+
+def test_admission_stats_reach_metrics(client):
+    body = client.get("/api/metrics").get_data(as_text=True)
+    for name in ("admission_queue_depth", "admission_running", "admission_max_running",
+                 "admission_queue_size", "admission_avg_run_seconds"):
+        assert f"\n{name} " in body
+
+def test_health_reports_mongodb(client, monkeypatch):
+    assert client.get("/api/health").get_json() == {"status": "ok", "mongodb": "ok"}
+
+    def unreachable():
+        raise ConnectionError("no servers")
+
+    monkeypatch.setattr(app_module, "ping_database", unreachable)
+    assert client.get("/api/health").status_code == 503
@@ -0,0 +1,42 @@
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+import threading
+
+import pytest
+
+from models import pipeline
+from models.pipeline import PipelineEngine, StillRunning
+
+def _engine():
+    # Only _wait is exercised: no worker pool needed
+    engine = PipelineEngine.__new__(PipelineEngine)
+    engine._executor = None
+    engine._lock = threading.Lock()
+    return engine
+
+def test_timeout_cancels_a_job_no_worker_started():
+    future = Future()
+    with pytest.raises(FutureTimeout) as raised:
+        _engine()._wait(future, 0.01)
+    assert not isinstance(raised.value, StillRunning)
+    assert future.cancelled()
+
+def test_timeout_hands_back_a_job_a_worker_started():
+    future = Future()
+    future.set_running_or_notify_cancel()
+    with pytest.raises(StillRunning) as raised:
+        _engine()._wait(future, 0.01)
+    assert raised.value.future is future
+    assert not future.cancelled()
+
+def test_streamed_speech_runs_on_the_speech_workers(monkeypatch):
+    def speak(clause, leading_gap):
+        return (clause.encode(), 22050), {"tts": 0.01}
+
+    monkeypatch.setattr(pipeline, "_run_speech_job", speak)
+    engine = _engine()  # no pipeline pool: submitting to it would fail
+    engine._speech_executor = ThreadPoolExecutor(max_workers=2)
+    try:
+        speech = list(engine.stream_speech("Added 2 milk to your cart. Anything else today?"))
+    finally:
+        engine._speech_executor.shutdown()
+    assert [pcm for pcm, _ in speech] == [b"Added 2 milk to your cart.", b"Anything else today?"]
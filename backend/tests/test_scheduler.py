@@ -0,0 +1,32 @@
+from concurrent.futures import Future
+import time
+
+from models.scheduler import JobScheduler, RUNNING, QUEUED, DONE, FAILED
+
+def _until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+def test_job_keeps_its_slot_until_its_future_resolves():
+    futures = []
+
+    def run(job):
+        futures.append(Future())
+        return futures[-1]
+
+    scheduler = JobScheduler(run, max_running=1, queue_size=4, name="test")
+    first = scheduler.submit("s", None)
+    second = scheduler.submit("s", None)
+    assert _until(lambda: len(futures) == 1)
+    time.sleep(0.05)
+    assert first.status == RUNNING
+    assert second.status == QUEUED
+    assert len(futures) == 1
+
+    futures[0].set_result({"ok": 1})
+    assert first.wait(1) and first.status == DONE and first.result == {"ok": 1}
+    assert _until(lambda: len(futures) == 2)
+    futures[1].set_exception(RuntimeError("worker died"))
+    assert second.wait(1) and second.status == FAILED and second.error == "worker died"
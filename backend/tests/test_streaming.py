@@ -0,0 +1,87 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+import threading
+import time
+
+import numpy as np
+
+import app as app_module
+from models.pipeline import StillRunning
+from models.streaming import AudioStream
+
+class FakeEngine:
+    # Transcribes instantly; process_text counts the cart changes it would apply
+    def __init__(self):
+        self.processed = []
+        self._lock = threading.Lock()
+
+    def submit_transcription(self, samples, partial=False):
+        future = Future()
+        future.set_result("add two milk")
+        return future
+
+    def process_text(self, text, session_id, timeout=None, speak=True):
+        time.sleep(0.05)  # long enough for a racing request to arrive
+        with self._lock:
+            self.processed.append(text)
+        return {"transcript": text, "sentiment": None, "response": "Added 2 milk to your cart.", "audio": None}
+
+class LateEngine(FakeEngine):
+    # process_text times out after the worker started the job
+    def __init__(self, future):
+        super().__init__()
+        self.future = future
+
+    def process_text(self, text, session_id, timeout=None, speak=True):
+        raise StillRunning(self.future)
+
+def _speech(seconds=1.0, sample_rate=16000):
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    return (np.sin(2 * np.pi * 220 * t) * 0.5 * 32767).astype(np.int16).tobytes()
+
+def test_racing_end_requests_finish_the_stream_once(client, monkeypatch):
+    engine = FakeEngine()
+    monkeypatch.setattr(app_module, "get_engine", lambda: engine)
+    opened = client.post("/api/stream?sample_rate=16000").get_json()
+    cookie = {"session_id": opened["session_id"]}
+    url = f"/api/stream/{opened['stream_id']}"
+    assert client.post(url, data=_speech(), query_string=cookie).status_code == 200
+
+    def end(_):
+        with app_module.app.test_client() as racer:
+            return racer.post(f"{url}/end", query_string=cookie).status_code
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        statuses = sorted(pool.map(end, range(4)))
+    assert engine.processed == ["add two milk"]
+    assert statuses[0] == 200
+    assert all(status in (404, 409) for status in statuses[1:])
+
+def test_odd_chunk_boundaries_keep_every_sample():
+    values = np.arange(-500, 500, dtype="<i2")
+    data = values.tobytes()
+    stream = AudioStream("s", 16000, lambda samples, partial: None)
+    for start in range(0, len(data), 7):
+        stream.feed(data[start:start + 7])
+
+    assert np.array_equal(stream.audio(), values.astype(np.float32) / 32768)
+
+def test_stream_result_that_outlives_the_timeout_still_updates_the_cart(client, monkeypatch):
+    late = Future()
+    late.set_running_or_notify_cancel()
+    engine = LateEngine(late)
+    published = []
+    monkeypatch.setattr(app_module, "get_engine", lambda: engine)
+    monkeypatch.setattr(app_module, "_publish_cart", published.append)
+    opened = client.post("/api/stream?sample_rate=16000").get_json()
+    cookie = {"session_id": opened["session_id"]}
+    url = f"/api/stream/{opened['stream_id']}"
+    client.post(url, data=_speech(), query_string=cookie)
+
+    response = client.post(f"{url}/end", query_string=cookie)
+    assert response.status_code == 202
+    assert response.get_json()["pending"] is True
+    assert published == []
+
+    late.set_result({"transcript": "add two milk", "sentiment": None, "response": "Added 2 milk to your cart.",
+                     "audio": None, "timings": {"worker": 0.1}, "untraced_timings": []})
+    assert published == [opened["session_id"]]